@@ -22,7 +22,7 @@ class UpdateActivityLog:
 
     async def create(
         self,
-        target_id: int,
+        target_id: str,
         target_table: str = "None",
         activity_type: str = "",
         status: str = actlog_enums.UpdateStatus.PENDING.name,
@@ -52,48 +52,56 @@ class UpdateActivityLog:
     async def get_all(self, command: act_cmd.ActivityLogGetCommand):
         return await self.repository.get(command=command)
 
+    async def get_latest(self, command: act_cmd.ActivityLogGetCommand):
+        return await self.repository.get_latest(command=command)
+
     async def update(
         self,
-        id: int,
+        id: int | None = None,
         next_status: str | None = None,
         new_subinfo: dict | None = None,
         add_subinfo: dict | None = None,
         error_msg: str | None = None,
         add_error_msg: str | None = None,
+        target_id: str | None = None,
     ) -> m_actlog.ActivityLog:
-        db_actlog = await self.get(command=act_cmd.ActivityLogGetCommand(id=id))
+        if id is None and target_id is None:
+            raise ValueError("id or target_id is required")
+        db_actlog = await self.get(
+            command=act_cmd.ActivityLogGetCommand(id=id, target_id=target_id)
+        )
         if not db_actlog:
-            ValueError(f"{id} is not found in ActivityLog")
-        if next_status:
-            db_actlog.current_state = next_status
-        if new_subinfo is not None and isinstance(new_subinfo, dict):
-            db_actlog.meta = convert_datetime_to_str_in_dict(targets=new_subinfo)
-        if add_subinfo and isinstance(add_subinfo, dict):
-            db_actlog.meta = copy.deepcopy(
-                db_actlog.meta
-            ) | convert_datetime_to_str_in_dict(targets=add_subinfo)
-        if error_msg is not None:
-            db_actlog.error_msg = error_msg
-        if add_error_msg:
-            db_actlog.error_msg += add_error_msg
+            raise ValueError(f"{id or target_id} is not found in ActivityLog")
+        apply_update(
+            actlog=db_actlog,
+            next_status=next_status,
+            new_subinfo=new_subinfo,
+            add_subinfo=add_subinfo,
+            error_msg=error_msg,
+            add_error_msg=add_error_msg,
+        )
         await self.repository.save_all([db_actlog])
         await self.session.refresh(db_actlog)
         return db_actlog
 
-    async def in_progress(self, id: int):
+    async def in_progress(self, id: int | None = None, target_id: str | None = None):
         return await self.update(
-            id=id, next_status=actlog_enums.UpdateStatus.IN_PROGRESS.name
+            id=id,
+            target_id=target_id,
+            next_status=actlog_enums.UpdateStatus.IN_PROGRESS.name,
         )
 
     async def failed(
         self,
-        id: int,
+        id: int | None = None,
+        target_id: str | None = None,
         error_msg: str | None = None,
         add_subinfo: dict | None = None,
     ):
 
         return await self.update(
             id=id,
+            target_id=target_id,
             next_status=actlog_enums.UpdateStatus.FAILED.name,
             add_subinfo=add_subinfo,
             error_msg=error_msg,
@@ -101,12 +109,14 @@ class UpdateActivityLog:
 
     async def canceled(
         self,
-        id: int,
+        id: int | None = None,
+        target_id: str | None = None,
         error_msg: str | None = None,
         add_subinfo: dict | None = None,
     ):
         return await self.update(
             id=id,
+            target_id=target_id,
             next_status=actlog_enums.UpdateStatus.CANCELED.name,
             add_subinfo=add_subinfo,
             error_msg=error_msg,
@@ -114,28 +124,54 @@ class UpdateActivityLog:
 
     async def completed(
         self,
-        id: int,
+        id: int | None = None,
+        target_id: str | None = None,
         add_subinfo: dict | None = None,
     ):
         return await self.update(
             id=id,
+            target_id=target_id,
             next_status=actlog_enums.UpdateStatus.COMPLETED.name,
             add_subinfo=add_subinfo,
         )
 
     async def completed_with_error(
         self,
-        id: int,
+        id: int | None = None,
+        target_id: str | None = None,
         error_msg: str | None = None,
         add_subinfo: dict | None = None,
     ):
         return await self.update(
             id=id,
+            target_id=target_id,
             next_status=actlog_enums.UpdateStatus.COMPLETED_WITH_ERRORS.name,
             add_subinfo=add_subinfo,
             error_msg=error_msg,
         )
 
 
+def apply_update(
+    actlog: m_actlog.ActivityLog,
+    next_status: str | None = None,
+    new_subinfo: dict | None = None,
+    add_subinfo: dict | None = None,
+    error_msg: str | None = None,
+    add_error_msg: str | None = None,
+):
+    if next_status:
+        actlog.current_state = next_status
+    if new_subinfo is not None and isinstance(new_subinfo, dict):
+        actlog.meta = convert_datetime_to_str_in_dict(targets=new_subinfo)
+    if add_subinfo and isinstance(add_subinfo, dict):
+        actlog.meta = copy.deepcopy(actlog.meta) | convert_datetime_to_str_in_dict(
+            targets=add_subinfo
+        )
+    if error_msg is not None:
+        actlog.error_msg = error_msg
+    if add_error_msg:
+        actlog.error_msg += add_error_msg
+
+
 def convert_datetime_to_str_in_dict(targets: dict) -> dict:
     return InDictConverter.datetime_to_str(target=targets)
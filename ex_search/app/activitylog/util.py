@@ -11,14 +11,10 @@ async def get_activitylog_latest(
     ],
     target_table: str = "",
 ):
-    db_actlogs = await upactivitylog.get_all(
+    return await upactivitylog.get_latest(
         command=act_cmd.ActivityLogGetCommand(
             activity_types=activity_types,
             current_states=current_states,
             target_table=target_table,
         )
     )
-    if not db_actlogs:
-        return None
-    lastest_actlog = max(db_actlogs, key=lambda log: log.updated_at)
-    return lastest_actlog
@@ -0,0 +1,308 @@
+import asyncio
+from datetime import datetime, timezone
+
+import structlog
+from pydantic import BaseModel, Field
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+)
+
+from common.read_config import ActivityLogOptions, get_activitylog_options
+from databases.sql import util as db_util
+from databases.sql.activitylog import repository as a_repo
+from app.metrics import observe_stage
+from domain.models.activitylog import (
+    activitylog as m_actlog,
+    command as act_cmd,
+    enums as actlog_enums,
+)
+from .update import UpdateActivityLog, apply_update, convert_datetime_to_str_in_dict
+
+logger = structlog.get_logger(__name__)
+
+
+class ActivityLogCreateEvent(BaseModel):
+    values: dict
+
+
+class ActivityLogUpdateEvent(BaseModel):
+    target_id: str
+    next_status: str | None = None
+    new_subinfo: dict | None = None
+    add_subinfo: dict | None = None
+    error_msg: str | None = None
+    add_error_msg: str | None = None
+    occurred_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+ActivityLogEvent = ActivityLogCreateEvent | ActivityLogUpdateEvent
+
+
+class ActivityLogWriter:
+    """
+    ActivityLogの作成、更新をキューに溜め、バックグラウンドのタスクでまとめて書き込む。
+    キューが一杯の場合はputが空くまで待つ。
+    """
+
+    options: ActivityLogOptions
+    sessionmaker: async_sessionmaker[AsyncSession]
+
+    def __init__(
+        self,
+        options: ActivityLogOptions,
+        sessionmaker: async_sessionmaker[AsyncSession],
+    ):
+        self.options = options
+        self.sessionmaker = sessionmaker
+        self._queue: asyncio.Queue[ActivityLogEvent | None] | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.is_running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.options.max_queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def put(self, event: ActivityLogEvent):
+        if not self.is_running:
+            raise RuntimeError("ActivityLogWriter is not running")
+        if self._queue.full():
+            logger.warning(
+                "activitylog queue is full", max_queue_size=self.options.max_queue_size
+            )
+        await self._queue.put(event)
+
+    async def flush(self):
+        """キューに溜まっているイベントが書き込まれるまで待つ"""
+        if self._queue is not None and self.is_running:
+            await self._queue.join()
+
+    async def stop(self):
+        if not self.is_running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        is_stopped = False
+        while not is_stopped:
+            events = [await self._queue.get()]
+            deadline = loop.time() + self.options.flush_interval
+            while events[-1] is not None and len(events) < self.options.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    events.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except TimeoutError:
+                    break
+            if events[-1] is None:
+                # 停止時は残っているイベントを全て書き込む
+                is_stopped = True
+                while not self._queue.empty():
+                    events.append(self._queue.get_nowait())
+            batch = [event for event in events if event is not None]
+            for i in range(0, len(batch), self.options.batch_size):
+                await self._write_batch(batch[i : i + self.options.batch_size])
+            for _ in events:
+                self._queue.task_done()
+
+    async def _write_batch(self, batch: list[ActivityLogEvent]):
+        if not batch:
+            return
+        try:
+            with observe_stage("activitylog_write"):
+                await self.write(batch)
+        except Exception as e:
+            logger.exception(
+                "failed to write activitylog", count=len(batch), error=str(e)
+            )
+
+    async def write(self, events: list[ActivityLogEvent]):
+        """
+        イベントを1つのトランザクションで書き込む。
+        同じバッチ内で作成されたログへの更新は作成前に適用し、INSERTのみにする。
+        """
+        creates: dict[str, m_actlog.ActivityLog] = {}
+        updates: dict[str, list[ActivityLogUpdateEvent]] = {}
+        for event in events:
+            if isinstance(event, ActivityLogCreateEvent):
+                actlog = m_actlog.ActivityLog(**event.values)
+                creates[actlog.target_id] = actlog
+                continue
+            if event.target_id in creates:
+                actlog = creates[event.target_id]
+                _apply_event(actlog, event)
+                actlog.updated_at = event.occurred_at
+                continue
+            updates.setdefault(event.target_id, []).append(event)
+
+        async with self.sessionmaker() as ses:
+            ses.add_all(creates.values())
+            if updates:
+                stmt = select(m_actlog.ActivityLog).where(
+                    m_actlog.ActivityLog.target_id.in_(updates.keys())
+                )
+                res = await ses.execute(stmt)
+                for db_actlog in res.scalars():
+                    for event in updates.pop(db_actlog.target_id, []):
+                        _apply_event(db_actlog, event)
+                if updates:
+                    logger.warning(
+                        "activitylog to update is not found",
+                        target_ids=list(updates.keys()),
+                    )
+            await ses.commit()
+
+
+def _apply_event(actlog: m_actlog.ActivityLog, event: ActivityLogUpdateEvent):
+    apply_update(
+        actlog=actlog,
+        next_status=event.next_status,
+        new_subinfo=event.new_subinfo,
+        add_subinfo=event.add_subinfo,
+        error_msg=event.error_msg,
+        add_error_msg=event.add_error_msg,
+    )
+
+
+class BufferedActivityLog(UpdateActivityLog):
+    """
+    作成、更新をActivityLogWriterに渡すUpdateActivityLog。
+    書き込みを待たないため、更新はtarget_idで行い、戻り値のidはNoneになる。
+    読み込みは書き込み先と同じDBから行い、キューに残っている作成、更新は含まない。
+    """
+
+    writer: ActivityLogWriter
+
+    def __init__(self, ses: AsyncSession, writer: ActivityLogWriter):
+        super().__init__(ses=ses)
+        self.writer = writer
+
+    async def create(
+        self,
+        target_id: str,
+        target_table: str = "None",
+        activity_type: str = "",
+        status: str = actlog_enums.UpdateStatus.PENDING.name,
+        caller_type: str = "",
+        subinfo: dict = {},
+        error_msg: str = "",
+    ) -> m_actlog.ActivityLog | None:
+        activitylog = m_actlog.ActivityLog(
+            target_id=target_id,
+            target_table=target_table,
+            activity_type=activity_type,
+            current_state=status,
+            caller_type=caller_type,
+            meta=convert_datetime_to_str_in_dict(subinfo),
+            error_msg=error_msg,
+        )
+        await self.writer.put(
+            ActivityLogCreateEvent(values=activitylog.model_dump(exclude={"id"}))
+        )
+        return activitylog
+
+    async def update(
+        self,
+        id: int | None = None,
+        next_status: str | None = None,
+        new_subinfo: dict | None = None,
+        add_subinfo: dict | None = None,
+        error_msg: str | None = None,
+        add_error_msg: str | None = None,
+        target_id: str | None = None,
+    ) -> None:
+        if target_id is None:
+            raise ValueError("target_id is required")
+        await self.writer.put(
+            ActivityLogUpdateEvent(
+                target_id=target_id,
+                next_status=next_status,
+                new_subinfo=new_subinfo,
+                add_subinfo=add_subinfo,
+                error_msg=error_msg,
+                add_error_msg=add_error_msg,
+            )
+        )
+
+    async def get(self, command: act_cmd.ActivityLogGetCommand):
+        ret = await self.get_all(command=command)
+        if ret:
+            return ret[0]
+        return None
+
+    async def get_all(self, command: act_cmd.ActivityLogGetCommand):
+        async with self.writer.sessionmaker() as ses:
+            return await a_repo.ActivityLogRepository(ses=ses).get(command=command)
+
+    async def get_latest(self, command: act_cmd.ActivityLogGetCommand):
+        async with self.writer.sessionmaker() as ses:
+            return await a_repo.ActivityLogRepository(ses=ses).get_latest(
+                command=command
+            )
+
+
+async def create_activitylog_engine(options: ActivityLogOptions) -> AsyncEngine:
+    """ActivityLogを別のDBに書き込む場合のエンジンを作成し、テーブルを用意する"""
+    engine = db_util.create_async_db_engine(options.database)
+    table = m_actlog.ActivityLog.__table__
+
+    def create_table(conn):
+        table.create(conn, checkfirst=True)
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(create_table)
+    return engine
+
+
+_activitylog_writer: ActivityLogWriter | None = None
+_activitylog_engine: AsyncEngine | None = None
+
+
+def get_activitylog_writer() -> ActivityLogWriter | None:
+    return _activitylog_writer
+
+
+def get_update_activitylog(ses: AsyncSession) -> UpdateActivityLog:
+    writer = _activitylog_writer
+    if writer is not None and writer.is_running:
+        return BufferedActivityLog(ses=ses, writer=writer)
+    return UpdateActivityLog(ses=ses)
+
+
+async def init_activitylog_writer():
+    global _activitylog_writer, _activitylog_engine
+    options = get_activitylog_options()
+    if options.writer != "buffered" or _activitylog_writer is not None:
+        return
+    if options.database:
+        _activitylog_engine = await create_activitylog_engine(options)
+        sessionmaker = async_sessionmaker(
+            autocommit=False, autoflush=False, bind=_activitylog_engine
+        )
+    else:
+        sessionmaker = db_util.get_async_sessionmaker()
+    _activitylog_writer = ActivityLogWriter(options=options, sessionmaker=sessionmaker)
+    _activitylog_writer.start()
+
+
+async def shutdown_activitylog_writer():
+    global _activitylog_writer, _activitylog_engine
+    if _activitylog_writer is not None:
+        await _activitylog_writer.stop()
+        _activitylog_writer = None
+    if _activitylog_engine is not None:
+        await _activitylog_engine.dispose()
+        _activitylog_engine = None
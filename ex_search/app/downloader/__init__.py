@@ -1,4 +1,11 @@
 from .dl_with_selenium import download_remotely
 from .dl_with_httpx import async_get
+from .selenium_pool import async_download_remotely
+from .http_client import get_shared_transport
 
-__all__ = ["download_remotely", "async_get"]
+__all__ = [
+    "download_remotely",
+    "async_get",
+    "async_download_remotely",
+    "get_shared_transport",
+]
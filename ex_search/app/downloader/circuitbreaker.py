@@ -0,0 +1,405 @@
+import contextlib
+import time
+from abc import ABC, abstractmethod
+from typing import Callable
+
+import httpx
+import redis.asyncio as aredis
+import structlog
+
+from common import read_config
+from databases.redis.util import get_async_redis
+
+logger = structlog.get_logger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# openで待機時間が過ぎていれば1件だけ試行(half_open)を許す。
+# 許可する場合は"0"を、しない場合は再試行できるまでの秒数を返す
+ALLOW_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'state', 'opened_at', 'probe_until')
+if not state[1] or state[1] == 'closed' then
+    return '0'
+end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+if state[1] == 'open' then
+    local remaining = tonumber(state[2]) + tonumber(ARGV[1]) - now
+    if remaining > 0 then
+        return tostring(remaining)
+    end
+end
+local probe_until = tonumber(state[3]) or 0
+if probe_until > now then
+    return tostring(probe_until - now)
+end
+redis.call('HSET', KEYS[1], 'state', 'half_open', 'probe_until', tostring(now + tonumber(ARGV[2])))
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return '0'
+"""
+
+# allowと同じ判定で再試行できるまでの秒数を返すが、試行の枠は取らない
+PEEK_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'state', 'opened_at', 'probe_until')
+if not state[1] or state[1] == 'closed' then
+    return '0'
+end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local remaining = 0
+if state[1] == 'open' then
+    remaining = tonumber(state[2]) + tonumber(ARGV[1]) - now
+end
+remaining = math.max(remaining, (tonumber(state[3]) or 0) - now, 0)
+return tostring(remaining)
+"""
+
+# half_openの試行の枠を返す
+RELEASE_PROBE_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'state') == 'half_open' then
+    redis.call('HSET', KEYS[1], 'probe_until', '0')
+end
+return 0
+"""
+
+# ARGV[1]は"success"か"failure"。記録後の状態を返す
+RECORD_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'state', 'failures')
+local current = state[1] or 'closed'
+if ARGV[1] == 'success' then
+    if current ~= 'closed' or (tonumber(state[2]) or 0) > 0 then
+        redis.call('HSET', KEYS[1], 'state', 'closed', 'failures', 0, 'probe_until', '0')
+        redis.call('EXPIRE', KEYS[1], ARGV[3])
+    end
+    return 'closed'
+end
+local failures = redis.call('HINCRBY', KEYS[1], 'failures', 1)
+if current == 'half_open' or (current == 'closed' and failures >= tonumber(ARGV[2])) then
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+    redis.call('HSET', KEYS[1], 'state', 'open', 'opened_at', tostring(now), 'probe_until', '0')
+    current = 'open'
+elseif current == 'closed' then
+    redis.call('HSET', KEYS[1], 'state', 'closed')
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return current
+"""
+
+
+class CircuitOpenError(Exception):
+    name: str
+    retry_after: float
+
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"circuit open : {name}, retry after {retry_after:.1f}s")
+
+
+def is_backend_error(e: Exception) -> bool:
+    """接続できない、タイムアウト、5xxの場合は接続先の障害とみなす"""
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code >= 500
+    return isinstance(e, httpx.RequestError)
+
+
+def selenium_circuit_name(selenium_url: str) -> str:
+    return f"selenium:{selenium_url}"
+
+
+def nodriver_circuit_name(base_url: str) -> str:
+    return f"nodriver:{base_url}"
+
+
+def external_api_circuit_name(url: str) -> str:
+    return f"external_api:{url}"
+
+
+def domain_circuit_name(domain: str) -> str:
+    return f"domain:{domain}"
+
+
+class ICircuitBreaker(ABC):
+    """
+    接続先毎のサーキットブレーカー。
+    failure_threshold回続けて失敗するとcooldown_secondsの間は即座に失敗させ、
+    その後は1件だけ試行して成功すれば元に戻す。
+    """
+
+    @abstractmethod
+    async def allow(self, name: str) -> float:
+        """実行できる場合は0を、できない場合は再試行できるまでの秒数を返す"""
+        pass
+
+    @abstractmethod
+    async def peek(self, name: str) -> float:
+        """allowと同じ値を返すが、half_openの試行の枠は取らない"""
+        pass
+
+    @abstractmethod
+    async def release_probe(self, name: str):
+        """試行せずに終わった場合に、allowで取ったhalf_openの試行の枠を返す"""
+        pass
+
+    @abstractmethod
+    async def record_success(self, name: str):
+        pass
+
+    @abstractmethod
+    async def record_failure(self, name: str):
+        pass
+
+    @abstractmethod
+    async def get_states(self) -> dict[str, dict]:
+        """記録がある接続先の状態と連続失敗数を返す"""
+        pass
+
+    async def check(self, name: str):
+        retry_after = await self.allow(name)
+        if retry_after > 0:
+            raise CircuitOpenError(name=name, retry_after=retry_after)
+
+    @contextlib.asynccontextmanager
+    async def guard(
+        self, name: str, is_failure: Callable[[Exception], bool] | None = None
+    ):
+        """
+        openの場合はCircuitOpenErrorを送出する。
+        is_failureがFalseを返す例外は接続先が応答したものとして成功扱いにする
+        """
+        await self.check(name)
+        try:
+            yield
+        except Exception as e:
+            if is_failure is None or is_failure(e):
+                await self.record_failure(name)
+            else:
+                await self.record_success(name)
+            raise
+        except BaseException:
+            # キャンセル等で結果が分からない
+            await self.release_probe(name)
+            raise
+        await self.record_success(name)
+
+
+class NullCircuitBreaker(ICircuitBreaker):
+    """無効にした場合に使う"""
+
+    async def allow(self, name: str) -> float:
+        return 0
+
+    async def peek(self, name: str) -> float:
+        return 0
+
+    async def release_probe(self, name: str):
+        pass
+
+    async def record_success(self, name: str):
+        pass
+
+    async def record_failure(self, name: str):
+        pass
+
+    async def get_states(self) -> dict[str, dict]:
+        return {}
+
+
+class _LocalCircuit:
+    state: str
+    failures: int
+    opened_at: float
+    probe_until: float
+
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.probe_until = 0
+
+
+class LocalCircuitBreaker(ICircuitBreaker):
+    """単一ワーカー向け。RedisCircuitBreakerのスクリプトと同じ判定をプロセス内で行う"""
+
+    def __init__(
+        self, failure_threshold: int, cooldown_seconds: float, probe_timeout: float
+    ):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.probe_timeout = probe_timeout
+        self._circuits: dict[str, _LocalCircuit] = {}
+
+    async def allow(self, name: str) -> float:
+        circuit = self._circuits.get(name)
+        if circuit is None or circuit.state == CLOSED:
+            return 0
+        now = time.monotonic()
+        if circuit.state == OPEN:
+            remaining = circuit.opened_at + self.cooldown_seconds - now
+            if remaining > 0:
+                return remaining
+        if circuit.probe_until > now:
+            return circuit.probe_until - now
+        circuit.state = HALF_OPEN
+        circuit.probe_until = now + self.probe_timeout
+        return 0
+
+    async def peek(self, name: str) -> float:
+        circuit = self._circuits.get(name)
+        if circuit is None or circuit.state == CLOSED:
+            return 0
+        now = time.monotonic()
+        remaining = 0
+        if circuit.state == OPEN:
+            remaining = circuit.opened_at + self.cooldown_seconds - now
+        return max(remaining, circuit.probe_until - now, 0)
+
+    async def release_probe(self, name: str):
+        circuit = self._circuits.get(name)
+        if circuit is not None and circuit.state == HALF_OPEN:
+            circuit.probe_until = 0
+
+    async def record_success(self, name: str):
+        circuit = self._circuits.get(name)
+        if circuit is None:
+            return
+        if circuit.state != CLOSED:
+            logger.info("circuit closed", name=name)
+        circuit.state = CLOSED
+        circuit.failures = 0
+        circuit.probe_until = 0
+
+    async def record_failure(self, name: str):
+        circuit = self._circuits.setdefault(name, _LocalCircuit())
+        circuit.failures += 1
+        if circuit.state == HALF_OPEN or (
+            circuit.state == CLOSED and circuit.failures >= self.failure_threshold
+        ):
+            circuit.state = OPEN
+            circuit.opened_at = time.monotonic()
+            circuit.probe_until = 0
+            logger.warning("circuit opened", name=name, failures=circuit.failures)
+
+    async def get_states(self) -> dict[str, dict]:
+        return {
+            name: {"state": circuit.state, "failures": circuit.failures}
+            for name, circuit in self._circuits.items()
+        }
+
+
+class RedisCircuitBreaker(ICircuitBreaker):
+    """複数ワーカー向け。状態をRedisのハッシュに置き、Luaスクリプトで更新する"""
+
+    HEADER = "circuit:"
+    SCAN_COUNT = 500
+    r: aredis.Redis
+
+    def __init__(
+        self,
+        r: aredis.Redis,
+        failure_threshold: int,
+        cooldown_seconds: float,
+        probe_timeout: float,
+        state_seconds: int,
+    ):
+        self.r = r
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.probe_timeout = probe_timeout
+        self.state_seconds = state_seconds
+        self._allow_script = self.r.register_script(ALLOW_SCRIPT)
+        self._record_script = self.r.register_script(RECORD_SCRIPT)
+        self._peek_script = self.r.register_script(PEEK_SCRIPT)
+        self._release_probe_script = self.r.register_script(RELEASE_PROBE_SCRIPT)
+
+    async def allow(self, name: str) -> float:
+        retry_after = await self._allow_script(
+            keys=[self._create_key(name)],
+            args=[self.cooldown_seconds, self.probe_timeout, self.state_seconds],
+        )
+        return float(retry_after)
+
+    async def peek(self, name: str) -> float:
+        retry_after = await self._peek_script(
+            keys=[self._create_key(name)], args=[self.cooldown_seconds]
+        )
+        return float(retry_after)
+
+    async def release_probe(self, name: str):
+        await self._release_probe_script(keys=[self._create_key(name)])
+
+    async def record_success(self, name: str):
+        await self._record(name, "success")
+
+    async def record_failure(self, name: str):
+        state = await self._record(name, "failure")
+        if state == OPEN:
+            logger.warning("circuit opened", name=name)
+
+    async def _record(self, name: str, result: str) -> str:
+        state = await self._record_script(
+            keys=[self._create_key(name)],
+            args=[result, self.failure_threshold, self.state_seconds],
+        )
+        if isinstance(state, bytes):
+            return state.decode("utf-8")
+        return state
+
+    async def get_states(self) -> dict[str, dict]:
+        states = {}
+        async for key in self.r.scan_iter(
+            match=f"{self.HEADER}*", count=self.SCAN_COUNT
+        ):
+            if isinstance(key, bytes):
+                key = key.decode("utf-8")
+            data = await self.r.hmget(key, "state", "failures")
+            if not data[0]:
+                continue
+            states[key.removeprefix(self.HEADER)] = {
+                "state": data[0].decode("utf-8"),
+                "failures": int(data[1] or 0),
+            }
+        return states
+
+    def _create_key(self, name: str) -> str:
+        return f"{self.HEADER}{name}"
+
+
+_circuit_breaker: ICircuitBreaker | None = None
+
+
+def get_circuit_breaker() -> ICircuitBreaker:
+    global _circuit_breaker
+    if _circuit_breaker is not None:
+        return _circuit_breaker
+    breakeropts = read_config.get_circuit_breaker_options()
+    params = {
+        "failure_threshold": breakeropts.failure_threshold,
+        "cooldown_seconds": breakeropts.cooldown_seconds,
+        "probe_timeout": breakeropts.probe_timeout,
+    }
+    if not breakeropts.enabled:
+        _circuit_breaker = NullCircuitBreaker()
+    else:
+        match breakeropts.backend:
+            case "redis":
+                _circuit_breaker = RedisCircuitBreaker(
+                    r=get_async_redis(),
+                    state_seconds=breakeropts.state_seconds,
+                    **params,
+                )
+            case _:
+                _circuit_breaker = LocalCircuitBreaker(**params)
+    logger.debug("circuit breaker created", backend=breakeropts.backend)
+    return _circuit_breaker
+
+
+def _reset_circuit_breaker():
+    global _circuit_breaker
+    _circuit_breaker = None
+
+
+read_config.add_reload_listener(_reset_circuit_breaker)
@@ -8,6 +8,7 @@ import structlog
 import httpx
 
 from common.read_config import get_cookie_dir_path
+from .http_client import get_shared_transport
 
 
 class CookieManager:
@@ -113,7 +114,9 @@ async def async_get(
         }
         default_params["headers"] = headers
 
-    async with httpx.AsyncClient(follow_redirects=True) as client:
+    async with httpx.AsyncClient(
+        follow_redirects=True, transport=get_shared_transport(url)
+    ) as client:
         if cookie_load:
             await cookie_manager.load_cookies(client, add_cookies=cookie_dict_list)
         for attempt in range(max_retries + 1):
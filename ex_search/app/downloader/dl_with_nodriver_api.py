@@ -6,6 +6,12 @@ from pydantic import BaseModel
 
 from domain.schemas.search import search as schema
 from common.read_config import get_nodriver_options
+from .http_client import get_shared_transport
+from .circuitbreaker import (
+    get_circuit_breaker,
+    is_backend_error,
+    nodriver_circuit_name,
+)
 
 
 class DownloadResponse(BaseModel):
@@ -27,7 +33,15 @@ async def get_from_nodriver_api(
     data = {
         "url": url,
     } | nodriver_options.model_dump(mode="json", exclude_unset=True)
-    async with httpx.AsyncClient(follow_redirects=True) as client:
+    async with (
+        get_circuit_breaker().guard(
+            nodriver_circuit_name(nodriver_config.base_url),
+            is_failure=is_backend_error,
+        ),
+        httpx.AsyncClient(
+            follow_redirects=True, transport=get_shared_transport(api_url)
+        ) as client,
+    ):
         for attempt in range(max_retries + 1):
             try:
                 res = await client.post(api_url, timeout=timeout, json=data)
@@ -61,6 +61,7 @@ def download_with_selenium(
     page_wait_time: float = 0,
     cookie_save: bool = False,
     cookie_load: bool = False,
+    quit_driver: bool = True,
 ) -> str:
     driver.set_page_load_timeout(page_load_timeout)
     driver.get(url)
@@ -92,7 +93,8 @@ def download_with_selenium(
     except Exception as e:
         raise e
     finally:
-        driver.quit()
+        if quit_driver:
+            driver.quit()
     return html
 
 
@@ -0,0 +1,90 @@
+from urllib.parse import urlparse
+
+import httpx
+import structlog
+
+from common.read_config import get_http_client_options, HTTPClientOptions
+
+logger = structlog.get_logger(__name__)
+
+
+class SharedTransport(httpx.AsyncBaseTransport):
+    """
+    接続プールを共有するためのtransport。
+    リクエスト毎のAsyncClientを閉じてもプール自体は閉じない。
+    Cookieやheaderはリクエスト毎のAsyncClient側で保持されるため互いに混ざらない。
+    """
+
+    def __init__(self, transport: httpx.AsyncHTTPTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self):
+        pass
+
+    async def close_pool(self):
+        await self._transport.aclose()
+
+
+class HTTPTransportRegistry:
+    """アプリケーション全体で共有するhost毎の接続プール"""
+
+    options: HTTPClientOptions
+
+    def __init__(self, options: HTTPClientOptions):
+        self.options = options
+        self._transports: dict[str, SharedTransport] = {}
+
+    def get_transport(self, url: str) -> SharedTransport:
+        parsed_url = urlparse(url)
+        host_key = f"{parsed_url.scheme}://{parsed_url.netloc}"
+        if host_key not in self._transports:
+            self._transports[host_key] = SharedTransport(self._create_transport())
+        return self._transports[host_key]
+
+    async def aclose(self):
+        transports = list(self._transports.values())
+        self._transports.clear()
+        for transport in transports:
+            await transport.close_pool()
+
+    def _create_transport(self) -> httpx.AsyncHTTPTransport:
+        opts = self.options
+        limits = httpx.Limits(
+            max_connections=opts.max_connections_per_host,
+            max_keepalive_connections=opts.max_keepalive_connections_per_host,
+            keepalive_expiry=opts.keepalive_expiry,
+        )
+        http2 = opts.http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("h2 is not installed, http2 is disabled")
+                http2 = False
+        return httpx.AsyncHTTPTransport(limits=limits, http2=http2)
+
+
+_registry: HTTPTransportRegistry | None = None
+
+
+def init_http_transports():
+    global _registry
+    if _registry is None:
+        _registry = HTTPTransportRegistry(options=get_http_client_options())
+    return _registry
+
+
+async def close_http_transports():
+    global _registry
+    if _registry is None:
+        return
+    registry = _registry
+    _registry = None
+    await registry.aclose()
+
+
+def get_shared_transport(url: str) -> SharedTransport:
+    return init_http_transports().get_transport(url)
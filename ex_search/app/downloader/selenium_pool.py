@@ -0,0 +1,241 @@
+import asyncio
+import functools
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from selenium import webdriver
+import structlog
+
+from .constants import PAGE_LOAD_TIMEOUT, TAG_WAIT_TIMEOUT
+from .dl_with_selenium import download_with_selenium
+from .circuitbreaker import get_circuit_breaker, selenium_circuit_name
+from common.read_config import get_selenium_options
+
+logger = structlog.get_logger(__name__)
+
+BLANK_PAGE = "about:blank"
+# Web Storageは表示中のページのオリジンにしか触れないため、about:blankへ移る前に消す
+CLEAR_STORAGE_SCRIPT = "localStorage.clear();sessionStorage.clear();"
+
+
+class SeleniumSessionError(Exception):
+    """seleniumのセッションを作れない。サイトではなくselenium側の障害"""
+
+    pass
+
+
+class PooledSession:
+    driver: webdriver.Remote
+    uses: int
+
+    def __init__(self, driver: webdriver.Remote):
+        self.driver = driver
+        self.uses = 0
+
+
+class SeleniumSessionPool:
+    """
+    remote WebDriverのセッションを使い回すためのプール。
+    同時に貸し出すセッション数をmax_sessionsで制限し、max_uses_per_session回使ったセッションは作り直す。
+    """
+
+    selenium_url: str
+    max_sessions: int
+    max_uses_per_session: int
+
+    def __init__(
+        self, selenium_url: str, max_sessions: int = 2, max_uses_per_session: int = 20
+    ):
+        self.selenium_url = selenium_url
+        self.max_sessions = max_sessions
+        self.max_uses_per_session = max_uses_per_session
+        self._idle: queue.LifoQueue[PooledSession] = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_sessions)
+        self._closed = False
+        self.logger = structlog.get_logger(self.__class__.__name__)
+
+    def acquire(self) -> PooledSession:
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    session = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._create_session()
+                if self._is_healthy(session):
+                    return session
+                self._quit(session)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, session: PooledSession, discard: bool = False):
+        try:
+            session.uses += 1
+            if self._closed or discard or session.uses >= self.max_uses_per_session:
+                self._quit(session)
+                return
+            if not self._reset(session):
+                self._quit(session)
+                return
+            self._idle.put(session)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._quit(session)
+
+    def _create_session(self) -> PooledSession:
+        try:
+            driver = webdriver.Remote(
+                command_executor=self.selenium_url,
+                options=webdriver.ChromeOptions(),
+            )
+        except Exception as e:
+            raise SeleniumSessionError(str(e)) from e
+        return PooledSession(driver=driver)
+
+    def _is_healthy(self, session: PooledSession) -> bool:
+        try:
+            session.driver.current_url
+            return True
+        except Exception as e:
+            self.logger.info("discard unhealthy selenium session", error=str(e))
+            return False
+
+    def _reset(self, session: PooledSession) -> bool:
+        # 次の利用者に前回のCookieやWeb Storage、ページ状態を引き継がない
+        try:
+            if session.driver.current_url != BLANK_PAGE:
+                session.driver.execute_script(CLEAR_STORAGE_SCRIPT)
+            session.driver.delete_all_cookies()
+            session.driver.get(BLANK_PAGE)
+            return True
+        except Exception as e:
+            self.logger.info("failed to reset selenium session", error=str(e))
+            return False
+
+    def _quit(self, session: PooledSession):
+        try:
+            session.driver.quit()
+        except Exception:
+            pass
+
+
+class SeleniumDownloadService:
+    """seleniumによるダウンロードを専用スレッドで実行し、イベントループを塞がないようにする"""
+
+    max_sessions: int
+    max_uses_per_session: int
+
+    def __init__(self, max_sessions: int = 2, max_uses_per_session: int = 20):
+        self.max_sessions = max_sessions
+        self.max_uses_per_session = max_uses_per_session
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_sessions, thread_name_prefix="selenium"
+        )
+        self._pools: dict[str, SeleniumSessionPool] = {}
+        self._pools_lock = threading.Lock()
+
+    async def download(
+        self,
+        url: str,
+        page_load_timeout: int = PAGE_LOAD_TIMEOUT,
+        tag_wait_timeout: int = TAG_WAIT_TIMEOUT,
+        selenium_url: str = "http://selenium:4444/wd/hub",
+        cookie_dict_list: list[dict] = [],
+        wait_css_selector: str = "",
+        page_wait_time: float = 0,
+        cookie_save: bool = False,
+        cookie_load: bool = False,
+    ) -> str:
+        loop = asyncio.get_running_loop()
+        async with get_circuit_breaker().guard(
+            selenium_circuit_name(selenium_url),
+            is_failure=lambda e: isinstance(e, SeleniumSessionError),
+        ):
+            return await loop.run_in_executor(
+                self._executor,
+                functools.partial(
+                    self._download_sync,
+                    url=url,
+                    page_load_timeout=page_load_timeout,
+                    tag_wait_timeout=tag_wait_timeout,
+                    selenium_url=selenium_url,
+                    cookie_dict_list=cookie_dict_list,
+                    wait_css_selector=wait_css_selector,
+                    page_wait_time=page_wait_time,
+                    cookie_save=cookie_save,
+                    cookie_load=cookie_load,
+                ),
+            )
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._pools_lock:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools.clear()
+
+    def _get_pool(self, selenium_url: str) -> SeleniumSessionPool:
+        with self._pools_lock:
+            if selenium_url not in self._pools:
+                self._pools[selenium_url] = SeleniumSessionPool(
+                    selenium_url=selenium_url,
+                    max_sessions=self.max_sessions,
+                    max_uses_per_session=self.max_uses_per_session,
+                )
+            return self._pools[selenium_url]
+
+    def _download_sync(self, url: str, selenium_url: str, **kwargs) -> str:
+        pool = self._get_pool(selenium_url)
+        session = pool.acquire()
+        # Cookieを読み書きしたセッションはプロファイルの状態が残るため再利用しない
+        discard = bool(
+            kwargs.get("cookie_dict_list")
+            or kwargs.get("cookie_load")
+            or kwargs.get("cookie_save")
+        )
+        try:
+            return download_with_selenium(
+                url=url, driver=session.driver, quit_driver=False, **kwargs
+            )
+        except Exception:
+            # タイムアウト等の後はセッションの状態が不明なため再利用しない
+            discard = True
+            raise
+        finally:
+            pool.release(session, discard=discard)
+
+
+_selenium_service: SeleniumDownloadService | None = None
+
+
+def get_selenium_service() -> SeleniumDownloadService:
+    global _selenium_service
+    if _selenium_service is None:
+        seleniumopts = get_selenium_options()
+        _selenium_service = SeleniumDownloadService(
+            max_sessions=seleniumopts.max_sessions,
+            max_uses_per_session=seleniumopts.max_uses_per_session,
+        )
+    return _selenium_service
+
+
+def shutdown_selenium_service():
+    global _selenium_service
+    if _selenium_service is None:
+        return
+    _selenium_service.shutdown()
+    _selenium_service = None
+
+
+async def async_download_remotely(**kwargs) -> str:
+    return await get_selenium_service().download(**kwargs)
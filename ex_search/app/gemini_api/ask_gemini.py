@@ -1,19 +1,13 @@
 import json
 import re
 import pathlib
-import inspect
 import ast
-import os
-import multiprocessing
 import asyncio
-import traceback
-import importlib
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from google import genai
 from google.genai import types, errors
 import structlog
-from bs4 import BeautifulSoup
 
 
 from .models import (
@@ -23,15 +17,16 @@ from .models import (
     HTMLConfigSearchResult,
 )
 from .parserlog import UpdateCodeValidationErrorsLog, UpdateParserLog
-from domain.models.ai import repository as a_repo
+from .html_util import html_to_minimal_dict
+from .sandbox import get_sandbox_pool
+from .parser_registry import get_parser_registry
+from domain.models.ai import repository as a_repo, ailog as m_ailog
 from common.read_config import get_model_escalation_list
+from app.parse_executor import run_parse
+from app.metrics import count_gemini_model, observe_stage
 
 logger = structlog.get_logger(__name__)
 
-MODEL_ESCALATION_LIST = get_model_escalation_list()
-
-
-CLASS_NAME_PATTERN = re.compile(r"class\s+([A-Za-z_][A-Za-z0-9_]*)\s*[:(]")
 IMPORT_PATTERN = re.compile(r"(?:from\s+(\S+)\s+import\s+(\S+))|(?:import\s+(\S+))")
 CURRENT_PATH = pathlib.Path(__file__).resolve().parent
 
@@ -128,124 +123,35 @@ def is_safe_code(code: str) -> tuple[bool, str | None]:
     return True, None
 
 
-def _sandbox_worker(code: str, html_str: str, queue: multiprocessing.Queue):
-    try:
-        # Enforce memory and CPU limits
-        try:
-            import resource
-
-            mem_limit = 512 * 1024 * 1024
-            resource.setrlimit(resource.RLIMIT_AS, (mem_limit, mem_limit))
-            resource.setrlimit(resource.RLIMIT_CPU, (10, 10))
-        except (ImportError, ValueError, OSError):
-            pass
-
-        # Drop privileges
-        try:
-            if os.name == "posix" and os.getuid() == 0:
-                import pwd
-
-                nobody = pwd.getpwnam("nobody")
-                nobody_uid = nobody.pw_uid
-                nobody_gid = nobody.pw_gid
-
-                os.setgroups([])
-                os.setgid(nobody_gid)
-                os.setuid(nobody_uid)
-                os.environ["USER"] = "nobody"
-                os.environ["HOME"] = "/nonexistent"
-        except Exception:
-            pass
-
-        allowed_imports = [
-            "bs4",
-            "lxml",
-            "re",
-            "json",
-            "datetime",
-            "typing",
-            "collections",
-            "math",
-            "urllib",
-        ]
-        sandbox_globals = {
-            "__builtins__": __builtins__,
-        }
-
-        for mod_name in allowed_imports:
-            try:
-                sandbox_globals[mod_name] = importlib.import_module(mod_name)
-            except ImportError:
-                pass
-
-        exec(code, sandbox_globals)
-
-        # Detect the parser class
-        class_name = None
-        cnames = CLASS_NAME_PATTERN.findall(code)
-        if cnames:
-            class_name = cnames[0]
-
-        if not class_name:
-            # Fallback scan
-            for k, v in sandbox_globals.items():
-                if inspect.isclass(v) and v.__module__ == "__main__":
-                    class_name = k
-                    break
-
-        if not class_name or class_name not in sandbox_globals:
-            raise ValueError("No parser class found in the generated code.")
-
-        parser_cls = sandbox_globals[class_name]
-        parser_instance = parser_cls(html_str)
-        parsed_result = parser_instance.execute()
-
-        queue.put({"success": True, "data": parsed_result})
-    except Exception as e:
-        queue.put(
-            {
-                "success": False,
-                "error_type": type(e).__name__,
-                "error": str(e),
-                "traceback": traceback.format_exc(),
-            }
+def run_in_sandbox_sync(
+    code: str,
+    html_str: str,
+    timeout: float,
+    code_hash: str | None = None,
+    bytecode: bytes | None = None,
+) -> list:
+    return get_sandbox_pool().run(
+        code=code,
+        html_str=html_str,
+        timeout=timeout,
+        code_hash=code_hash,
+        bytecode=bytecode,
+    )
+
+
+async def run_in_sandbox_async(
+    code: str,
+    html_str: str,
+    timeout: float = 5.0,
+    code_hash: str | None = None,
+    bytecode: bytes | None = None,
+) -> list:
+    with observe_stage("sandbox", sitename="gemini"):
+        return await asyncio.to_thread(
+            run_in_sandbox_sync, code, html_str, timeout, code_hash, bytecode
         )
 
 
-def run_in_sandbox_sync(code: str, html_str: str, timeout: float) -> list:
-    ctx = multiprocessing.get_context("spawn")
-    q = ctx.Queue()
-    p = ctx.Process(target=_sandbox_worker, args=(code, html_str, q))
-    p.start()
-
-    p.join(timeout=timeout)
-
-    if p.is_alive():
-        p.terminate()
-        p.join()
-        raise TimeoutError(
-            f"Code execution exceeded the timeout limit of {timeout} seconds."
-        )
-
-    if not q.empty():
-        result = q.get()
-        if result["success"]:
-            return result["data"]
-        else:
-            error_msg = result.get("error", "Unknown error inside sandbox.")
-            error_type = result.get("error_type", "RuntimeError")
-            raise RuntimeError(f"[{error_type}] {error_msg}")
-    else:
-        exitcode = p.exitcode
-        raise RuntimeError(
-            f"Sandbox process terminated abnormally with exit code {exitcode}."
-        )
-
-
-async def run_in_sandbox_async(code: str, html_str: str, timeout: float = 5.0) -> list:
-    return await asyncio.to_thread(run_in_sandbox_sync, code, html_str, timeout)
-
-
 class NoModelsAvailableError(Exception):
     pass
 
@@ -293,6 +199,7 @@ class ParserGeneratorForJSON:
             first_prompt_fpath=str(CURRENT_PATH / "create_parser_json.prompt")
         ),
         recreate: bool = False,
+        activeparser_repository: a_repo.IActiveParserRepository | None = None,
     ):
         self.html_str = html_str
         self.label = label
@@ -300,14 +207,19 @@ class ParserGeneratorForJSON:
         self.update_errorcodelog = UpdateCodeValidationErrorsLog(
             session, errorcodelog_repository
         )
+        self.activeparser_repository = activeparser_repository
         self.target_url = url
         self.prompt = prompt
         self.recreate = recreate
+        self._saved_log = None
+        self._active_parser = None
 
     async def execute(self) -> AskGeminiResult:
         subinfo = {}
 
         if self.recreate:
+            get_parser_registry().invalidate(self.label)
+            await self._deactivate_parser()
             code_str = None
             subinfo["recreate"] = True
         else:
@@ -324,6 +236,11 @@ class ParserGeneratorForJSON:
                 response=result_dict, error_info=None, subinfo=subinfo
             )
             code_str = self._extract_parser_code(result_dict)
+        elif self._active_parser is not None:
+            # ログはエラーを記録する時にだけ読み込む
+            log = None
+        elif self._saved_log is not None:
+            log = self._saved_log
         else:
             log = await self.update_parserlog.get_log(
                 label=self.label, target_url=self.target_url, is_error=False
@@ -341,15 +258,18 @@ class ParserGeneratorForJSON:
             return AskGeminiResult(error_info=error_info)
 
         # AST validation
-        is_safe, error_msg = is_safe_code(code_str)
-        if not is_safe:
+        entry = get_parser_registry().register(
+            label=self.label, code=code_str, validator=is_safe_code
+        )
+        if not entry.is_safe:
+            error_msg = entry.error_msg
             error_info = AskGeminiErrorInfo(
                 error_type="SecurityError", error=f"Unsafe code block: {error_msg}"
             )
             if subinfo.get("ai_model_version"):
                 error_info.ai_model_version = subinfo["ai_model_version"]
-            await self.update_parserlog.update_log(
-                log_entry=log, error_info=error_info, add_subinfo=subinfo
+            await self._update_log_with_error(
+                log=log, error_info=error_info, subinfo=subinfo
             )
             await self.update_errorcodelog.save_log(
                 label=self.label,
@@ -360,8 +280,18 @@ class ParserGeneratorForJSON:
             )
             return AskGeminiResult(error_info=error_info)
 
+        if log is not None and self._active_parser is None:
+            await self._activate_parser(
+                log_id=log.id, code_hash=entry.code_hash, code=code_str
+            )
+
         try:
-            parsed_result = await run_in_sandbox_async(code_str, self.html_str)
+            parsed_result = await run_in_sandbox_async(
+                code_str,
+                self.html_str,
+                code_hash=entry.code_hash,
+                bytecode=entry.bytecode,
+            )
             if not isinstance(parsed_result, list):
                 raise ValueError(
                     f"parsed_result is not list, type:{type(parsed_result).__name__}, value:{parsed_result}"
@@ -372,19 +302,70 @@ class ParserGeneratorForJSON:
             error_info = AskGeminiErrorInfo(error_type=type(e).__name__, error=str(e))
             if subinfo.get("ai_model_version"):
                 error_info.ai_model_version = subinfo["ai_model_version"]
-            await self.update_parserlog.update_log(
-                log_entry=log, error_info=error_info, add_subinfo=subinfo
+            await self._update_log_with_error(
+                log=log, error_info=error_info, subinfo=subinfo
             )
             return AskGeminiResult(error_info=error_info)
 
+    async def _update_log_with_error(
+        self,
+        log: m_ailog.ParserGenerationLog | None,
+        error_info: AskGeminiErrorInfo,
+        subinfo: dict,
+    ):
+        if log is None:
+            log = await self.update_parserlog.get_log(id=self._active_parser.log_id)
+        if log is None:
+            await self._deactivate_parser(log_id=self._active_parser.log_id)
+            return
+        await self.update_parserlog.update_log(
+            log_entry=log, error_info=error_info, add_subinfo=subinfo
+        )
+        # エラーになったパーサーは使わない
+        await self._deactivate_parser(log_id=log.id)
+
+    async def _activate_parser(self, log_id: int, code_hash: str, code: str):
+        if self.activeparser_repository is None or not self.label:
+            return
+        await self.activeparser_repository.save(
+            m_ailog.ActiveParser(
+                label=self.label, log_id=log_id, code=code, code_hash=code_hash
+            )
+        )
+
+    async def _deactivate_parser(self, log_id: int | None = None):
+        if self.activeparser_repository is None or not self.label:
+            return
+        await self.activeparser_repository.delete(label=self.label, log_id=log_id)
+
     async def _get_saved_parser_code(self) -> str | None:
+        if self.activeparser_repository is not None and self.label:
+            active_parser = await self.activeparser_repository.get(label=self.label)
+            if active_parser is not None:
+                self._active_parser = active_parser
+                return active_parser.code
+
         latest_log = await self.update_parserlog.get_log(
             label=self.label, target_url=self.target_url, is_error=False
         )
+        self._saved_log = latest_log
         if not latest_log:
             return None
 
-        return self._extract_parser_code(latest_log.response)
+        # 同じログからは抽出済みのコードを使う
+        registry = get_parser_registry()
+        entry = registry.get_by_log(label=self.label, log_id=latest_log.id)
+        if entry is not None:
+            return entry.code
+        code_str = self._extract_parser_code(latest_log.response)
+        if code_str is not None:
+            registry.register(
+                label=self.label,
+                code=code_str,
+                validator=is_safe_code,
+                log_id=latest_log.id,
+            )
+        return code_str
 
     async def _save_log(
         self, response: dict, error_info: None | AskGeminiErrorInfo, subinfo: dict = {}
@@ -406,21 +387,25 @@ class ParserGeneratorForJSON:
                 AskGeminiErrorInfo(error_type="NoPrompt", error="No first prompt"),
                 None,
             )
-        json_str = json.dumps(html_to_minimal_dict(self.html_str), ensure_ascii=False)
+        minimal_dict = await run_parse(html_to_minimal_dict, self.html_str)
+        json_str = json.dumps(minimal_dict, ensure_ascii=False)
         contents = [
             types.Part.from_text(text=json_str),
             first_prompt,
         ]
-        for gmodel in MODEL_ESCALATION_LIST:
+        for gmodel in get_model_escalation_list():
             try:
                 response = await client.aio.models.generate_content(
                     model=gmodel, contents=contents
                 )
+                count_gemini_model(gmodel, "ok")
                 return response.model_dump(mode="json"), gmodel
             except errors.APIError as e:
                 if e.code == 429:
+                    count_gemini_model(gmodel, "escalated")
                     logger.warning(f"Escalte from {gmodel} to the next model")
                     continue
+                count_gemini_model(gmodel, "error")
                 return (
                     AskGeminiErrorInfo(
                         error_type=type(e).__name__,
@@ -430,6 +415,7 @@ class ParserGeneratorForJSON:
                     gmodel,
                 )
             except Exception as e:
+                count_gemini_model(gmodel, "error")
                 return (
                     AskGeminiErrorInfo(
                         error_type=type(e).__name__,
@@ -483,7 +469,7 @@ class HTMLSelectorConfigGeneratorForJSON:
     async def _get_generate_config_result(
         self, client, contents
     ) -> AskGeminiErrorInfo | HTMLConfigSearchResult:
-        for gmodel in MODEL_ESCALATION_LIST:
+        for gmodel in get_model_escalation_list():
             try:
                 response = await client.aio.models.generate_content(
                     model=gmodel,
@@ -493,14 +479,18 @@ class HTMLSelectorConfigGeneratorForJSON:
                         "response_json_schema": HTMLConfigSearchResult.model_json_schema(),
                     },
                 )
+                count_gemini_model(gmodel, "ok")
                 return HTMLConfigSearchResult.model_validate_json(response.text)
 
             except errors.APIError as e:
                 if e.code == 429:
+                    count_gemini_model(gmodel, "escalated")
                     logger.warning(f"Escalte from {gmodel} to the next model")
                     continue
+                count_gemini_model(gmodel, "error")
                 return AskGeminiErrorInfo(error_type=type(e).__name__, error=e.message)
             except Exception as e:
+                count_gemini_model(gmodel, "error")
                 return AskGeminiErrorInfo(error_type=type(e).__name__, error=str(e))
         return AskGeminiErrorInfo(
             error_type=NoModelsAvailableError.__name__,
@@ -512,7 +502,8 @@ class HTMLSelectorConfigGeneratorForJSON:
         first_prompt = self.prompt.get_prompt()
         if not first_prompt:
             return AskGeminiErrorInfo(error_type="NoPrompt", error="No first prompt")
-        json_str = json.dumps(html_to_minimal_dict(self.html_str), ensure_ascii=False)
+        minimal_dict = await run_parse(html_to_minimal_dict, self.html_str)
+        json_str = json.dumps(minimal_dict, ensure_ascii=False)
         contents = [
             types.Part.from_text(text=json_str),
             first_prompt.format(search_keyword=self.search_word),
@@ -525,54 +516,3 @@ class HTMLSelectorConfigGeneratorForJSON:
                 error_type=RuntimeError.__name__, error=result.error_msg
             )
         return result
-
-
-def _element_to_minimal_dict(element, text_limit: int | None = 10):
-    # 基本のタグ名
-    res = {"t": element.name}
-
-    # 主要な属性があれば短縮キーで格納
-    if element.get("id"):
-        res["i"] = element.get("id")
-    if element.get("class"):
-        res["c"] = ".".join(element.get("class"))
-    if element.get("href"):
-        res["h"] = element.get("href")
-    if element.get("src"):
-        res["s"] = element.get("src")
-
-    if element.name == "img" and element.get("alt"):
-        res["a"] = element.get("alt")  # a: alt属性
-
-    children = []
-    for child in element.children:
-        if child.name:
-            # 再帰的に子要素を処理
-            children.append(_element_to_minimal_dict(child))
-        elif child.strip():
-            # テキストは中身が推測できる程度（10文字）にカット
-            if not text_limit:
-                children.append(child.strip())
-            else:
-                text = child.strip()
-                short_text = (
-                    (text[:text_limit] + "..") if len(text) > text_limit else text
-                )
-                children.append(short_text)
-
-    if children:
-        res["ch"] = children
-    return res
-
-
-def html_to_minimal_dict(html: str, text_limit: int | None = 10) -> dict:
-    """
-    HTMLをGemini解析用に圧縮。
-    t: tag, i: id, c: class, h: href, s: src, ch: children
-    """
-    soup = BeautifulSoup(html, "lxml")
-    for s in soup(
-        ["script", "style", "head", "meta", "link", "header", "footer", "nav"]
-    ):
-        s.decompose()
-    return _element_to_minimal_dict(soup.body, text_limit=text_limit)
@@ -0,0 +1,67 @@
+import re
+
+from bs4 import BeautifulSoup, Comment
+
+
+def exclude_script_tags(html: str) -> str:
+    soup = BeautifulSoup(html, "lxml")
+    for meta in soup.select("head > meta"):
+        if meta.get("name") != "description" and meta.get("charset") is None:
+            meta.decompose()
+    for script in soup(["script", "style", "link"]):
+        script.decompose()
+    for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
+        comment.decompose()
+    result_html = str(soup)
+    return re.sub(r"^[ \t]*\n", "", result_html, flags=re.MULTILINE)
+
+
+def _element_to_minimal_dict(element, text_limit: int | None = 10):
+    # 基本のタグ名
+    res = {"t": element.name}
+
+    # 主要な属性があれば短縮キーで格納
+    if element.get("id"):
+        res["i"] = element.get("id")
+    if element.get("class"):
+        res["c"] = ".".join(element.get("class"))
+    if element.get("href"):
+        res["h"] = element.get("href")
+    if element.get("src"):
+        res["s"] = element.get("src")
+
+    if element.name == "img" and element.get("alt"):
+        res["a"] = element.get("alt")  # a: alt属性
+
+    children = []
+    for child in element.children:
+        if child.name:
+            # 再帰的に子要素を処理
+            children.append(_element_to_minimal_dict(child))
+        elif child.strip():
+            # テキストは中身が推測できる程度（10文字）にカット
+            if not text_limit:
+                children.append(child.strip())
+            else:
+                text = child.strip()
+                short_text = (
+                    (text[:text_limit] + "..") if len(text) > text_limit else text
+                )
+                children.append(short_text)
+
+    if children:
+        res["ch"] = children
+    return res
+
+
+def html_to_minimal_dict(html: str, text_limit: int | None = 10) -> dict:
+    """
+    HTMLをGemini解析用に圧縮。
+    t: tag, i: id, c: class, h: href, s: src, ch: children
+    """
+    soup = BeautifulSoup(html, "lxml")
+    for s in soup(
+        ["script", "style", "head", "meta", "link", "header", "footer", "nav"]
+    ):
+        s.decompose()
+    return _element_to_minimal_dict(soup.body, text_limit=text_limit)
@@ -0,0 +1,101 @@
+import hashlib
+import marshal
+from collections import OrderedDict
+from typing import Callable
+
+MAX_ENTRIES = 256
+
+
+class ParserEntry:
+    label: str
+    code: str
+    code_hash: str
+    is_safe: bool
+    error_msg: str | None
+    bytecode: bytes | None
+
+    def __init__(
+        self,
+        label: str,
+        code: str,
+        code_hash: str,
+        validator: Callable[[str], tuple[bool, str | None]],
+    ):
+        self.label = label
+        self.code = code
+        self.code_hash = code_hash
+        self.is_safe, self.error_msg = validator(code)
+        self.bytecode = None
+        if self.is_safe:
+            self.bytecode = marshal.dumps(compile(code, "<parser>", "exec"))
+
+
+def create_code_hash(code: str) -> str:
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+
+class ParserRegistry:
+    """
+    生成されたパーサーコードの検証結果とコンパイル結果を(label, コードのハッシュ)毎に保持する。
+    保存済みのログから抽出したコードはログのidでも引けるようにし、
+    新しいログの保存やrecreateの際にlabel毎に破棄する。
+    """
+
+    maxsize: int
+
+    def __init__(self, maxsize: int = MAX_ENTRIES):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[tuple[str, str], ParserEntry] = OrderedDict()
+        self._log_index: OrderedDict[tuple[str, int], str] = OrderedDict()
+
+    def get_by_log(self, label: str, log_id: int) -> ParserEntry | None:
+        code_hash = self._log_index.get((label, log_id))
+        if code_hash is None:
+            return None
+        entry = self._entries.get((label, code_hash))
+        if entry is None:
+            return None
+        self._entries.move_to_end((label, code_hash))
+        return entry
+
+    def register(
+        self,
+        label: str,
+        code: str,
+        validator: Callable[[str], tuple[bool, str | None]],
+        log_id: int | None = None,
+    ) -> ParserEntry:
+        code_hash = create_code_hash(code)
+        key = (label, code_hash)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = ParserEntry(
+                label=label, code=code, code_hash=code_hash, validator=validator
+            )
+            self._entries[key] = entry
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+        if log_id is not None:
+            self._log_index[(label, log_id)] = code_hash
+            while len(self._log_index) > self.maxsize:
+                self._log_index.popitem(last=False)
+        return entry
+
+    def invalidate(self, label: str):
+        for key in [k for k in self._entries if k[0] == label]:
+            del self._entries[key]
+        for key in [k for k in self._log_index if k[0] == label]:
+            del self._log_index[key]
+
+    def clear(self):
+        self._entries.clear()
+        self._log_index.clear()
+
+
+_parser_registry = ParserRegistry()
+
+
+def get_parser_registry() -> ParserRegistry:
+    return _parser_registry
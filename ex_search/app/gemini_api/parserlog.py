@@ -4,6 +4,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from domain.models.ai import ailog as m_ailog, command as a_cmd, repository as a_repo
 from .models import AskGeminiErrorInfo
+from .parser_registry import get_parser_registry
 
 
 class UpdateParserLog:
@@ -33,6 +34,8 @@ class UpdateParserLog:
         )
         await self.repository.save_all([log_entry])
         await self.session.refresh(log_entry)
+        # 新しいパーサーが保存されたため、このlabelのキャッシュは使わない
+        get_parser_registry().invalidate(label)
         return log_entry
 
     async def get_log(
@@ -54,6 +57,12 @@ class UpdateParserLog:
             )
         else:
             return None
+        # 通常は最新の1件だけを読み込む
+        latest_log = await self.repository.get_latest(
+            command=command.model_copy(update={"is_error": bool(is_error)})
+        )
+        if latest_log is None or latest_log.response:
+            return latest_log
         log_entries = await self.repository.get(command=command)
         if not log_entries:
             return None
@@ -0,0 +1,475 @@
+import importlib
+import inspect
+import marshal
+import multiprocessing
+import os
+import queue
+import re
+import signal
+import threading
+import traceback
+import types
+from collections import OrderedDict
+from multiprocessing.connection import Connection
+
+import structlog
+
+from common.read_config import get_sandbox_options, SandboxOptions
+
+logger = structlog.get_logger(__name__)
+
+CLASS_NAME_PATTERN = re.compile(r"class\s+([A-Za-z_][A-Za-z0-9_]*)\s*[:(]")
+
+ALLOWED_IMPORTS = [
+    "bs4",
+    "lxml",
+    "re",
+    "json",
+    "datetime",
+    "typing",
+    "collections",
+    "math",
+    "urllib",
+]
+# 生成コードがよくimportするサブモジュール。ジョブ毎に読み込まないよう、fork前に読み込んでおく
+PRELOAD_SUBMODULES = ["lxml.html", "urllib.parse", "collections.abc"]
+WORKER_TIMEOUT_MARGIN = 5
+
+
+def _set_limits(memory_limit_mb: int, cpu_limit_seconds: int):
+    # Enforce memory and CPU limits
+    try:
+        import resource
+
+        mem_limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (mem_limit, mem_limit))
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_limit_seconds, cpu_limit_seconds))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+def _set_job_cpu_limit(cpu_seconds_per_job: int):
+    # RLIMIT_CPUはプロセスの累積時間のため、ジョブ毎に現在の使用時間から上限を設定し直す
+    try:
+        import resource
+
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        used = int(usage.ru_utime + usage.ru_stime) + 1
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        soft = used + cpu_seconds_per_job
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+def _drop_privileges():
+    try:
+        if os.name == "posix" and os.getuid() == 0:
+            import pwd
+
+            nobody = pwd.getpwnam("nobody")
+            nobody_uid = nobody.pw_uid
+            nobody_gid = nobody.pw_gid
+
+            os.setgroups([])
+            os.setgid(nobody_gid)
+            os.setuid(nobody_uid)
+            os.environ["USER"] = "nobody"
+            os.environ["HOME"] = "/nonexistent"
+    except Exception:
+        pass
+
+
+def _import_allowed_modules() -> dict:
+    modules = {}
+    for mod_name in ALLOWED_IMPORTS:
+        try:
+            modules[mod_name] = importlib.import_module(mod_name)
+        except ImportError:
+            pass
+    for mod_name in PRELOAD_SUBMODULES:
+        try:
+            importlib.import_module(mod_name)
+        except ImportError:
+            pass
+    return modules
+
+
+def _find_parser_class(code: str, sandbox_globals: dict) -> type:
+    # Detect the parser class
+    class_name = None
+    cnames = CLASS_NAME_PATTERN.findall(code)
+    if cnames:
+        class_name = cnames[0]
+
+    if not class_name:
+        # Fallback scan
+        for k, v in sandbox_globals.items():
+            if inspect.isclass(v) and v.__module__ == "__main__":
+                class_name = k
+                break
+
+    if not class_name or class_name not in sandbox_globals:
+        raise ValueError("No parser class found in the generated code.")
+
+    return sandbox_globals[class_name]
+
+
+def _load_code(
+    code: str,
+    code_hash: str | None,
+    bytecode: bytes | None,
+    code_cache: OrderedDict[str, types.CodeType],
+    max_cached_parsers: int,
+) -> types.CodeType:
+    """コンパイル済みのコードをハッシュ毎にキャッシュする。実行はしないためワーカーの状態は変わらない"""
+    code_obj = code_cache.get(code_hash) if code_hash else None
+    if code_obj is not None:
+        code_cache.move_to_end(code_hash)
+        return code_obj
+    if bytecode is not None:
+        code_obj = marshal.loads(bytecode)
+    else:
+        code_obj = compile(code, "<parser>", "exec")
+    if code_hash and max_cached_parsers > 0:
+        code_cache[code_hash] = code_obj
+        while len(code_cache) > max_cached_parsers:
+            code_cache.popitem(last=False)
+    return code_obj
+
+
+def _error_result(e: BaseException) -> dict:
+    return {
+        "success": False,
+        "error_type": type(e).__name__,
+        "error": str(e),
+        "traceback": traceback.format_exc(),
+    }
+
+
+def _run_parser_code(
+    code: str, code_obj: types.CodeType, html_str: str, modules: dict
+) -> dict:
+    try:
+        sandbox_globals = {
+            "__builtins__": __builtins__,
+        }
+        sandbox_globals.update(modules)
+
+        exec(code_obj, sandbox_globals)
+        parser_cls = _find_parser_class(code, sandbox_globals)
+        parser_instance = parser_cls(html_str)
+        parsed_result = parser_instance.execute()
+
+        return {"success": True, "data": parsed_result}
+    except Exception as e:
+        return _error_result(e)
+
+
+def _run_job_in_child(
+    conn: Connection,
+    code: str,
+    code_obj: types.CodeType,
+    html_str: str,
+    modules: dict,
+    cpu_seconds_per_job: int,
+    timeout: float,
+) -> dict:
+    """
+    ジョブ毎にforkした子プロセスで実行する。
+    子プロセスでの書き換えはワーカーに残らないため、次のジョブは常に同じ状態から始まる
+    """
+    result_reader, result_writer = multiprocessing.Pipe(duplex=False)
+    pid = os.fork()
+    if pid == 0:
+        exitcode = 0
+        try:
+            conn.close()
+            result_reader.close()
+            _set_job_cpu_limit(cpu_seconds_per_job)
+            result = _run_parser_code(
+                code=code, code_obj=code_obj, html_str=html_str, modules=modules
+            )
+            try:
+                result_writer.send(result)
+            except Exception as e:
+                result_writer.send(_error_result(e))
+        except SystemExit as e:
+            exitcode = e.code if isinstance(e.code, int) else 1
+        except BaseException:
+            exitcode = 1
+        finally:
+            os._exit(exitcode)
+
+    result_writer.close()
+    try:
+        if not result_reader.poll(timeout):
+            os.kill(pid, signal.SIGKILL)
+            return {"success": False, "timeout": True}
+        try:
+            return result_reader.recv()
+        except EOFError:
+            pass
+    finally:
+        result_reader.close()
+        _, status = os.waitpid(pid, 0)
+    return {"success": False, "exitcode": os.waitstatus_to_exitcode(status)}
+
+
+def sandbox_worker_main(
+    conn: Connection,
+    memory_limit_mb: int,
+    cpu_seconds_per_job: int,
+    max_jobs_per_worker: int,
+    max_cached_parsers: int,
+):
+    """
+    サンドボックスのワーカープロセス。
+    起動時に一度だけモジュールの読み込み、制限の設定と権限の降格を行い、
+    パイプで受け取った(code, html)をジョブ毎にforkした子プロセスで実行する。
+    コードのハッシュが渡された場合はコンパイルしたコードをキャッシュして使い回す。
+    forkできない環境ではワーカー内で実行し、ジョブ毎にワーカーを作り直させる。
+    """
+    modules = _import_allowed_modules()
+    _set_limits(
+        memory_limit_mb=memory_limit_mb,
+        cpu_limit_seconds=cpu_seconds_per_job * (max_jobs_per_worker + 1),
+    )
+    _drop_privileges()
+    code_cache: OrderedDict[str, types.CodeType] = OrderedDict()
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            return
+        if job is None:
+            return
+        code, html_str, code_hash, bytecode, timeout = job
+        try:
+            code_obj = _load_code(
+                code=code,
+                code_hash=code_hash,
+                bytecode=bytecode,
+                code_cache=code_cache,
+                max_cached_parsers=max_cached_parsers,
+            )
+        except Exception as e:
+            conn.send(_error_result(e))
+            continue
+        if hasattr(os, "fork"):
+            result = _run_job_in_child(
+                conn=conn,
+                code=code,
+                code_obj=code_obj,
+                html_str=html_str,
+                modules=modules,
+                cpu_seconds_per_job=cpu_seconds_per_job,
+                timeout=timeout,
+            )
+        else:
+            _set_job_cpu_limit(cpu_seconds_per_job)
+            result = _run_parser_code(
+                code=code, code_obj=code_obj, html_str=html_str, modules=modules
+            )
+            result["recycle"] = True
+        try:
+            conn.send(result)
+        except Exception as e:
+            conn.send(
+                {
+                    "success": False,
+                    "error_type": type(e).__name__,
+                    "error": str(e),
+                    "recycle": True,
+                }
+            )
+        if result.get("recycle"):
+            return
+
+
+class SandboxWorker:
+    process: multiprocessing.process.BaseProcess
+    jobs: int
+
+    def __init__(self, ctx, options: SandboxOptions):
+        self._conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=sandbox_worker_main,
+            args=(
+                child_conn,
+                options.memory_limit_mb,
+                options.cpu_seconds_per_job,
+                options.max_jobs_per_worker,
+                options.max_cached_parsers,
+            ),
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def run(
+        self,
+        code: str,
+        html_str: str,
+        timeout: float,
+        code_hash: str | None = None,
+        bytecode: bytes | None = None,
+    ) -> dict:
+        self._conn.send((code, html_str, code_hash, bytecode, timeout))
+        # タイムアウトは子プロセスを止めるワーカーが判定する。ワーカー自体が応答しない場合に備えて少し長く待つ
+        if not self._conn.poll(timeout + WORKER_TIMEOUT_MARGIN):
+            raise TimeoutError(
+                f"Code execution exceeded the timeout limit of {timeout} seconds."
+            )
+        return self._conn.recv()
+
+    def exitcode(self) -> int | None:
+        self.process.join(timeout=1)
+        return self.process.exitcode
+
+    def close(self):
+        try:
+            self._conn.send(None)
+        except Exception:
+            pass
+        self.process.join(timeout=1)
+        self.terminate()
+
+    def terminate(self):
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self._conn.close()
+
+
+class SandboxPool:
+    """
+    生成されたパーサーを実行するサンドボックスプロセスのプール。
+    ワーカーはジョブ毎に子プロセスをforkして実行し、max_jobs_per_worker回実行するか、
+    ワーカー自体が応答しない場合に作り直す。
+    """
+
+    options: SandboxOptions
+
+    def __init__(self, options: SandboxOptions):
+        self.options = options
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle: queue.LifoQueue[SandboxWorker] = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(options.max_workers)
+        self._closed = False
+
+    def warm_up(self):
+        workers = [self.acquire() for _ in range(self.options.max_workers)]
+        for worker in workers:
+            self.release(worker)
+
+    def run(
+        self,
+        code: str,
+        html_str: str,
+        timeout: float,
+        code_hash: str | None = None,
+        bytecode: bytes | None = None,
+    ):
+        worker = self.acquire()
+        discard = True
+        try:
+            try:
+                result = worker.run(
+                    code=code,
+                    html_str=html_str,
+                    timeout=timeout,
+                    code_hash=code_hash,
+                    bytecode=bytecode,
+                )
+            except (EOFError, ConnectionError):
+                raise RuntimeError(
+                    "Sandbox process terminated abnormally"
+                    f" with exit code {worker.exitcode()}."
+                )
+            worker.jobs += 1
+            discard = (
+                result.get("recycle", False)
+                or worker.jobs >= self.options.max_jobs_per_worker
+            )
+        finally:
+            self.release(worker, discard=discard)
+
+        if result.get("timeout"):
+            raise TimeoutError(
+                f"Code execution exceeded the timeout limit of {timeout} seconds."
+            )
+        if "exitcode" in result:
+            raise RuntimeError(
+                "Sandbox process terminated abnormally"
+                f" with exit code {result['exitcode']}."
+            )
+        if result["success"]:
+            return result["data"]
+        error_msg = result.get("error", "Unknown error inside sandbox.")
+        error_type = result.get("error_type", "RuntimeError")
+        raise RuntimeError(f"[{error_type}] {error_msg}")
+
+    def acquire(self) -> SandboxWorker:
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    worker = self._idle.get_nowait()
+                except queue.Empty:
+                    return SandboxWorker(ctx=self._ctx, options=self.options)
+                if worker.is_alive():
+                    return worker
+                worker.terminate()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, worker: SandboxWorker, discard: bool = False):
+        try:
+            if self._closed or discard:
+                worker.terminate()
+                return
+            self._idle.put(worker)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            worker.close()
+
+
+_sandbox_pool: SandboxPool | None = None
+_sandbox_pool_lock = threading.Lock()
+
+
+def get_sandbox_pool() -> SandboxPool:
+    global _sandbox_pool
+    with _sandbox_pool_lock:
+        if _sandbox_pool is None:
+            _sandbox_pool = SandboxPool(options=get_sandbox_options())
+        return _sandbox_pool
+
+
+def init_sandbox_pool():
+    get_sandbox_pool().warm_up()
+
+
+def shutdown_sandbox_pool():
+    global _sandbox_pool
+    with _sandbox_pool_lock:
+        if _sandbox_pool is None:
+            return
+        _sandbox_pool.close()
+        _sandbox_pool = None
@@ -1,12 +1,12 @@
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
-from bs4 import BeautifulSoup, Comment
-import re
 import structlog
 
-from app.downloader import download_remotely, async_get
+from app.downloader import async_download_remotely, async_get
 from app.downloader import dl_with_nodriver_api as nodriver_api
+from app.parse_executor import run_parse
 from .ask_gemini import ParserRequestPrompt, ParserGeneratorForJSON
+from .html_util import exclude_script_tags
 from .model_convert import ModelConverter
 from domain.schemas.search import search
 from domain.models.ai import repository as m_ia_repo
@@ -88,7 +88,7 @@ async def get_html_with_selenium(command: GetCommandWithSelenium):
         if command.cookie_options.load:
             params["cookie_load"] = command.cookie_options.load
     try:
-        html = download_remotely(**params)
+        html = await async_download_remotely(**params)
     except Exception as e:
         return (
             False,
@@ -124,19 +124,6 @@ async def get_html(command: GetCommandWithHttpx):
         return False, f"download error, type:{type(e).__name__}, message:{e}", None
 
 
-def exclude_script_tags(html: str) -> str:
-    soup = BeautifulSoup(html, "lxml")
-    for meta in soup.select("head > meta"):
-        if meta.get("name") != "description" and meta.get("charset") is None:
-            meta.decompose()
-    for script in soup(["script", "style", "link"]):
-        script.decompose()
-    for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
-        comment.decompose()
-    result_html = str(soup)
-    return re.sub(r"^[ \t]*\n", "", result_html, flags=re.MULTILINE)
-
-
 def compress_whitespace_in_html(html: str) -> str:
     return " ".join(html.split())
 
@@ -148,6 +135,7 @@ async def _parse_html(
     session: AsyncSession,
     pg_repository: m_ia_repo.IParserGenerationLogRepository,
     errorcodelog_repository: m_ia_repo.ICodeValidationErrorsRepository,
+    activeparser_repository: m_ia_repo.IActiveParserRepository | None = None,
     recreate: bool = False,
     exclude_script: bool = True,
     compress_whitespace: bool = False,
@@ -158,7 +146,7 @@ async def _parse_html(
     else:
         parserprompt = ParserRequestPrompt()
     if exclude_script:
-        html = exclude_script_tags(html)
+        html = await run_parse(exclude_script_tags, html)
     if compress_whitespace:
         html = compress_whitespace_in_html(html)
 
@@ -171,6 +159,7 @@ async def _parse_html(
         url=url,
         recreate=recreate,
         prompt=parserprompt,
+        activeparser_repository=activeparser_repository,
     )
     return await sparser.execute()
 
@@ -194,6 +183,7 @@ async def parse_html_and_convert(
         session=session,
         pg_repository=ai_repo.ParserGenerationLogRepository(session),
         errorcodelog_repository=ai_repo.CodeValidationErrorsRepository(session),
+        activeparser_repository=ai_repo.ActiveParserRepository(session),
         recreate=recreate,
         exclude_script=exclude_script,
         compress_whitespace=compress_whitespace,
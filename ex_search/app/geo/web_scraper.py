@@ -1,7 +1,8 @@
 from pydantic import BaseModel
 
-from app.downloader import download_remotely
-from geo.parser import SearchResultParser
+from app.downloader import async_download_remotely
+from geo.parser import parse_search_result
+from app.parse_executor import run_parse
 
 
 class GetCommandWithSelenium(BaseModel):
@@ -23,13 +24,11 @@ async def get_html_with_selenium(command: GetCommandWithSelenium):
     if command.selenium_url:
         params["selenium_url"] = command.selenium_url
     try:
-        html = download_remotely(**params)
+        html = await async_download_remotely(**params)
     except Exception as e:
         return False, f"download error, {e} , url:{command.url}"
     return True, html
 
 
 async def parse_html(html: str, url: str):
-    sparser = SearchResultParser(html_str=html, url=url)
-    sparser.execute()
-    return sparser.get_results()
+    return await run_parse(parse_search_result, html, url)
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field
 
-from iosys.parser import SearchResultParser
+from iosys.parser import parse_search_result
+from app.parse_executor import run_parse
 from app.downloader import async_get
 
 
@@ -23,6 +24,4 @@ async def get_html(command: GetCommandWithHttpx):
 
 
 async def parse_html(html: str, url: str):
-    sparser = SearchResultParser(html_str=html, url=url)
-    sparser.execute()
-    return sparser.get_results()
+    return await run_parse(parse_search_result, html, url)
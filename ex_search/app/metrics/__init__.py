@@ -0,0 +1,17 @@
+from .metrics import (
+    REGISTRY,
+    observe_stage,
+    track_in_flight,
+    count_cache,
+    count_gemini_model,
+    generate_metrics,
+)
+
+__all__ = [
+    "REGISTRY",
+    "observe_stage",
+    "track_in_flight",
+    "count_cache",
+    "count_gemini_model",
+    "generate_metrics",
+]
@@ -0,0 +1,226 @@
+import contextlib
+import threading
+import time
+
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    CONTENT_TYPE_LATEST,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+import structlog
+
+from common import read_config
+from app.parse_executor import get_parse_executor
+from app.downloader.circuitbreaker import get_circuit_breaker, domain_circuit_name
+
+logger = structlog.get_logger(__name__)
+
+NAMESPACE = "ex_search"
+OTHER_DOMAIN = "other"
+OTHER_SITENAME = "other"
+STAGE_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    20,
+    40,
+    80,
+    160,
+)
+CIRCUIT_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+# プロセスの既定のレジストリとは分け、テストではこのレジストリの値を直接読む
+REGISTRY = CollectorRegistry()
+
+STAGE_DURATION = Histogram(
+    "stage_duration_seconds",
+    "検索、ダウンロードの各段階の処理時間",
+    labelnames=["stage", "sitename", "domain", "download_type"],
+    namespace=NAMESPACE,
+    buckets=STAGE_BUCKETS,
+    registry=REGISTRY,
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests",
+    "キャッシュの参照結果。resultはhit, miss, stale",
+    labelnames=["cache", "result"],
+    namespace=NAMESPACE,
+    registry=REGISTRY,
+)
+DOWNLOADS_IN_FLIGHT = Gauge(
+    "downloads_in_flight",
+    "ドメイン毎の実行中のダウンロード数",
+    labelnames=["domain"],
+    namespace=NAMESPACE,
+    registry=REGISTRY,
+)
+GEMINI_MODEL_REQUESTS = Counter(
+    "gemini_model_requests",
+    "MODEL_ESCALATION_LISTのモデル毎のリクエスト結果。resultはok, escalated, error",
+    labelnames=["model", "result"],
+    namespace=NAMESPACE,
+    registry=REGISTRY,
+)
+CIRCUIT_STATE = Gauge(
+    "circuit_state",
+    "サーキットブレーカーの状態。0:closed, 1:half_open, 2:open",
+    labelnames=["name"],
+    namespace=NAMESPACE,
+    registry=REGISTRY,
+)
+CIRCUIT_FAILURES = Gauge(
+    "circuit_failures",
+    "サーキットブレーカーの連続失敗数",
+    labelnames=["name"],
+    namespace=NAMESPACE,
+    registry=REGISTRY,
+)
+
+_domain_labels: set[str] = set()
+_domain_labels_lock = threading.Lock()
+
+
+def get_domain_label(domain: str | None) -> str:
+    """任意のURLを受け付けるため、ラベルに使うドメインの数を制限する"""
+    if not domain:
+        return ""
+    with _domain_labels_lock:
+        if domain in _domain_labels:
+            return domain
+        if len(_domain_labels) >= read_config.get_metrics_options().max_domain_labels:
+            return OTHER_DOMAIN
+        _domain_labels.add(domain)
+        return domain
+
+
+def get_sitename_label(sitename: str | None) -> str:
+    """サイト名はリクエストの任意の文字列のため、登録されたサイト以外はまとめる"""
+    # sitesはgeminiを経由してこのモジュールをimportするため、使う時に読み込む
+    from app.search_api.sites import get_site_registry
+
+    if not sitename:
+        return ""
+    handler = get_site_registry().get(sitename)
+    if handler is None:
+        return OTHER_SITENAME
+    return handler.sitename
+
+
+@contextlib.contextmanager
+def observe_stage(
+    stage: str, sitename: str = "", domain: str = "", download_type: str = ""
+):
+    """
+    処理時間をSTAGE_DURATIONに記録する。
+    終わるまで分からないラベルは返す辞書に設定する
+    """
+    labels = {"sitename": sitename, "domain": domain, "download_type": download_type}
+    start = time.perf_counter()
+    try:
+        yield labels
+    finally:
+        STAGE_DURATION.labels(
+            stage=stage,
+            sitename=get_sitename_label(labels["sitename"]),
+            domain=get_domain_label(labels["domain"]),
+            download_type=labels["download_type"] or "",
+        ).observe(time.perf_counter() - start)
+
+
+@contextlib.contextmanager
+def track_in_flight(domain: str):
+    gauge = DOWNLOADS_IN_FLIGHT.labels(domain=get_domain_label(domain))
+    gauge.inc()
+    try:
+        yield
+    finally:
+        gauge.dec()
+
+
+def count_cache(cache: str, result: str):
+    CACHE_REQUESTS.labels(cache=cache, result=result).inc()
+
+
+def count_gemini_model(model: str, result: str):
+    GEMINI_MODEL_REQUESTS.labels(model=model, result=result).inc()
+
+
+class ParseExecutorCollector:
+    """ParseExecutor.stats()を収集時に読み出す"""
+
+    def describe(self):
+        # 登録時にcollectを呼ばせない
+        return []
+
+    def collect(self):
+        stats = get_parse_executor().stats()
+        prefix = f"{NAMESPACE}_parse_executor"
+        for name, value, documentation in [
+            ("in_flight", stats.in_flight, "実行中の解析数"),
+            ("queue_depth", stats.queue_depth, "ワーカー待ちの解析数"),
+            ("max_queue_depth", stats.max_queue_depth, "ワーカー待ちの最大数"),
+        ]:
+            yield GaugeMetricFamily(f"{prefix}_{name}", documentation, value=value)
+        for name, value, documentation in [
+            ("submitted", stats.submitted, "投入した解析数"),
+            ("completed", stats.completed, "完了した解析数"),
+            ("failed", stats.failed, "失敗した解析数"),
+            (
+                "queue_wait_seconds",
+                stats.total_queue_wait_seconds,
+                "ワーカー待ちの合計時間",
+            ),
+            ("run_seconds", stats.total_run_seconds, "解析の合計時間"),
+        ]:
+            yield CounterMetricFamily(f"{prefix}_{name}", documentation, value=value)
+
+
+REGISTRY.register(ParseExecutorCollector())
+
+
+def get_circuit_label(name: str) -> str:
+    """ドメインのサーキットはダウンロード先の数だけあるため、ドメインのラベルと同じく制限する"""
+    prefix = domain_circuit_name("")
+    if name.startswith(prefix):
+        return domain_circuit_name(get_domain_label(name.removeprefix(prefix)))
+    return name
+
+
+async def update_circuit_metrics():
+    # Redisから読むため、収集時ではなく出力の直前に非同期で更新する
+    try:
+        states = await get_circuit_breaker().get_states()
+    except Exception as e:
+        logger.warning("failed to get circuit states", error=str(e))
+        return
+    # まとめたラベルは最も悪い状態と最大の失敗数にする
+    state_values: dict[str, int] = {}
+    failures: dict[str, int] = {}
+    for name, state in states.items():
+        label = get_circuit_label(name)
+        state_values[label] = max(
+            state_values.get(label, 0), CIRCUIT_STATE_VALUES.get(state["state"], 0)
+        )
+        failures[label] = max(failures.get(label, 0), state["failures"])
+    CIRCUIT_STATE.clear()
+    CIRCUIT_FAILURES.clear()
+    for label, value in state_values.items():
+        CIRCUIT_STATE.labels(name=label).set(value)
+        CIRCUIT_FAILURES.labels(name=label).set(failures[label])
+
+
+async def generate_metrics() -> tuple[bytes, str]:
+    await update_circuit_metrics()
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
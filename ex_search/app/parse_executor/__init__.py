@@ -0,0 +1,17 @@
+from .executor import (
+    ParseExecutor,
+    ParseExecutorStats,
+    get_parse_executor,
+    init_parse_executor,
+    shutdown_parse_executor,
+    run_parse,
+)
+
+__all__ = [
+    "ParseExecutor",
+    "ParseExecutorStats",
+    "get_parse_executor",
+    "init_parse_executor",
+    "shutdown_parse_executor",
+    "run_parse",
+]
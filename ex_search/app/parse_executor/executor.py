@@ -0,0 +1,179 @@
+import asyncio
+import functools
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable
+
+from pydantic import BaseModel
+import structlog
+
+from common.read_config import get_parse_executor_options, ParseExecutorOptions
+from .worker import warm_up_worker, ping, run_task
+
+logger = structlog.get_logger(__name__)
+
+
+class ParseExecutorStats(BaseModel):
+    backend: str
+    max_workers: int
+    in_flight: int = 0
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    total_queue_wait_seconds: float = 0
+    total_run_seconds: float = 0
+
+
+class ParseExecutor:
+    """
+    HTML解析のようなCPUを使う同期処理をイベントループの外で実行する。
+    backendがprocessの場合はspawnしたワーカープロセスで実行するため、
+    渡す関数はモジュールレベルで定義し、引数と戻り値はpickle可能である必要がある。
+    """
+
+    options: ParseExecutorOptions
+
+    def __init__(self, options: ParseExecutorOptions):
+        self.options = options
+        self._executor: Executor | None = None
+        self._stats = ParseExecutorStats(
+            backend=options.backend, max_workers=options.max_workers
+        )
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        if self.options.backend == "inline":
+            return self._run_inline(func, args, kwargs)
+        executor = self._get_executor()
+        self._on_submit()
+        submitted_at = time.time()
+        loop = asyncio.get_running_loop()
+        try:
+            result, started_at, finished_at = await loop.run_in_executor(
+                executor, functools.partial(run_task, func, args, kwargs)
+            )
+        except BrokenProcessPool:
+            # ワーカーが異常終了した場合はプールを作り直す
+            logger.warning("parse worker pool is broken, recreate it")
+            self._reset_executor(executor)
+            self._on_done(failed=True)
+            raise
+        except BaseException:
+            self._on_done(failed=True)
+            raise
+        self._on_done(
+            queue_wait=max(0.0, started_at - submitted_at),
+            run_time=finished_at - started_at,
+        )
+        return result
+
+    async def warm_up(self):
+        if self.options.backend == "inline":
+            return
+        # 同時に投入することでワーカーをmax_workers分起動させておく
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        await asyncio.gather(
+            *[
+                loop.run_in_executor(executor, ping)
+                for _ in range(self.options.max_workers)
+            ]
+        )
+
+    def stats(self) -> ParseExecutorStats:
+        return self._stats.model_copy()
+
+    def shutdown(self):
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = self._create_executor()
+        return self._executor
+
+    def _create_executor(self) -> Executor:
+        opts = self.options
+        if opts.backend == "thread":
+            return ThreadPoolExecutor(
+                max_workers=opts.max_workers, thread_name_prefix="parser"
+            )
+        return ProcessPoolExecutor(
+            max_workers=opts.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=warm_up_worker,
+            max_tasks_per_child=opts.max_tasks_per_child,
+        )
+
+    def _reset_executor(self, executor: Executor):
+        if self._executor is not executor:
+            return
+        self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run_inline(self, func: Callable[..., Any], args: tuple, kwargs: dict):
+        self._on_submit()
+        try:
+            result, started_at, finished_at = run_task(func, args, kwargs)
+        except BaseException:
+            self._on_done(failed=True)
+            raise
+        self._on_done(run_time=finished_at - started_at)
+        return result
+
+    def _on_submit(self):
+        stats = self._stats
+        stats.submitted += 1
+        stats.in_flight += 1
+        stats.queue_depth = max(0, stats.in_flight - self.options.max_workers)
+        stats.max_queue_depth = max(stats.max_queue_depth, stats.queue_depth)
+        if stats.queue_depth >= self.options.warn_queue_depth:
+            logger.warning(
+                "parse queue is congested",
+                queue_depth=stats.queue_depth,
+                max_workers=self.options.max_workers,
+            )
+
+    def _on_done(
+        self, failed: bool = False, queue_wait: float = 0, run_time: float = 0
+    ):
+        stats = self._stats
+        stats.in_flight -= 1
+        stats.queue_depth = max(0, stats.in_flight - self.options.max_workers)
+        if failed:
+            stats.failed += 1
+            return
+        stats.completed += 1
+        stats.total_queue_wait_seconds += queue_wait
+        stats.total_run_seconds += run_time
+
+
+_parse_executor: ParseExecutor | None = None
+
+
+def get_parse_executor() -> ParseExecutor:
+    global _parse_executor
+    if _parse_executor is None:
+        _parse_executor = ParseExecutor(options=get_parse_executor_options())
+    return _parse_executor
+
+
+async def init_parse_executor():
+    await get_parse_executor().warm_up()
+
+
+def shutdown_parse_executor():
+    global _parse_executor
+    if _parse_executor is None:
+        return
+    _parse_executor.shutdown()
+    _parse_executor = None
+
+
+async def run_parse(func: Callable[..., Any], *args, **kwargs) -> Any:
+    return await get_parse_executor().run(func, *args, **kwargs)
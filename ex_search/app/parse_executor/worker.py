@@ -0,0 +1,31 @@
+import importlib
+import signal
+import time
+
+# ワーカー起動時に読み込んでおくモジュール。最初の解析で import 待ちが発生しないようにする
+WARM_MODULES = [
+    "lxml.etree",
+    "bs4",
+    "sofmap.parser",
+    "geo.parser",
+    "iosys.parser",
+    "app.gemini_api.html_util",
+]
+
+
+def warm_up_worker():
+    # Ctrl+C は親プロセス側で処理するため、ワーカーでは無視する
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for name in WARM_MODULES:
+        importlib.import_module(name)
+
+
+def ping() -> bool:
+    return True
+
+
+def run_task(func, args: tuple, kwargs: dict) -> tuple[object, float, float]:
+    """解析関数を実行し、(結果, 開始時刻, 終了時刻) を返す"""
+    started_at = time.time()
+    result = func(*args, **kwargs)
+    return result, started_at, time.time()
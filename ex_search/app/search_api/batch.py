@@ -0,0 +1,197 @@
+import asyncio
+import contextlib
+import json
+from typing import AsyncIterator, Callable
+from urllib.parse import urlparse
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+import structlog
+
+from common import read_config
+from domain.models.cache import repository as i_cacherepo
+from domain.schemas.search import (
+    SearchRequest,
+    SearchResponse,
+    BatchSearchRequest,
+    BatchSearchResponse,
+)
+from .search import SearchClient
+from .sites import get_site_registry
+
+logger = structlog.get_logger(__name__)
+
+
+def create_search_request_key(searchrequest: SearchRequest) -> str:
+    data = searchrequest.model_dump(mode="json", exclude_none=True)
+    data["sitename"] = searchrequest.sitename.lower()
+    return json.dumps(data, sort_keys=True, ensure_ascii=False)
+
+
+def get_group_name(searchrequest: SearchRequest) -> str:
+    """URL生成前に分かる範囲でのドメインのまとまり。サイト名の場合はそのサイトのドメインにする"""
+    if searchrequest.url:
+        netloc = urlparse(searchrequest.url).netloc
+        if netloc:
+            return netloc
+    sitename = searchrequest.sitename.lower()
+    handler = get_site_registry().get(sitename)
+    if handler and handler.domains:
+        return handler.domains[0]
+    return sitename
+
+
+def get_domain_concurrency(domain: str) -> int:
+    """ダウンロード時のドメインロックと同じ同時実行数を使う"""
+    return read_config.get_rate_limit_options().get_domain(domain).max_concurrency
+
+
+class DomainLimiter:
+    """バッチ内でドメイン毎に同時に処理する数を制限する"""
+
+    get_limit: Callable[[str], int]
+
+    def __init__(self, get_limit: Callable[[str], int] = get_domain_concurrency):
+        self.get_limit = get_limit
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+
+    def get_semaphore(self, domain: str) -> asyncio.Semaphore:
+        if domain not in self._semaphores:
+            self._semaphores[domain] = asyncio.Semaphore(self.get_limit(domain))
+        return self._semaphores[domain]
+
+    @contextlib.asynccontextmanager
+    async def __call__(self, domain: str):
+        async with self.get_semaphore(domain):
+            yield
+
+
+class BatchSearchClient:
+    """
+    複数の検索をまとめて並行に実行する。
+    同一のリクエストは1回だけ実行し、各アイテムはそれぞれのDBセッションで処理する。
+    同じURLになった別リクエストはSearchClient内のsingleflightでまとめられる。
+    """
+
+    batchrequest: BatchSearchRequest
+    sessionmaker: async_sessionmaker[AsyncSession]
+    searchcache_repository_factory: Callable[
+        [AsyncSession], i_cacherepo.ISearchCacheRepository
+    ]
+    caller_type: str
+    max_concurrency: int
+
+    def __init__(
+        self,
+        batchrequest: BatchSearchRequest,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        searchcache_repository_factory: Callable[
+            [AsyncSession], i_cacherepo.ISearchCacheRepository
+        ],
+        caller_type: str = "",
+        max_concurrency: int = 10,
+    ):
+        self.batchrequest = batchrequest
+        self.sessionmaker = sessionmaker
+        self.searchcache_repository_factory = searchcache_repository_factory
+        self.caller_type = caller_type
+        self.max_concurrency = max_concurrency
+
+    async def execute(self) -> BatchSearchResponse:
+        results: list[SearchResponse | None] = [None] * len(self.batchrequest.requests)
+        async for index, response in self.stream():
+            results[index] = response
+        return BatchSearchResponse(results=results)
+
+    async def stream(self) -> AsyncIterator[tuple[int, SearchResponse]]:
+        """完了した順に(リクエストの位置, 結果)を返す"""
+        indexes_by_key: dict[str, list[int]] = {}
+        unique_requests: dict[str, SearchRequest] = {}
+        for index, searchrequest in enumerate(self.batchrequest.requests):
+            key = create_search_request_key(searchrequest)
+            unique_requests.setdefault(key, searchrequest)
+            indexes_by_key.setdefault(key, []).append(index)
+        logger.info(
+            "batch search start",
+            total=len(self.batchrequest.requests),
+            unique=len(unique_requests),
+        )
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        group_limiter = DomainLimiter()
+        domain_limiter = DomainLimiter()
+        pending: dict[asyncio.Task, str] = {
+            asyncio.create_task(
+                self._search(
+                    searchrequest=searchrequest,
+                    semaphore=semaphore,
+                    group_limiter=group_limiter,
+                    domain_limiter=domain_limiter,
+                )
+            ): key
+            for key, searchrequest in unique_requests.items()
+        }
+        try:
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending.keys(), return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    key = pending.pop(task)
+                    response = task.result()
+                    first, *others = indexes_by_key[key]
+                    yield first, response
+                    for index in others:
+                        yield index, response.model_copy(deep=True)
+        finally:
+            # 呼び出し側が途中で止めた場合(ストリームの切断等)は残りを取り消す
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending.keys(), return_exceptions=True)
+
+    async def _search(
+        self,
+        searchrequest: SearchRequest,
+        semaphore: asyncio.Semaphore,
+        group_limiter: DomainLimiter,
+        domain_limiter: DomainLimiter,
+    ) -> SearchResponse:
+        if not searchrequest.url and not searchrequest.search_keyword:
+            return SearchResponse(error_msg="URL or search keyword is required.")
+        # 同じサイトの順番待ちで全体の同時実行枠を埋めないよう、先にサイト毎の枠を取る
+        async with group_limiter(get_group_name(searchrequest)), semaphore:
+            try:
+                async with self.sessionmaker() as ses:
+                    client = SearchClient(
+                        ses=ses,
+                        searchrequest=searchrequest.model_copy(deep=True),
+                        searchcache_repository=self.searchcache_repository_factory(ses),
+                        caller_type=self.caller_type,
+                        domain_limiter=domain_limiter,
+                    )
+                    return await client.execute()
+            except Exception as e:
+                logger.error(
+                    "batch search item failed",
+                    error_type=type(e).__name__,
+                    error=str(e),
+                )
+                return SearchResponse(error_msg=str(e))
+
+
+def create_batch_search_client(
+    batchrequest: BatchSearchRequest,
+    sessionmaker: async_sessionmaker[AsyncSession],
+    searchcache_repository_factory: Callable[
+        [AsyncSession], i_cacherepo.ISearchCacheRepository
+    ],
+    caller_type: str = "",
+) -> BatchSearchClient:
+    batchopts = read_config.get_batch_search_options()
+    return BatchSearchClient(
+        batchrequest=batchrequest,
+        sessionmaker=sessionmaker,
+        searchcache_repository_factory=searchcache_repository_factory,
+        caller_type=caller_type,
+        max_concurrency=batchopts.max_concurrency,
+    )
@@ -0,0 +1,159 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+import structlog
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from common.read_config import (
+    CacheSweeperOptions,
+    get_cache_options,
+    get_cache_sweeper_options,
+)
+from databases.sql import util as db_util
+from databases.sql.cache.repository import (
+    SearchCacheMaintenanceRepository,
+    get_access_tracker,
+)
+from domain.models.cache import repository as i_cacherepo
+
+logger = structlog.get_logger(__name__)
+
+
+class CacheSweepResult(BaseModel):
+    expired_deleted: int = 0
+    evicted: int = 0
+    evicted_bytes: int = 0
+    total_bytes: int = 0
+    reclaimed_bytes: int = 0
+
+
+class CacheSweeper:
+    """
+    SQLのSearchCacheを定期的に整理する。
+    期限切れの削除、合計サイズを超えた分の古い参照順での削除、空きページの解放を行う。
+    期限切れのキャッシュはstale_while_revalidateの秒数が過ぎるまで残す。
+    """
+
+    options: CacheSweeperOptions
+    stale_while_revalidate: int
+    sessionmaker: async_sessionmaker[AsyncSession]
+    repository_factory: Callable[
+        [AsyncSession], i_cacherepo.ISearchCacheMaintenanceRepository
+    ]
+
+    def __init__(
+        self,
+        options: CacheSweeperOptions,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        repository_factory: Callable[
+            [AsyncSession], i_cacherepo.ISearchCacheMaintenanceRepository
+        ] = SearchCacheMaintenanceRepository,
+        stale_while_revalidate: int = 0,
+    ):
+        self.options = options
+        self.stale_while_revalidate = stale_while_revalidate
+        self.sessionmaker = sessionmaker
+        self.repository_factory = repository_factory
+        self._task: asyncio.Task | None = None
+        self._is_size_filled = False
+
+    async def sweep(self) -> CacheSweepResult:
+        options = self.options
+        result = CacheSweepResult()
+        async with self.sessionmaker() as ses:
+            repo = self.repository_factory(ses)
+            await repo.update_access_times(get_access_tracker().pop_all())
+            if not self._is_size_filled:
+                while await repo.fill_data_size(limit=options.batch_size):
+                    pass
+                self._is_size_filled = True
+
+            now = datetime.now(timezone.utc)
+            # 古いHTMLのキャッシュは期限切れ後もすぐに返すため残しておく
+            stale_cutoff = now - timedelta(seconds=self.stale_while_revalidate)
+            for delete_expired, cutoff in [
+                (repo.delete_expired, stale_cutoff),
+                (repo.delete_expired_parsed, now),
+            ]:
+                while True:
+                    deleted = await delete_expired(now=cutoff, limit=options.batch_size)
+                    result.expired_deleted += deleted
+                    if deleted < options.batch_size:
+                        break
+
+            total = await repo.get_total_size()
+            if options.max_total_bytes is not None:
+                while total > options.max_total_bytes:
+                    candidates = await repo.get_least_recently_used(
+                        limit=options.batch_size
+                    )
+                    if not candidates:
+                        break
+                    ids = []
+                    for id, size in candidates:
+                        if total <= options.max_total_bytes:
+                            break
+                        ids.append(id)
+                        total -= size
+                        result.evicted_bytes += size
+                    result.evicted += await repo.delete_by_ids(ids)
+            result.total_bytes = total
+
+            if options.vacuum_pages:
+                result.reclaimed_bytes = await repo.incremental_vacuum(
+                    pages=options.vacuum_pages
+                )
+        logger.info("search cache sweep finished", **result.model_dump())
+        return result
+
+    def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.exception("search cache sweep failed", error=str(e))
+            await asyncio.sleep(self.options.interval)
+
+
+_cache_sweeper: CacheSweeper | None = None
+
+
+def init_cache_sweeper():
+    global _cache_sweeper
+    options = get_cache_sweeper_options()
+    cacheopts = get_cache_options()
+    if not options.enabled or cacheopts.backend != "sql":
+        return
+    if _cache_sweeper is not None:
+        return
+    _cache_sweeper = CacheSweeper(
+        options=options,
+        sessionmaker=db_util.get_async_sessionmaker(),
+        stale_while_revalidate=cacheopts.stale_while_revalidate or 0,
+    )
+    _cache_sweeper.start()
+
+
+async def shutdown_cache_sweeper():
+    global _cache_sweeper
+    if _cache_sweeper is None:
+        return
+    await _cache_sweeper.stop()
+    _cache_sweeper = None
@@ -0,0 +1,262 @@
+import asyncio
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+
+import redis.asyncio as aredis
+import structlog
+
+from common import read_config
+from databases.redis.util import get_async_redis
+
+logger = structlog.get_logger(__name__)
+
+WAITER_LEASE_SECONDS = 15
+RECHECK_INTERVAL = 5
+
+# 先頭から順に生存確認し、期限切れ(lease無し)のtokenを取り除いた上で
+# 対象tokenの順位がlimit未満なら取得成功とする
+TRY_ACQUIRE_SCRIPT = """
+local limit = tonumber(ARGV[2])
+local entries = redis.call('LRANGE', KEYS[1], 0, -1)
+local pos = -1
+local alive = 0
+local purged = 0
+for _, t in ipairs(entries) do
+    if redis.call('EXISTS', ARGV[3] .. t) == 0 then
+        redis.call('LREM', KEYS[1], 1, t)
+        purged = purged + 1
+    else
+        if t == ARGV[1] then
+            pos = alive
+        end
+        alive = alive + 1
+    end
+end
+if purged > 0 then
+    redis.call('PUBLISH', ARGV[4], 'purged')
+end
+if pos >= 0 and pos < limit then
+    return 1
+end
+return 0
+"""
+
+
+class IDomainLock(ABC):
+    @abstractmethod
+    async def acquire(
+        self, domain: str, timeout: float, limit: int | None = None
+    ) -> str | None:
+        """
+        取得できた場合はtokenを、timeoutした場合はNoneを返す。
+        limitを指定した場合はそのドメインの同時実行数として使う
+        """
+        pass
+
+    @abstractmethod
+    async def release(self, domain: str, token: str):
+        pass
+
+
+class LocalDomainLock(IDomainLock):
+    """単一ワーカー向けのプロセス内FIFOロック"""
+
+    limit: int
+
+    def __init__(self, limit: int = 1):
+        self.limit = limit
+        self._holders: dict[str, set[str]] = {}
+        self._waiters: dict[str, deque[tuple[str, asyncio.Future]]] = {}
+        self._limits: dict[str, int] = {}
+
+    async def acquire(
+        self, domain: str, timeout: float, limit: int | None = None
+    ) -> str | None:
+        token = uuid.uuid4().hex
+        holders = self._holders.setdefault(domain, set())
+        waiters = self._waiters.setdefault(domain, deque())
+        if limit:
+            self._limits[domain] = limit
+        if len(holders) < self._get_limit(domain) and not waiters:
+            holders.add(token)
+            return token
+
+        fut = asyncio.get_running_loop().create_future()
+        waiters.append((token, fut))
+        try:
+            await asyncio.wait_for(fut, timeout=timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if fut.done() and not fut.cancelled():
+                # timeout直前に順番が回ってきていた場合は次の待機者へ渡す
+                await self.release(domain=domain, token=token)
+            else:
+                self._remove_waiter(domain=domain, token=token)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return None
+        return token
+
+    async def release(self, domain: str, token: str):
+        holders = self._holders.get(domain)
+        if holders is not None:
+            holders.discard(token)
+        self._wakeup(domain)
+
+    def _remove_waiter(self, domain: str, token: str):
+        waiters = self._waiters.get(domain)
+        if not waiters:
+            return
+        for waiter in list(waiters):
+            if waiter[0] == token:
+                waiters.remove(waiter)
+                break
+        self._wakeup(domain)
+
+    def _wakeup(self, domain: str):
+        holders = self._holders.setdefault(domain, set())
+        waiters = self._waiters.setdefault(domain, deque())
+        while waiters and len(holders) < self._get_limit(domain):
+            token, fut = waiters.popleft()
+            if fut.done():
+                continue
+            holders.add(token)
+            fut.set_result(True)
+        if not holders and not waiters:
+            del self._holders[domain]
+            del self._waiters[domain]
+            self._limits.pop(domain, None)
+
+    def _get_limit(self, domain: str) -> int:
+        return self._limits.get(domain, self.limit)
+
+
+class RedisDomainLock(IDomainLock):
+    """
+    Redisのリストを待ち行列、pub/subを解放通知として使う複数ワーカー向けのFIFOロック。
+    各tokenはTTL付きのlease keyを持ち、lease切れのtokenは待ち行列から取り除かれる。
+    取得したtokenのleaseは解放するまでhold_secondsの1/3毎に延長するため、
+    hold_secondsはダウンロードの上限ではなく、ワーカーが落ちた場合に解放されるまでの時間になる。
+    """
+
+    HEADER = "domainlock:"
+    r: aredis.Redis
+    limit: int
+    hold_seconds: int
+
+    def __init__(self, r: aredis.Redis, limit: int = 1, hold_seconds: int = 300):
+        self.r = r
+        self.limit = limit
+        self.hold_seconds = hold_seconds
+        self._try_acquire_script = self.r.register_script(TRY_ACQUIRE_SCRIPT)
+        self._renewals: dict[str, asyncio.Task] = {}
+
+    async def acquire(
+        self, domain: str, timeout: float, limit: int | None = None
+    ) -> str | None:
+        token = uuid.uuid4().hex
+        limit = limit or self.limit
+        queue_key = self._queue_key(domain)
+        channel = self._channel(domain)
+        deadline = time.monotonic() + timeout
+        async with self.r.pubsub() as pubsub:
+            await pubsub.subscribe(channel)
+            try:
+                async with self.r.pipeline(transaction=True) as pipe:
+                    pipe.set(
+                        self._lease_key(domain, token), "1", ex=WAITER_LEASE_SECONDS
+                    )
+                    pipe.rpush(queue_key, token)
+                    await pipe.execute()
+                while True:
+                    acquired = await self._try_acquire_script(
+                        keys=[queue_key],
+                        args=[token, limit, self._lease_prefix(domain), channel],
+                    )
+                    if acquired:
+                        await self.r.set(
+                            self._lease_key(domain, token), "1", ex=self.hold_seconds
+                        )
+                        self._renewals[token] = asyncio.create_task(
+                            self._renew_lease(domain=domain, token=token)
+                        )
+                        return token
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        await self._dequeue(domain=domain, token=token)
+                        return None
+                    await self.r.set(
+                        self._lease_key(domain, token), "1", ex=WAITER_LEASE_SECONDS
+                    )
+                    await pubsub.get_message(
+                        ignore_subscribe_messages=True,
+                        timeout=min(remaining, RECHECK_INTERVAL),
+                    )
+            except BaseException:
+                await self._dequeue(domain=domain, token=token)
+                raise
+
+    async def release(self, domain: str, token: str):
+        renewal = self._renewals.pop(token, None)
+        if renewal is not None:
+            renewal.cancel()
+        await self._dequeue(domain=domain, token=token)
+
+    async def _renew_lease(self, domain: str, token: str):
+        lease_key = self._lease_key(domain, token)
+        while True:
+            await asyncio.sleep(self.hold_seconds / 3)
+            try:
+                # 解放済みのleaseは作り直さない
+                renewed = await self.r.set(
+                    lease_key, "1", ex=self.hold_seconds, xx=True
+                )
+            except Exception as e:
+                logger.warning(
+                    "failed to renew domain lock", domain=domain, error=str(e)
+                )
+                continue
+            if not renewed:
+                logger.warning("domain lock lease expired", domain=domain)
+                self._renewals.pop(token, None)
+                return
+
+    async def _dequeue(self, domain: str, token: str):
+        async with self.r.pipeline(transaction=True) as pipe:
+            pipe.lrem(self._queue_key(domain), 1, token)
+            pipe.delete(self._lease_key(domain, token))
+            pipe.publish(self._channel(domain), "released")
+            await pipe.execute()
+
+    def _queue_key(self, domain: str) -> str:
+        return f"{self.HEADER}{domain}:queue"
+
+    def _lease_prefix(self, domain: str) -> str:
+        return f"{self.HEADER}{domain}:lease:"
+
+    def _lease_key(self, domain: str, token: str) -> str:
+        return self._lease_prefix(domain) + token
+
+    def _channel(self, domain: str) -> str:
+        return f"{self.HEADER}{domain}:release"
+
+
+_domain_lock: IDomainLock | None = None
+
+
+def get_domain_lock() -> IDomainLock:
+    global _domain_lock
+    if _domain_lock is not None:
+        return _domain_lock
+    lockopts = read_config.get_domain_lock_options()
+    match lockopts.backend:
+        case "redis":
+            _domain_lock = RedisDomainLock(
+                r=get_async_redis(),
+                hold_seconds=lockopts.hold_seconds,
+            )
+        case _:
+            _domain_lock = LocalDomainLock()
+    logger.debug("domain lock created", backend=lockopts.backend)
+    return _domain_lock
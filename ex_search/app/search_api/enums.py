@@ -27,5 +27,11 @@ class URLDomainStatus(AutoLowerName):
     FAILED = auto()
 
 
+class RateLimitResult(AutoLowerName):
+    OK = auto()
+    ERROR = auto()
+    THROTTLED = auto()
+
+
 class InfoName(AutoLowerName):
     CATEGORY = auto()
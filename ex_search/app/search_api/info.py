@@ -5,7 +5,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from domain.schemas.search import InfoRequest, InfoResponse
 from domain.schemas.search.info import CategoryInfo
 from domain.models.category import repository as cate_repo, command as cate_cmd
-from app.activitylog.update import UpdateActivityLog
+from app.activitylog.writer import get_update_activitylog
 from app.sofmap import category as sofmap_cate, constants as sofmap_const
 from .enums import InfoName, SupportedSiteName, ActivityName
 
@@ -30,7 +30,7 @@ class SearchInfo:
 
     async def execute(self) -> InfoResponse:
         inforeq: InfoRequest = self.inforeq
-        upactlog = UpdateActivityLog(ses=self.session)
+        upactlog = get_update_activitylog(ses=self.session)
         init_subinfo = {"request": inforeq.model_dump()}
         target_table = f"{inforeq.sitename}.{inforeq.infoname}"
         tasklog = await upactlog.create(
@@ -44,23 +44,25 @@ class SearchInfo:
         if not tasklog:
             return InfoResponse(error_msg=f"task is not created")
 
-        tasklog_id = tasklog.id
+        tasklog_target_id = tasklog.target_id
         match inforeq.sitename.lower():
             case SupportedSiteName.SOFMAP.value:
                 response = await self._get_sofmap_info()
                 if response.results and not response.error_msg:
-                    await upactlog.completed(id=tasklog_id)
+                    await upactlog.completed(target_id=tasklog_target_id)
                 elif response.results:
                     await upactlog.completed_with_error(
-                        id=tasklog_id, error_msg=response.error_msg
+                        target_id=tasklog_target_id, error_msg=response.error_msg
                     )
                 else:
-                    await upactlog.failed(id=tasklog_id, error_msg=response.error_msg)
+                    await upactlog.failed(
+                        target_id=tasklog_target_id, error_msg=response.error_msg
+                    )
                 return response
             case _:
                 error_msg = f"not supported sitename : {inforeq.sitename}"
                 await upactlog.failed(
-                    id=tasklog_id,
+                    target_id=tasklog_target_id,
                     error_msg=error_msg,
                 )
                 return InfoResponse(error_msg=error_msg)
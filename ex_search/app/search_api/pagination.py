@@ -0,0 +1,50 @@
+import math
+from urllib.parse import urlparse
+
+from sofmap.model import PageInfo as SofmapPageInfo
+from geo.model import PageInfo as GeoPageInfo
+from iosys.model import PageInfo as IosysPageInfo
+from .enums import SupportedSiteName
+
+# 検索結果のページ番号を指定するクエリパラメータ
+PAGE_PARAMS = {
+    SupportedSiteName.SOFMAP.value: "pno",
+    SupportedSiteName.GEO.value: "p",
+    SupportedSiteName.IOSYS.value: "page",
+}
+
+
+def build_page_url(url: str, page_param: str, page: int) -> str:
+    # キーワードのエンコード(shift_jis等)を崩さないよう、クエリは分解せずに置き換える
+    parsed_url = urlparse(url)
+    queries = [
+        q for q in parsed_url.query.split("&") if q and q.split("=", 1)[0] != page_param
+    ]
+    queries.append(f"{page_param}={page}")
+    return parsed_url._replace(query="&".join(queries)).geturl()
+
+
+def get_next_page_urls(
+    url: str,
+    sitename: str,
+    pageinfo: SofmapPageInfo | GeoPageInfo | IosysPageInfo | None,
+    max_pages: int,
+    max_results: int | None = None,
+    results_per_page: int = 0,
+) -> list[str]:
+    """
+    1ページ目の解析結果から続けて取得するページのURLを返す。
+    ページャーに表示されている範囲までとし、max_results件に届く分だけに絞る。
+    """
+    if not pageinfo or max_pages <= 1 or sitename not in PAGE_PARAMS:
+        return []
+    current_page = pageinfo.current_page or 1
+    last_page = min(current_page + max_pages - 1, pageinfo.max_page)
+    if max_results and results_per_page > 0:
+        needed_pages = math.ceil(max_results / results_per_page)
+        last_page = min(last_page, current_page + needed_pages - 1)
+    return [
+        pageinfo.page_urls.get(page)
+        or build_page_url(url=url, page_param=PAGE_PARAMS[sitename], page=page)
+        for page in range(current_page + 1, last_page + 1)
+    ]
@@ -0,0 +1,152 @@
+import functools
+import hashlib
+import inspect
+from datetime import datetime
+from urllib.parse import urlparse
+
+import structlog
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from common import read_config, lxml_util
+from databases.redis.util import get_async_redis
+from databases.redis.cache import repository as redis_cache_repo
+from databases.sql.cache import repository as sql_cache_repo
+from databases.sql.ai import repository as ai_repo
+from domain.models.cache import cache as c_cache, repository as i_cacherepo
+from domain.schemas.search import SearchRequest, SearchResponse
+from .enums import SupportedSiteName
+from . import pagination
+from .sites import get_gemini_label, get_site_registry
+from .singleflight import create_request_key
+
+logger = structlog.get_logger(__name__)
+
+
+def create_parsedcache_repository(
+    ses: AsyncSession,
+) -> i_cacherepo.IParsedSearchCacheRepository | None:
+    cache_options = read_config.get_cache_options()
+    if not cache_options.parsed_cache:
+        return None
+    if cache_options.backend == "redis":
+        return redis_cache_repo.ParsedSearchCacheRedisRepository(r=get_async_redis())
+    return sql_cache_repo.ParsedSearchCacheRepository(ses=ses)
+
+
+def _get_common_parser_sources() -> list:
+    """全サイトの解析結果に関わるもの。SearchClientは解析後の重複の除去やページの結合、件数の制限を行う"""
+    # searchはこのモジュールをimportするため、使う時に読み込む
+    from .search import SearchClient
+
+    return [lxml_util, pagination, SearchClient]
+
+
+@functools.cache
+def _get_module_version(sitename: str) -> str:
+    """解析と変換を行うモジュールのソースから版を作る。コードが変われば別のキャッシュになる"""
+    sha = hashlib.sha256()
+    for source in _get_common_parser_sources() + list(
+        get_site_registry().get(sitename).parser_modules
+    ):
+        sha.update(inspect.getsource(source).encode("utf-8"))
+    return sha.hexdigest()
+
+
+class ParsedSearchCacheClient:
+    """
+    解析済みのSearchResponseを(URL, サイト, パーサーの版, オプション)毎にキャッシュする。
+    パーサーが変わるとキーが変わるため、古い結果は使われずに期限で破棄される。
+    """
+
+    session: AsyncSession
+    repository: i_cacherepo.IParsedSearchCacheRepository
+    searchrequest: SearchRequest
+    converted_url: str
+
+    def __init__(
+        self,
+        ses: AsyncSession,
+        repository: i_cacherepo.IParsedSearchCacheRepository,
+        searchrequest: SearchRequest,
+        converted_url: str,
+    ):
+        self.session = ses
+        self.repository = repository
+        self.searchrequest = searchrequest
+        self.converted_url = converted_url
+
+    async def get(self) -> SearchResponse | None:
+        searchrequest = self.searchrequest
+        if searchrequest.no_cache:
+            return None
+        try:
+            cache_key, _ = await self._create_key()
+            if not cache_key:
+                return None
+            cached = await self.repository.get(cache_key=cache_key)
+            if not cached:
+                return None
+            return SearchResponse.model_validate_json(cached.response)
+        except Exception as e:
+            logger.warning("failed to get parsed search cache", error=str(e))
+            return None
+
+    async def save(self, response: SearchResponse, expires: datetime | None):
+        if not expires or response.error_msg:
+            return
+        try:
+            # geminiは解析中にパーサーが作られるため、保存時に改めてキーを作る
+            cache_key, parser_version = await self._create_key()
+            if not cache_key:
+                return
+            await self.repository.save(
+                c_cache.ParsedSearchCache(
+                    cache_key=cache_key,
+                    url=self.converted_url,
+                    sitename=self.searchrequest.sitename.lower(),
+                    parser_version=parser_version,
+                    response=response.model_dump_json(),
+                    expires=expires,
+                )
+            )
+        except Exception as e:
+            logger.warning("failed to save parsed search cache", error=str(e))
+
+    async def _create_key(self) -> tuple[str | None, str | None]:
+        parser_version = await self._get_parser_version()
+        if not parser_version:
+            return None, None
+        searchrequest = self.searchrequest
+        key = create_request_key(
+            searchrequest.model_copy(update={"no_cache": False}),
+            extra={
+                "converted_url": self.converted_url,
+                "max_pages": searchrequest.max_pages,
+                "max_results": searchrequest.max_results,
+                "parser_version": parser_version,
+            },
+        )
+        return key, parser_version
+
+    async def _get_parser_version(self) -> str | None:
+        searchrequest = self.searchrequest
+        sitename = searchrequest.sitename.lower()
+        parsed_url = urlparse(searchrequest.url)
+        site_registry = get_site_registry()
+        if site_registry.find_external_api(
+            "parser", sitename=sitename, netloc=parsed_url.netloc
+        ):
+            # 外部の解析APIは変更が分からないためキャッシュしない
+            return None
+        handler = site_registry.get(sitename)
+        if handler and handler.parser_modules:
+            return _get_module_version(sitename)
+        if sitename != SupportedSiteName.GEMINI.value:
+            return None
+        geminiopts, label = get_gemini_label(searchrequest)
+        if geminiopts.recreate_parser:
+            return None
+        active = await ai_repo.ActiveParserRepository(self.session).get(label=label)
+        if not active:
+            return None
+        return active.code_hash
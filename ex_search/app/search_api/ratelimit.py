@@ -0,0 +1,258 @@
+import asyncio
+import re
+import time
+from abc import ABC, abstractmethod
+
+import redis.asyncio as aredis
+import structlog
+
+from common import read_config
+from databases.redis.util import get_async_redis
+from .enums import RateLimitResult
+
+logger = structlog.get_logger(__name__)
+
+# サイト側の制限と見なすHTTPステータス
+THROTTLE_STATUS_CODES = (403, 429, 503)
+# httpxのエラーメッセージは "Client error '429 Too Many Requests' for url ..." の形になる
+THROTTLE_MESSAGE_PATTERN = re.compile(
+    r"\b(?:" + "|".join(str(code) for code in THROTTLE_STATUS_CODES) + r") [A-Z]"
+)
+
+# トークンを補充してから1つ取り出す。取り出せない場合は次のトークンまでの秒数を返す。
+# 時刻はワーカー間で揃えるためRedisのTIMEを使う。
+# Luaの数値はそのまま返すと整数に丸められるため文字列で返す
+TRY_ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local base_rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'rate')
+local rate = math.min(tonumber(state[3]) or base_rate, base_rate)
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now), 'rate', tostring(rate))
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return tostring(wait)
+"""
+
+# 結果を記録してrateを調整する。ARGV[1]は"ok","error","throttled"のいずれか
+RECORD_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local base_rate = tonumber(ARGV[2])
+local min_rate = math.min(tonumber(ARGV[3]), base_rate)
+local backoff_factor = tonumber(ARGV[4])
+local increase_step = tonumber(ARGV[5])
+local window_size = tonumber(ARGV[6])
+local error_ratio = tonumber(ARGV[7])
+local state = redis.call('HMGET', KEYS[1], 'rate', 'success', 'failure')
+local rate = math.min(tonumber(state[1]) or base_rate, base_rate)
+local success = tonumber(state[2]) or 0
+local failure = tonumber(state[3]) or 0
+if ARGV[1] == 'throttled' then
+    rate = math.max(min_rate, rate * backoff_factor)
+    redis.call('HSET', KEYS[1], 'tokens', '0', 'ts', tostring(now))
+    success = 0
+    failure = 0
+else
+    if ARGV[1] == 'ok' then
+        success = success + 1
+    else
+        failure = failure + 1
+    end
+    if success + failure >= window_size then
+        if failure / (success + failure) >= error_ratio then
+            rate = math.max(min_rate, rate * backoff_factor)
+        else
+            rate = math.min(base_rate, rate + base_rate * increase_step)
+        end
+        success = 0
+        failure = 0
+    end
+end
+redis.call('HSET', KEYS[1], 'rate', tostring(rate), 'success', success, 'failure', failure)
+redis.call('EXPIRE', KEYS[1], ARGV[8])
+return tostring(rate)
+"""
+
+
+def is_throttled_message(msg: str | None) -> bool:
+    """ダウンロードのエラーメッセージにサイト側の制限を示すステータスが含まれるか"""
+    if not msg:
+        return False
+    return THROTTLE_MESSAGE_PATTERN.search(str(msg)) is not None
+
+
+class IDomainRateLimiter(ABC):
+    """
+    ドメイン毎のトークンバケット。
+    429等の応答やエラーの割合が高い場合はrateを下げ、成功が続くと設定値まで戻す
+    """
+
+    async def acquire(self, domain: str, timeout: float) -> bool:
+        """トークンを取得できるまで待つ。timeoutした場合はFalseを返す"""
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = await self._try_acquire(domain)
+            if wait <= 0:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining < wait:
+                return False
+            await asyncio.sleep(wait)
+
+    @abstractmethod
+    async def _try_acquire(self, domain: str) -> float:
+        """取得できた場合は0を、できない場合は次に取得できるまでの秒数を返す"""
+        pass
+
+    @abstractmethod
+    async def record(self, domain: str, result: RateLimitResult) -> float:
+        """ダウンロードの結果を記録し、調整後のrateを返す"""
+        pass
+
+
+class _LocalBucket:
+    rate: float
+    tokens: float
+    ts: float
+    success: int
+    failure: int
+
+    def __init__(self, rate: float, burst: int, now: float):
+        self.rate = rate
+        self.tokens = burst
+        self.ts = now
+        self.success = 0
+        self.failure = 0
+
+
+class LocalDomainRateLimiter(IDomainRateLimiter):
+    """単一ワーカー向け。RedisDomainRateLimiterのスクリプトと同じ計算をプロセス内で行う"""
+
+    def __init__(self):
+        self._buckets: dict[str, _LocalBucket] = {}
+
+    def _get_bucket(self, domain: str, base_rate: float, burst: int, now: float):
+        bucket = self._buckets.get(domain)
+        if bucket is None:
+            bucket = self._buckets[domain] = _LocalBucket(
+                rate=base_rate, burst=burst, now=now
+            )
+        bucket.rate = min(bucket.rate, base_rate)
+        return bucket
+
+    async def _try_acquire(self, domain: str) -> float:
+        domainopts = read_config.get_rate_limit_options().get_domain(domain)
+        now = time.monotonic()
+        bucket = self._get_bucket(
+            domain, base_rate=domainopts.rate, burst=domainopts.burst, now=now
+        )
+        bucket.tokens = min(
+            domainopts.burst,
+            bucket.tokens + max(0.0, now - bucket.ts) * bucket.rate,
+        )
+        bucket.ts = now
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return 0
+        return (1 - bucket.tokens) / bucket.rate
+
+    async def record(self, domain: str, result: RateLimitResult) -> float:
+        rateopts = read_config.get_rate_limit_options()
+        domainopts = rateopts.get_domain(domain)
+        base_rate = domainopts.rate
+        min_rate = min(rateopts.min_rate, base_rate)
+        now = time.monotonic()
+        bucket = self._get_bucket(
+            domain, base_rate=base_rate, burst=domainopts.burst, now=now
+        )
+        if result == RateLimitResult.THROTTLED:
+            bucket.rate = max(min_rate, bucket.rate * rateopts.backoff_factor)
+            bucket.tokens = 0
+            bucket.ts = now
+            bucket.success = 0
+            bucket.failure = 0
+            return bucket.rate
+        if result == RateLimitResult.OK:
+            bucket.success += 1
+        else:
+            bucket.failure += 1
+        total = bucket.success + bucket.failure
+        if total >= rateopts.window_size:
+            if bucket.failure / total >= rateopts.error_ratio:
+                bucket.rate = max(min_rate, bucket.rate * rateopts.backoff_factor)
+            else:
+                bucket.rate = min(
+                    base_rate, bucket.rate + base_rate * rateopts.increase_step
+                )
+            bucket.success = 0
+            bucket.failure = 0
+        return bucket.rate
+
+
+class RedisDomainRateLimiter(IDomainRateLimiter):
+    """複数ワーカー向け。バケットの状態をRedisのハッシュに置き、Luaスクリプトで更新する"""
+
+    HEADER = "ratelimit:"
+    r: aredis.Redis
+
+    def __init__(self, r: aredis.Redis):
+        self.r = r
+        self._try_acquire_script = self.r.register_script(TRY_ACQUIRE_SCRIPT)
+        self._record_script = self.r.register_script(RECORD_SCRIPT)
+
+    async def _try_acquire(self, domain: str) -> float:
+        rateopts = read_config.get_rate_limit_options()
+        domainopts = rateopts.get_domain(domain)
+        wait = await self._try_acquire_script(
+            keys=[self._create_key(domain)],
+            args=[domainopts.rate, domainopts.burst, rateopts.state_seconds],
+        )
+        return float(wait)
+
+    async def record(self, domain: str, result: RateLimitResult) -> float:
+        rateopts = read_config.get_rate_limit_options()
+        domainopts = rateopts.get_domain(domain)
+        rate = await self._record_script(
+            keys=[self._create_key(domain)],
+            args=[
+                result.value,
+                domainopts.rate,
+                rateopts.min_rate,
+                rateopts.backoff_factor,
+                rateopts.increase_step,
+                rateopts.window_size,
+                rateopts.error_ratio,
+                rateopts.state_seconds,
+            ],
+        )
+        return float(rate)
+
+    def _create_key(self, domain: str) -> str:
+        return f"{self.HEADER}{domain}"
+
+
+_rate_limiter: IDomainRateLimiter | None = None
+
+
+def get_rate_limiter() -> IDomainRateLimiter:
+    global _rate_limiter
+    if _rate_limiter is not None:
+        return _rate_limiter
+    rateopts = read_config.get_rate_limit_options()
+    match rateopts.backend:
+        case "redis":
+            _rate_limiter = RedisDomainRateLimiter(r=get_async_redis())
+        case _:
+            _rate_limiter = LocalDomainRateLimiter()
+    logger.debug("domain rate limiter created", backend=rateopts.backend)
+    return _rate_limiter
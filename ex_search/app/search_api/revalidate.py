@@ -0,0 +1,97 @@
+import asyncio
+from typing import Awaitable, Callable
+
+import structlog
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from common.read_config import get_cache_options
+from databases.redis.util import get_async_redis
+from databases.redis.cache import repository as redis_cache_repo
+from databases.sql.cache import repository as sql_cache_repo
+from domain.models.cache import repository as i_cacherepo
+from .singleflight import SingleFlight, get_singleflight
+
+logger = structlog.get_logger(__name__)
+
+
+def create_searchcache_repository(
+    ses: AsyncSession,
+) -> i_cacherepo.ISearchCacheRepository:
+    cache_options = get_cache_options()
+    if cache_options.backend == "redis":
+        expiry_seconds = cache_options.expires
+        if expiry_seconds and cache_options.stale_while_revalidate:
+            # 期限切れのキャッシュを返せるよう猶予の分だけ長く残す
+            expiry_seconds += cache_options.stale_while_revalidate
+        return redis_cache_repo.SearchCacheRedisRepository(
+            r=get_async_redis(), expiry_seconds=expiry_seconds
+        )
+    return sql_cache_repo.SearchCacheRepository(ses=ses)
+
+
+class RevalidateResult(BaseModel):
+    error_msg: str | None = None
+
+
+class CacheRevalidator:
+    """
+    期限切れのキャッシュを返した後のダウンロードし直しを裏で実行する。
+    同じキーの更新はワーカー内ではタスク、ワーカー間ではSingleFlightで1つにまとめる。
+    """
+
+    singleflight: SingleFlight
+
+    def __init__(self, singleflight: SingleFlight):
+        self.singleflight = singleflight
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    def revalidate(
+        self, key: str, func: Callable[[], Awaitable[RevalidateResult]]
+    ) -> asyncio.Task | None:
+        """更新を開始したタスクを返す。既に更新中の場合はNoneを返す"""
+        if key in self._tasks:
+            return None
+        task = asyncio.create_task(self._run(key=key, func=func))
+        self._tasks[key] = task
+        task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return task
+
+    async def shutdown(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def _run(
+        self, key: str, func: Callable[[], Awaitable[RevalidateResult]]
+    ) -> RevalidateResult:
+        try:
+            result = await self.singleflight.do(key=key, func=func)
+        except Exception as e:
+            logger.exception("failed to revalidate search cache", error=str(e))
+            return RevalidateResult(error_msg=str(e))
+        if result.error_msg:
+            logger.warning("failed to revalidate search cache", error=result.error_msg)
+        return result
+
+
+_cache_revalidator: CacheRevalidator | None = None
+
+
+def get_cache_revalidator() -> CacheRevalidator:
+    global _cache_revalidator
+    if _cache_revalidator is None:
+        _cache_revalidator = CacheRevalidator(
+            singleflight=get_singleflight(RevalidateResult)
+        )
+    return _cache_revalidator
+
+
+async def shutdown_cache_revalidator():
+    global _cache_revalidator
+    if _cache_revalidator is None:
+        return
+    await _cache_revalidator.shutdown()
+    _cache_revalidator = None
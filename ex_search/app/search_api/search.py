@@ -1,10 +1,12 @@
-from typing import Callable
+from typing import AsyncContextManager, Awaitable, Callable
+import contextlib
 from urllib.parse import urlparse
 from datetime import datetime, timezone, timedelta
 import uuid
 import asyncio
 import time
 import httpx
+import structlog
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
@@ -13,6 +15,7 @@ from common import read_config
 from domain.schemas.search import (
     SearchRequest,
     SearchResponse,
+    SearchResults,
     AskGeminiOptions,
     SofmapOptions,
     DownloadRequest,
@@ -25,31 +28,41 @@ from domain.models.cache import (
     repository as i_cacherepo,
 )
 from domain.models.activitylog import enums as act_enums
-from databases.redis.util import get_async_redis
-from app.sofmap import (
-    web_scraper as sofmap_scraper,
-    model_convert as sofmap_modelconvert,
-    urlgenerate as sofmap_urlgenerate,
-    category as sofmap_category,
-    tasks as sofmap_tasks,
+from databases.sql import util as db_util
+from app.downloader.http_client import get_shared_transport
+from app.downloader.circuitbreaker import (
+    CircuitOpenError,
+    domain_circuit_name,
+    external_api_circuit_name,
+    get_circuit_breaker,
+    is_backend_error,
 )
-from app.geo import (
-    urlgenerate as geo_urlgenerate,
-    web_scraper as geo_scraper,
-    model_convert as geo_modelconvert,
-    tasks as geo_tasks,
+from app.activitylog.writer import get_update_activitylog
+from app.metrics import count_cache, observe_stage, track_in_flight
+from .enums import ActivityName, RateLimitResult
+from .domainlock import IDomainLock, get_domain_lock
+from .ratelimit import (
+    IDomainRateLimiter,
+    THROTTLE_STATUS_CODES,
+    get_rate_limiter,
+    is_throttled_message,
 )
-from app.iosys import (
-    urlgenerate as iosys_urlgenerate,
-    web_scraper as iosys_scraper,
-    model_convert as iosys_modelconvert,
+from .singleflight import get_singleflight, create_request_key
+from .revalidate import (
+    RevalidateResult,
+    create_searchcache_repository,
+    get_cache_revalidator,
 )
-from app.gemini_api import web_scraper as gemini_webscraper
-from app.activitylog.update import UpdateActivityLog
-from .enums import SuppoertedDomain, SupportedSiteName, ActivityName, URLDomainStatus
-from .repository import URLDomainCacheRepository
+from .parsedcache import ParsedSearchCacheClient, create_parsedcache_repository
+from .sites import SiteHandler, get_site_registry
+from . import pagination
 
-CYCLE_WAIT_TIME = 1.5
+logger = structlog.get_logger(__name__)
+
+
+class SearchFlightResult(BaseModel):
+    response: SearchResponse
+    failed_msg: str | None = None
 
 
 class SearchClient:
@@ -57,6 +70,12 @@ class SearchClient:
     searchrequest: SearchRequest
     caller_type: str
     searchcache_repository: i_cacherepo.ISearchCacheRepository
+    domain_limiter: Callable[[str], AsyncContextManager] | None
+    page_callback: Callable[[SearchResults], Awaitable[None]] | None
+    parsedcache_repository_factory: Callable[
+        [AsyncSession], i_cacherepo.IParsedSearchCacheRepository | None
+    ]
+    parsedcache: ParsedSearchCacheClient | None
 
     def __init__(
         self,
@@ -64,22 +83,45 @@ class SearchClient:
         searchrequest: SearchRequest,
         searchcache_repository: i_cacherepo.ISearchCacheRepository,
         caller_type: str = "",
+        domain_limiter: Callable[[str], AsyncContextManager] | None = None,
+        page_callback: Callable[[SearchResults], Awaitable[None]] | None = None,
+        parsedcache_repository_factory: Callable[
+            [AsyncSession], i_cacherepo.IParsedSearchCacheRepository | None
+        ] = create_parsedcache_repository,
     ):
+        """
+        page_callback : 複数ページ取得時、解析できたページ毎の結果を受け取る。
+        ページ単位で渡すため、ページをまたいだ重複除去は反映されない。
+        parsedcache_repository_factory : 解析済みの結果のキャッシュ。Noneを返すと使わない。
+        """
         self.session = ses
         self.searchrequest = searchrequest
         self.caller_type = caller_type
         self.searchcache_repository = searchcache_repository
+        self.domain_limiter = domain_limiter
+        self.page_callback = page_callback
+        self.parsedcache_repository_factory = parsedcache_repository_factory
+        self.parsedcache = None
+        self._is_stale = False
 
     async def execute(self) -> SearchResponse:
+        with observe_stage("search", sitename=self.searchrequest.sitename) as labels:
+            response = await self._execute()
+            if self.searchrequest.url:
+                labels["domain"] = urlparse(self.searchrequest.url).netloc
+            return response
+
+    async def _execute(self) -> SearchResponse:
         searchrequest: SearchRequest = self.searchrequest
-        upactlog = UpdateActivityLog(ses=self.session)
+        upactlog = get_update_activitylog(ses=self.session)
         init_subinfo = {"request": searchrequest.model_dump(exclude_none=True)}
         if searchrequest.search_keyword:
             urlgenerator = KeyWordToURL(ses=self.session, searchrequest=searchrequest)
             if searchrequest.url:
                 init_subinfo["init_url"] = searchrequest.url
             try:
-                searchrequest.url = await urlgenerator.execute()
+                with observe_stage("url_generation", sitename=searchrequest.sitename):
+                    searchrequest.url = await urlgenerator.execute()
             except Exception as e:
                 await upactlog.create(
                     target_id=str(uuid.uuid4()),
@@ -106,21 +148,15 @@ class SearchClient:
             )
             return SearchResponse(error_msg=error_msg)
 
-        match parsed_url.netloc:
-            case SuppoertedDomain.SOFMAP.value | SuppoertedDomain.A_SOFMAP.value:
-                if (
-                    isinstance(searchrequest.options, SofmapOptions)
-                    and searchrequest.options.convert_to_direct_search
-                ):
-                    converted_url = sofmap_urlgenerate.convert_to_direct_search(
-                        url=searchrequest.url
-                    )
-                    if searchrequest.url != converted_url:
-                        init_subinfo["convert_to"] = converted_url
-                else:
-                    converted_url = searchrequest.url
-            case _:
-                converted_url = searchrequest.url
+        domain_handler = get_site_registry().get_by_netloc(parsed_url.netloc)
+        if domain_handler is not None:
+            converted_url = domain_handler.convert_url(
+                url=searchrequest.url, options=searchrequest.options
+            )
+            if searchrequest.url != converted_url:
+                init_subinfo["convert_to"] = converted_url
+        else:
+            converted_url = searchrequest.url
 
         tasklog = await upactlog.create(
             target_id=str(uuid.uuid4()),
@@ -133,36 +169,96 @@ class SearchClient:
         if not tasklog:
             return SearchResponse(error_msg=f"task is not created")
 
-        tasklog_id = tasklog.id
+        tasklog_target_id = tasklog.target_id
+        parsedcache_repository = self.parsedcache_repository_factory(self.session)
+        if parsedcache_repository is not None:
+            self.parsedcache = ParsedSearchCacheClient(
+                ses=self.session,
+                repository=parsedcache_repository,
+                searchrequest=searchrequest,
+                converted_url=converted_url,
+            )
+            with observe_stage(
+                "parsed_cache_get",
+                sitename=searchrequest.sitename,
+                domain=parsed_url.netloc,
+            ):
+                cached_response = await self.parsedcache.get()
+            if not searchrequest.no_cache:
+                count_cache("parsed", "miss" if cached_response is None else "hit")
+            if cached_response is not None:
+                await upactlog.completed(
+                    target_id=tasklog_target_id, add_subinfo={"parsed_cache": True}
+                )
+                return cached_response
+
+        downloadrequest = DownloadRequest(
+            **searchrequest.model_dump(exclude={"search_keyword"})
+        )
+        if self.domain_limiter is not None:
+            limiter = self.domain_limiter(urlparse(converted_url).netloc)
+        else:
+            limiter = contextlib.nullcontext()
+        async with limiter:
+            flight_result = await get_singleflight(SearchFlightResult).do(
+                key=create_request_key(
+                    downloadrequest,
+                    extra={
+                        "max_pages": searchrequest.max_pages,
+                        "max_results": searchrequest.max_results,
+                        "max_stale": searchrequest.max_stale,
+                    },
+                ),
+                func=lambda: self._download_and_parse(
+                    downloadrequest=downloadrequest,
+                    converted_url=converted_url,
+                ),
+            )
+        if flight_result.failed_msg is not None:
+            await upactlog.failed(
+                target_id=tasklog_target_id,
+                error_msg=flight_result.failed_msg,
+            )
+        elif flight_result.response.stale:
+            await upactlog.completed(
+                target_id=tasklog_target_id, add_subinfo={"stale": True}
+            )
+        else:
+            await upactlog.completed(target_id=tasklog_target_id)
+        return flight_result.response
+
+    async def _download_and_parse(
+        self, downloadrequest: DownloadRequest, converted_url: str
+    ) -> SearchFlightResult:
+        searchrequest: SearchRequest = self.searchrequest
+        parsed_url = urlparse(searchrequest.url)
         downloader = HTMLDownloader(
-            downloadrequest=DownloadRequest(
-                **searchrequest.model_dump(exclude={"search_keyword"})
-            ),
+            downloadrequest=downloadrequest,
             searchcache_repository=self.searchcache_repository,
             converted_url=converted_url,
         )
         ok, result = await downloader.execute()
         if not ok:
-            await upactlog.failed(
-                id=tasklog_id,
-                error_msg=result.error_msg,
-            )
-            return SearchResponse(
-                error_msg=result.error_msg, redirect_url=result.redirect_url
+            return SearchFlightResult(
+                response=SearchResponse(
+                    error_msg=result.error_msg, redirect_url=result.redirect_url
+                ),
+                failed_msg=result.error_msg,
             )
+        if result.is_stale:
+            self._is_stale = True
 
         redirect_url = result.redirect_url
         if redirect_url:
             if await self._stop_on_redirect(
                 searchreq=searchrequest, redirect_url=redirect_url
             ):
-                await upactlog.failed(
-                    id=tasklog_id,
-                    error_msg=f"stopped on redirect. redirect_url:{redirect_url}",
-                )
-                return SearchResponse(
-                    error_msg=f"stopped on redirect. redirect_url:{redirect_url}",
-                    redirect_url=redirect_url,
+                error_msg = f"stopped on redirect. redirect_url:{redirect_url}"
+                return SearchFlightResult(
+                    response=SearchResponse(
+                        error_msg=error_msg, redirect_url=redirect_url
+                    ),
+                    failed_msg=error_msg,
                 )
         add_subinfo = {}
         if (
@@ -176,20 +272,26 @@ class SearchClient:
             add_subinfo["remove_duplicates"] = False
 
         sitename = searchrequest.sitename.lower()
-        ext_api_config = read_config.get_external_api_config().get("parser", {})
-        if sitename == SupportedSiteName.GEMINI.value:
-            target_api = ext_api_config.get(parsed_url.netloc)
-        else:
-            target_api = ext_api_config.get(sitename) or ext_api_config.get(
-                parsed_url.netloc
-            )
-        if target_api and target_api.get("url"):
+        site_registry = get_site_registry()
+        target_api = site_registry.find_external_api(
+            "parser", sitename=sitename, netloc=parsed_url.netloc
+        )
+        handler = site_registry.get(sitename)
+        if target_api:
             if target_api.get("timeout"):
                 timeout = target_api["timeout"]
             else:
                 timeout = 10
             try:
-                async with httpx.AsyncClient() as client:
+                async with (
+                    get_circuit_breaker().guard(
+                        external_api_circuit_name(target_api["url"]),
+                        is_failure=is_backend_error,
+                    ),
+                    httpx.AsyncClient(
+                        transport=get_shared_transport(target_api["url"])
+                    ) as client,
+                ):
                     payload = {
                         "html": result.searchcache.download_text,
                         "url": searchrequest.url,
@@ -199,111 +301,70 @@ class SearchClient:
                             else searchrequest.options
                         ),
                     }
-                    resp = await client.post(
-                        target_api["url"], json=payload, timeout=timeout
-                    )
+                    with observe_stage(
+                        "parse", sitename=sitename, domain=parsed_url.netloc
+                    ):
+                        resp = await client.post(
+                            target_api["url"], json=payload, timeout=timeout
+                        )
                     resp.raise_for_status()
                     response = SearchResponse(**resp.json())
                     response.redirect_url = redirect_url
             except Exception as e:
-                await upactlog.failed(
-                    id=tasklog_id,
-                    error_msg=f"external parser error: {str(e)} error_type: {type(e).__name__} target_api: {target_api}",
+                error_msg = f"external parser error: {str(e)} error_type: {type(e).__name__} target_api: {target_api}"
+                return SearchFlightResult(
+                    response=SearchResponse(
+                        error_msg=error_msg, redirect_url=redirect_url
+                    ),
+                    failed_msg=error_msg,
                 )
-                return SearchResponse(
-                    error_msg=f"external parser error: {str(e)} error_type: {type(e).__name__} target_api: {target_api}",
+        elif handler is None:
+            return SearchFlightResult(
+                response=SearchResponse(
+                    error_msg=f"not supported domain : {parsed_url.netloc}",
                     redirect_url=redirect_url,
-                )
+                ),
+                failed_msg=f"parse error. not supported domain :{parsed_url.netloc}",
+            )
+        elif handler.is_paginated:
+            response = await self._parse_pages(
+                sitename=sitename,
+                html=result.searchcache.download_text,
+                downloadrequest=downloadrequest,
+                remove_duplicates=remove_duplicates,
+            )
+            response.redirect_url = redirect_url
         else:
-            match sitename:
-                case SupportedSiteName.SOFMAP.value:
-                    parsed_result = await sofmap_scraper.parse_html(
-                        html=result.searchcache.download_text, url=searchrequest.url
-                    )
-                    sresults = sofmap_modelconvert.ModelConverter.parseresults_to_searchresults(
-                        results=parsed_result, remove_duplicates=remove_duplicates
-                    )
-                    response = SearchResponse(**sresults.model_dump())
-                    response.redirect_url = redirect_url
-                case SupportedSiteName.GEO.value:
-                    parsed_result = await geo_scraper.parse_html(
-                        html=result.searchcache.download_text, url=searchrequest.url
-                    )
-                    sresults = (
-                        geo_modelconvert.ModelConverter.parseresults_to_searchresults(
-                            results=parsed_result
-                        )
-                    )
-                    response = SearchResponse(**sresults.model_dump())
-                    response.redirect_url = redirect_url
-                case SupportedSiteName.IOSYS.value:
-                    parsed_result = await iosys_scraper.parse_html(
-                        html=result.searchcache.download_text, url=searchrequest.url
-                    )
-                    sresults = (
-                        iosys_modelconvert.ModelConverter.parseresults_to_searchresults(
-                            results=parsed_result
-                        )
-                    )
-                    response = SearchResponse(**sresults.model_dump())
-                    response.redirect_url = redirect_url
-                case SupportedSiteName.GEMINI.value:
-                    if isinstance(searchrequest.options, AskGeminiOptions):
-                        geminiopts = searchrequest.options
-                    else:
-                        geminiopts = AskGeminiOptions(**searchrequest.options)
-                    p_sitename = geminiopts.sitename or parsed_url.netloc
-                    label = (
-                        geminiopts.label
-                        or parsed_url._replace(
-                            params="", query="", fragment=""
-                        ).geturl()
+            try:
+                with observe_stage(
+                    "parse", sitename=sitename, domain=parsed_url.netloc
+                ):
+                    sresults = await handler.parse_search(
+                        ses=self.session,
+                        searchrequest=searchrequest,
+                        html=result.searchcache.download_text,
+                        remove_duplicates=remove_duplicates,
                     )
-                    try:
-                        sresults = await gemini_webscraper.parse_html_and_convert(
-                            html=result.searchcache.download_text,
-                            url=searchrequest.url,
-                            label=label,
-                            session=self.session,
-                            sitename=p_sitename,
-                            remove_duplicates=remove_duplicates,
-                            recreate=geminiopts.recreate_parser,
-                            exclude_script=geminiopts.exclude_script,
-                            compress_whitespace=geminiopts.compress_whitespace,
-                            prompt=geminiopts.prompt,
-                        )
-                    except Exception as e:
-                        await upactlog.failed(
-                            id=tasklog_id,
-                            error_msg=f"parse error. {type(e).__name__}, {e}",
-                        )
-                        response = SearchResponse(
-                            error_msg=f"parse error. {type(e).__name__}, {e}",
-                            redirect_url=redirect_url,
-                        )
-                        return response
+            except Exception as e:
+                error_msg = f"parse error. {type(e).__name__}, {e}"
+                return SearchFlightResult(
+                    response=SearchResponse(
+                        error_msg=error_msg, redirect_url=redirect_url
+                    ),
+                    failed_msg=error_msg,
+                )
 
-                    if not sresults:
-                        await upactlog.failed(
-                            id=tasklog_id,
-                            error_msg=f"parse error. sresults is None",
-                        )
-                        return SearchResponse(
-                            error_msg="parse error. sresults is None",
-                            redirect_url=redirect_url,
-                        )
+            if not sresults:
+                error_msg = "parse error. sresults is None"
+                return SearchFlightResult(
+                    response=SearchResponse(
+                        error_msg=error_msg, redirect_url=redirect_url
+                    ),
+                    failed_msg=error_msg,
+                )
 
-                    response = SearchResponse(**sresults.model_dump())
-                    response.redirect_url = redirect_url
-                case _:
-                    await upactlog.failed(
-                        id=tasklog_id,
-                        error_msg=f"parse error. not supported domain :{parsed_url.netloc}",
-                    )
-                    return SearchResponse(
-                        error_msg=f"not supported domain : {parsed_url.netloc}",
-                        redirect_url=redirect_url,
-                    )
+            response = SearchResponse(**sresults.model_dump())
+            response.redirect_url = redirect_url
 
         if not result.searchcache.id:
             cacheopts = read_config.get_cache_options()
@@ -315,8 +376,133 @@ class SearchClient:
                 await downloader._set_search_cache(
                     searchcache=result.searchcache,
                 )
-        await upactlog.completed(id=tasklog_id)
-        return response
+        if searchrequest.max_results:
+            response.results = response.results[: searchrequest.max_results]
+        if self._is_stale:
+            response.stale = True
+        elif self.parsedcache is not None:
+            # 元のHTMLのキャッシュと同じ期限にする
+            with observe_stage(
+                "parsed_cache_save", sitename=sitename, domain=parsed_url.netloc
+            ):
+                await self.parsedcache.save(
+                    response=response, expires=result.searchcache.expires
+                )
+        return SearchFlightResult(response=response)
+
+    async def _parse_pages(
+        self,
+        sitename: str,
+        html: str,
+        downloadrequest: DownloadRequest,
+        remove_duplicates: bool,
+    ) -> SearchResponse:
+        searchrequest: SearchRequest = self.searchrequest
+        first_page = await self._parse_html(
+            sitename=sitename, html=html, url=searchrequest.url
+        )
+        await self._notify_page(
+            sitename=sitename,
+            parsed_result=first_page,
+            remove_duplicates=remove_duplicates,
+        )
+        page_urls = pagination.get_next_page_urls(
+            url=searchrequest.url,
+            sitename=sitename,
+            pageinfo=first_page.pageinfo,
+            max_pages=searchrequest.max_pages,
+            max_results=searchrequest.max_results,
+            results_per_page=len(first_page.results),
+        )
+        next_pages = await asyncio.gather(
+            *[
+                self._download_and_parse_page(
+                    sitename=sitename,
+                    page_url=page_url,
+                    downloadrequest=downloadrequest,
+                    remove_duplicates=remove_duplicates,
+                )
+                for page_url in page_urls
+            ]
+        )
+        for next_page in next_pages:
+            if next_page:
+                first_page.results.extend(next_page.results)
+        sresults = self._convert_results(
+            sitename=sitename,
+            parsed_result=first_page,
+            remove_duplicates=remove_duplicates,
+        )
+        return SearchResponse(**sresults.model_dump())
+
+    async def _download_and_parse_page(
+        self,
+        sitename: str,
+        page_url: str,
+        downloadrequest: DownloadRequest,
+        remove_duplicates: bool,
+    ):
+        page_request = downloadrequest.model_copy(update={"url": page_url})
+        converted_url = self._get_handler(sitename).convert_url(
+            url=page_url, options=downloadrequest.options
+        )
+        downloader = HTMLDownloader(
+            downloadrequest=page_request,
+            searchcache_repository=self.searchcache_repository,
+            converted_url=converted_url,
+        )
+        ok, result = await downloader.execute()
+        if not ok:
+            logger.warning(
+                "failed to download page", url=page_url, error=result.error_msg
+            )
+            return None
+        if result.is_stale:
+            self._is_stale = True
+        parsed_result = await self._parse_html(
+            sitename=sitename, html=result.searchcache.download_text, url=page_url
+        )
+        await self._notify_page(
+            sitename=sitename,
+            parsed_result=parsed_result,
+            remove_duplicates=remove_duplicates,
+        )
+        if not result.searchcache.id:
+            cacheopts = read_config.get_cache_options()
+            if cacheopts.expires:
+                result.searchcache.expires = datetime.now(timezone.utc) + timedelta(
+                    seconds=cacheopts.expires
+                )
+                await downloader._set_search_cache(searchcache=result.searchcache)
+        return parsed_result
+
+    def _get_handler(self, sitename: str) -> SiteHandler:
+        handler = get_site_registry().get(sitename)
+        if handler is None:
+            raise ValueError(f"not supported sitename : {sitename}")
+        return handler
+
+    async def _parse_html(self, sitename: str, html: str, url: str):
+        with observe_stage("parse", sitename=sitename, domain=urlparse(url).netloc):
+            return await self._get_handler(sitename).parse_html(html=html, url=url)
+
+    def _convert_results(
+        self, sitename: str, parsed_result, remove_duplicates: bool
+    ) -> SearchResults:
+        return self._get_handler(sitename).convert_results(
+            parsed_result=parsed_result, remove_duplicates=remove_duplicates
+        )
+
+    async def _notify_page(self, sitename: str, parsed_result, remove_duplicates: bool):
+        if self.page_callback is None:
+            return
+        await self.page_callback(
+            self._convert_results(
+                sitename=sitename,
+                parsed_result=parsed_result.model_copy(deep=True),
+                remove_duplicates=remove_duplicates,
+            )
+        )
 
     async def _is_redirect(self, searchreq: SearchRequest, redirect_url: str):
         if not redirect_url or not searchreq.url or searchreq.url == redirect_url:
@@ -374,6 +560,7 @@ class DownLoadResult(BaseModel):
     searchcache: c_cache.SearchCache | None = None
     error_msg: str | None = None
     redirect_url: str | None = None
+    is_stale: bool = False
 
 
 class HTMLDownloader:
@@ -398,48 +585,118 @@ class HTMLDownloader:
 
     async def execute(self):
         dlreq: DownloadRequest = self.downloadrequest
-        target_url = self.target_url
-        converted_url = self.converted_url
-
-        parsed_url = urlparse(target_url)
+        parsed_url = urlparse(self.target_url)
         if not dlreq.no_cache:
-            searchcache = await self._get_search_cache()
+            with observe_stage(
+                "cache_get", sitename=dlreq.sitename, domain=parsed_url.netloc
+            ):
+                searchcache = await self._get_search_cache()
             if searchcache and searchcache.download_text:
+                if self._is_expired(searchcache):
+                    count_cache("search", "stale")
+                    self._revalidate()
+                    return True, DownLoadResult(searchcache=searchcache, is_stale=True)
+                count_cache("search", "hit")
                 return True, DownLoadResult(searchcache=searchcache)
+            count_cache("search", "miss")
+
+        circuitbreaker = get_circuit_breaker()
+        circuit_name = domain_circuit_name(parsed_url.netloc)
+        # 障害中のドメインは待ち行列に並ばずにすぐ失敗させる。
+        # half_openの試行の枠は待った後に取るため、ここでは状態を見るだけにする
+        retry_after = await circuitbreaker.peek(circuit_name)
+        if retry_after > 0:
+            return False, DownLoadResult(
+                error_msg=str(
+                    CircuitOpenError(name=circuit_name, retry_after=retry_after)
+                )
+            )
 
         dl_waittimeopts = read_config.get_download_waittime_options()
-        domainrepo = await self._create_URLDomainCacheRepository()
-        ok, msg = await self._wait_downloadable(
-            domain=parsed_url.netloc,
-            repository=domainrepo,
-            timeout_util_downloadable=dl_waittimeopts.timeout_util_downloadable,
-        )
+        domainopts = read_config.get_rate_limit_options().get_domain(parsed_url.netloc)
+        domainlock = get_domain_lock()
+        start = time.monotonic()
+        with observe_stage(
+            "domain_lock_wait", sitename=dlreq.sitename, domain=parsed_url.netloc
+        ):
+            ok, msg, token = await self._wait_downloadable(
+                domain=parsed_url.netloc,
+                lock=domainlock,
+                timeout_util_downloadable=dl_waittimeopts.timeout_util_downloadable,
+                limit=domainopts.max_concurrency,
+            )
         if not ok:
             return False, DownLoadResult(error_msg=msg)
-        searchopts = read_config.get_search_options()
-        await domainrepo.save(
-            domain=parsed_url.netloc, status=URLDomainStatus.DOWNLOADING.value
-        )
+        try:
+            with observe_stage(
+                "rate_limit_wait", sitename=dlreq.sitename, domain=parsed_url.netloc
+            ):
+                ok, msg = await self._wait_rate_limit(
+                    domain=parsed_url.netloc,
+                    limiter=get_rate_limiter(),
+                    timeout=dl_waittimeopts.timeout_util_downloadable
+                    - (time.monotonic() - start),
+                )
+            if not ok:
+                return False, DownLoadResult(error_msg=msg)
+            try:
+                await circuitbreaker.check(circuit_name)
+            except CircuitOpenError as e:
+                return False, DownLoadResult(error_msg=str(e))
+            try:
+                with (
+                    track_in_flight(parsed_url.netloc),
+                    observe_stage(
+                        "download", sitename=dlreq.sitename, domain=parsed_url.netloc
+                    ) as labels,
+                ):
+                    ok, result = await self._download(
+                        parsed_url=parsed_url, dl_waittimeopts=dl_waittimeopts
+                    )
+                    if result.searchcache:
+                        labels["download_type"] = result.searchcache.download_type
+            except BaseException:
+                await circuitbreaker.release_probe(circuit_name)
+                raise
+            return ok, result
+        finally:
+            await domainlock.release(domain=parsed_url.netloc, token=token)
+
+    async def _download(
+        self, parsed_url, dl_waittimeopts: read_config.DownloadWaitTimeOptions
+    ):
+        dlreq: DownloadRequest = self.downloadrequest
+        target_url = self.target_url
+
+        ratelimiter = get_rate_limiter()
+        circuitbreaker = get_circuit_breaker()
+        circuit_name = domain_circuit_name(parsed_url.netloc)
         redirect_url = None
         sitename = dlreq.sitename.lower()
 
-        ext_api_config = read_config.get_external_api_config().get("downloader", {})
-        if sitename == SupportedSiteName.GEMINI.value:
-            target_api = ext_api_config.get(parsed_url.netloc)
-        else:
-            target_api = ext_api_config.get(sitename) or ext_api_config.get(
-                parsed_url.netloc
-            )
-        if target_api and target_api.get("url"):
+        site_registry = get_site_registry()
+        target_api = site_registry.find_external_api(
+            "downloader", sitename=sitename, netloc=parsed_url.netloc
+        )
+        handler = site_registry.get(sitename)
+        if target_api:
             if target_api.get("timeout"):
                 timeout = target_api["timeout"]
             else:
                 timeout = 30
             try:
-                async with httpx.AsyncClient() as client:
+                async with (
+                    get_circuit_breaker().guard(
+                        external_api_circuit_name(target_api["url"]),
+                        is_failure=is_backend_error,
+                    ),
+                    httpx.AsyncClient(
+                        transport=get_shared_transport(target_api["url"])
+                    ) as client,
+                ):
                     resp = await client.post(
                         target_api["url"],
-                        json=dlreq.model_dump(exclude_none=True),
+                        json=dlreq.model_dump(exclude_none=True, exclude={"max_stale"}),
                         timeout=timeout,
                     )
                     resp.raise_for_status()
@@ -451,72 +708,56 @@ class HTMLDownloader:
                         "download_type", c_enums.DownloadType.EXTERNAL_API.value
                     )
             except Exception as e:
-                await domainrepo.save(
-                    domain=parsed_url.netloc, status=URLDomainStatus.FAILED.value
+                throttled = (
+                    isinstance(e, httpx.HTTPStatusError)
+                    and e.response.status_code in THROTTLE_STATUS_CODES
+                )
+                await ratelimiter.record(
+                    domain=parsed_url.netloc,
+                    result=(
+                        RateLimitResult.THROTTLED
+                        if throttled
+                        else RateLimitResult.ERROR
+                    ),
                 )
+                # サイトの結果は分からないため、取った試行の枠を返す
+                await circuitbreaker.release_probe(circuit_name)
                 return False, DownLoadResult(
                     error_msg=f"external downloader error: {str(e)} error_type: {type(e).__name__} target_api: {target_api}"
                 )
+        elif handler is None:
+            await circuitbreaker.release_probe(circuit_name)
+            return False, DownLoadResult(
+                error_msg=f"not supported domain : {parsed_url.netloc}"
+            )
         else:
-            match sitename:
-                case SupportedSiteName.SOFMAP.value:
-                    if sofmap_urlgenerate.is_direct_search(url=target_url):
-                        ok, result = await sofmap_scraper.get_html(
-                            sofmap_scraper.GetCommandWithHttpx(
-                                url=target_url,
-                                timeout=dl_waittimeopts.timeout_for_each_url,
-                                delay_seconds=dl_waittimeopts.min_wait_time_of_dl,
-                                is_ucaa=not searchopts.safe_search,
-                            )
-                        )
-                        download_type = c_enums.DownloadType.HTTPX.value
-                    else:
-                        ok, result = await sofmap_tasks.async_download_sofmap(
-                            url=target_url
-                        )
-                        download_type = c_enums.DownloadType.SELENIUM.value
-                case SupportedSiteName.GEO.value:
-                    ok, result = await geo_tasks.async_download_geo(url=target_url)
-                    download_type = c_enums.DownloadType.SELENIUM.value
-                case SupportedSiteName.IOSYS.value:
-                    ok, result = await iosys_scraper.get_html(
-                        iosys_scraper.GetCommandWithHttpx(
-                            url=target_url,
-                            timeout=dl_waittimeopts.timeout_for_each_url,
-                            delay_seconds=dl_waittimeopts.min_wait_time_of_dl,
-                        )
-                    )
-                    download_type = c_enums.DownloadType.HTTPX.value
-                case SupportedSiteName.GEMINI.value:
-                    ok, result, download_type, *option_data = (
-                        await self._download_html_for_gemini(
-                            converted_url=converted_url,
-                            dl_waittimeopts=dl_waittimeopts,
-                        )
-                    )
-                    if option_data and option_data[0]:
-                        redirect_url = option_data[0]
-                case _:
-                    await domainrepo.save(
-                        domain=parsed_url.netloc,
-                        status=URLDomainStatus.FAILED.value,
-                    )
-                    return False, DownLoadResult(
-                        error_msg=f"not supported domain : {parsed_url.netloc}"
-                    )
+            site_result = await handler.download(
+                downloadrequest=dlreq,
+                target_url=target_url,
+                dl_waittimeopts=dl_waittimeopts,
+            )
+            ok = site_result.ok
+            result = site_result.result
+            download_type = site_result.download_type
+            redirect_url = site_result.redirect_url
 
         if not ok:
-            await domainrepo.save(
-                domain=parsed_url.netloc, status=URLDomainStatus.FAILED.value
+            await circuitbreaker.record_failure(circuit_name)
+            await ratelimiter.record(
+                domain=parsed_url.netloc,
+                result=(
+                    RateLimitResult.THROTTLED
+                    if is_throttled_message(result)
+                    else RateLimitResult.ERROR
+                ),
             )
             dlresult = DownLoadResult(error_msg=result)
             if redirect_url:
                 dlresult.redirect_url = redirect_url
             return False, dlresult
 
-        await domainrepo.save(
-            domain=parsed_url.netloc, status=URLDomainStatus.COMPLETED.value
-        )
+        await circuitbreaker.record_success(circuit_name)
+        await ratelimiter.record(domain=parsed_url.netloc, result=RateLimitResult.OK)
         searchcache = c_cache.SearchCache(
             domain=parsed_url.netloc,
             url=target_url,
@@ -528,127 +769,105 @@ class HTMLDownloader:
             dlresult.redirect_url = redirect_url
         return ok, dlresult
 
-    async def _download_html_for_gemini(
-        self, converted_url: str, dl_waittimeopts: read_config.DownloadWaitTimeOptions
-    ):
-        if isinstance(self.downloadrequest.options, AskGeminiOptions):
-            geminiopts = self.downloadrequest.options
-        else:
-            geminiopts = AskGeminiOptions(**self.downloadrequest.options)
-        selenium_opt = read_config.get_selenium_options()
-        if geminiopts.selenium:
-            ok, result = await gemini_webscraper.get_html_with_selenium(
-                command=gemini_webscraper.GetCommandWithSelenium(
-                    url=converted_url,
-                    wait_css_selector=geminiopts.selenium.wait_css_selector,
-                    page_load_timeout=geminiopts.selenium.page_load_timeout,
-                    tag_wait_timeout=geminiopts.selenium.tag_wait_timeout,
-                    selenium_url=selenium_opt.remote_url,
-                    page_wait_time=geminiopts.selenium.page_wait_time,
-                    cookie_options=geminiopts.selenium.cookie,
-                )
-            )
-            return ok, result, c_enums.DownloadType.SELENIUM.value
-        elif geminiopts.nodriver:
-            ok, result, redirect_url = (
-                await gemini_webscraper.get_html_with_nodriver_api(
-                    command=gemini_webscraper.GetCommandWithNodriver(
-                        url=converted_url,
-                        nodriver_options=geminiopts.nodriver,
-                    )
-                )
-            )
-            if isinstance(result, str):
-                return ok, result, c_enums.DownloadType.NODRIVER.value, redirect_url
-            return ok, result.result, c_enums.DownloadType.NODRIVER.value, redirect_url
-        else:
-            ok, result, redirect_url = await gemini_webscraper.get_html(
-                command=gemini_webscraper.GetCommandWithHttpx(
-                    url=converted_url,
-                    timeout=dl_waittimeopts.timeout_for_each_url,
-                    delay_seconds=dl_waittimeopts.min_wait_time_of_dl,
-                    httpx_options=geminiopts.httpx,
-                )
-            )
-            return ok, result, c_enums.DownloadType.HTTPX.value, redirect_url
-
     async def _get_search_cache(self) -> c_cache.SearchCache | None:
         repo = self.searchcache_repository
-        now = datetime.now(timezone.utc)
+        expires_start = datetime.now(timezone.utc) - timedelta(
+            seconds=self._get_max_stale()
+        )
         results = await repo.get(
             command=c_cmd.SearchCacheGetCommand(
-                url=self.downloadrequest.url, expires_start=now
+                url=self.downloadrequest.url, expires_start=expires_start
             )
         )
         if not results:
             return None
         return max(results, key=lambda x: x.created_at)
 
+    def _get_max_stale(self) -> int:
+        max_stale = read_config.get_cache_options().stale_while_revalidate or 0
+        if self.downloadrequest.max_stale is not None:
+            max_stale = min(max_stale, self.downloadrequest.max_stale)
+        return max_stale
+
+    def _is_expired(self, searchcache: c_cache.SearchCache) -> bool:
+        if not searchcache.expires:
+            return False
+        expires = searchcache.expires
+        if expires.tzinfo is None:
+            expires = expires.replace(tzinfo=timezone.utc)
+        return expires <= datetime.now(timezone.utc)
+
+    def _revalidate(self):
+        key = create_request_key(
+            self.downloadrequest.model_copy(update={"no_cache": True}),
+            extra={"revalidate": self.target_url},
+        )
+        get_cache_revalidator().revalidate(key=key, func=self._refresh_search_cache)
+
+    async def _refresh_search_cache(self) -> RevalidateResult:
+        # 呼び出し元のセッションは使い終わっている可能性があるため別に作る
+        async with db_util.get_async_sessionmaker()() as ses:
+            downloader = HTMLDownloader(
+                downloadrequest=self.downloadrequest.model_copy(
+                    update={"no_cache": True}
+                ),
+                searchcache_repository=create_searchcache_repository(ses=ses),
+                converted_url=self.converted_url,
+            )
+            ok, result = await downloader.execute()
+            if not ok:
+                return RevalidateResult(error_msg=result.error_msg)
+            cacheopts = read_config.get_cache_options()
+            if cacheopts.expires:
+                result.searchcache.expires = datetime.now(timezone.utc) + timedelta(
+                    seconds=cacheopts.expires
+                )
+                await downloader._set_search_cache(searchcache=result.searchcache)
+        return RevalidateResult()
+
     async def _set_search_cache(
         self,
         searchcache: c_cache.SearchCache,
     ):
         repo = self.searchcache_repository
-        await repo.save(data=searchcache)
-
-    async def _create_URLDomainCacheRepository(self):
-        cacheopts = read_config.get_cache_options()
-        domainrepo = URLDomainCacheRepository(
-            r=get_async_redis(),
-            expiry_seconds=cacheopts.expires,
-        )
-        return domainrepo
+        with observe_stage(
+            "cache_save",
+            sitename=self.downloadrequest.sitename,
+            domain=searchcache.domain,
+            download_type=searchcache.download_type,
+        ):
+            await repo.save(data=searchcache)
 
     async def _wait_downloadable(
         self,
         domain: str,
-        repository: URLDomainCacheRepository,
+        lock: IDomainLock,
         timeout_util_downloadable: int,
-    ):
-        cached_data = await repository.get(domain)
-        if not cached_data:
-            return True, ""
-        if cached_data.get("updated_at") and not isinstance(
-            cached_data["updated_at"], datetime
-        ):
-            raise ValueError(f"cached_date has not datetime, {cached_data}")
-
-        wait_start_time = time.perf_counter()
-
-        def is_timeout(wait_start_time):
-            return time.perf_counter() - wait_start_time > timeout_util_downloadable
+        limit: int | None = None,
+    ) -> tuple[bool, str, str | None]:
+        token = await lock.acquire(
+            domain=domain, timeout=timeout_util_downloadable, limit=limit
+        )
+        if token is None:
+            return (
+                False,
+                f"time out, The time to wait for the update to finish has expired."
+                f" domain:{domain}"
+                f" wait_time_util_dl:{timeout_util_downloadable}",
+                None,
+            )
+        return True, "", token
 
-        while True:
-            cached_data = await repository.get(domain)
-            if not cached_data:
-                return True, ""
-            if (
-                cached_data.get("status")
-                and cached_data["status"] == URLDomainStatus.DOWNLOADING.value
-            ):
-                await asyncio.sleep(CYCLE_WAIT_TIME)
-                if is_timeout(wait_start_time):
-                    return (
-                        False,
-                        f"time out, The time to wait for the update to finish has expired."
-                        f"cache updated_at:{cached_data.get('updated_at')}"
-                        f" wait_time_util_dl:{timeout_util_downloadable}"
-                        f" status:{cached_data.get('status')}",
-                    )
-                continue
-            cached_update = cached_data.get("updated_at")
-            now = datetime.now(timezone.utc) - cached_update
-            if int(now.total_seconds()) > CYCLE_WAIT_TIME:
-                return True, ""
-            await asyncio.sleep(CYCLE_WAIT_TIME)
-            if is_timeout(wait_start_time):
-                return (
-                    False,
-                    f"time out, The time to wait for the update to finish has expired."
-                    f"cache updated_at:{cached_data.get('updated_at')}"
-                    f" wait_time_util_dl:{timeout_util_downloadable}"
-                    f" diff_time:{now.total_seconds()}",
-                )
+    async def _wait_rate_limit(
+        self, domain: str, limiter: IDomainRateLimiter, timeout: float
+    ) -> tuple[bool, str]:
+        if await limiter.acquire(domain=domain, timeout=max(timeout, 0)):
+            return True, ""
+        return (
+            False,
+            f"time out, The time to wait for the rate limit has expired."
+            f" domain:{domain}",
+        )
 
 
 class KeyWordToURL:
@@ -662,25 +881,26 @@ class KeyWordToURL:
     async def execute(self) -> str:
         searchrequest: SearchRequest = self.searchrequest
         sitename = searchrequest.sitename.lower()
-        ext_api_config = read_config.get_external_api_config().get("url_generation", {})
-        if searchrequest.url:
-            parsed_url = urlparse(searchrequest.url)
-            if sitename == SupportedSiteName.GEMINI.value:
-                target_api = ext_api_config.get(parsed_url.netloc)
-            else:
-                target_api = ext_api_config.get(sitename) or ext_api_config.get(
-                    parsed_url.netloc
-                )
-        elif sitename != SupportedSiteName.GEMINI.value and sitename in ext_api_config:
-            target_api = ext_api_config[sitename]
-        else:
-            target_api = None
-        if target_api and target_api.get("url"):
+        site_registry = get_site_registry()
+        target_api = site_registry.find_external_api(
+            "url_generation",
+            sitename=sitename,
+            netloc=urlparse(searchrequest.url).netloc if searchrequest.url else None,
+        )
+        if target_api:
             if target_api.get("timeout"):
                 timeout = target_api["timeout"]
             else:
                 timeout = 10
-            async with httpx.AsyncClient() as client:
+            async with (
+                get_circuit_breaker().guard(
+                    external_api_circuit_name(target_api["url"]),
+                    is_failure=is_backend_error,
+                ),
+                httpx.AsyncClient(
+                    transport=get_shared_transport(target_api["url"])
+                ) as client,
+            ):
                 resp = await client.post(
                     target_api["url"],
                     json=searchrequest.model_dump(exclude_none=True),
@@ -689,95 +909,7 @@ class KeyWordToURL:
                 resp.raise_for_status()
                 return resp.json()["url"]
 
-        match sitename:
-            case SupportedSiteName.SOFMAP.value:
-                return await self._build_sofmap_url(searchrequest)
-            case SupportedSiteName.GEO.value:
-                return await self._build_geo_url(searchrequest)
-            case SupportedSiteName.IOSYS.value:
-                return await self._build_iosys_url(searchrequest)
-            case _:
-                raise ValueError(f"not supported sitename : {sitename}")
-
-    async def _build_iosys_url(self, searchrequest: SearchRequest):
-        params = {
-            "search_keyword": searchrequest.search_keyword,
-        }
-        if searchrequest.options:
-            extraction_any_keys = [
-                "condition",
-                "sort",
-            ]
-            extraction_int_keys = [
-                "min_price",
-                "max_price",
-            ]
-            if not isinstance(searchrequest.options, dict):
-                target_options = searchrequest.options.model_dump(exclude_none=True)
-            else:
-                target_options = searchrequest.options
-            any_params = self._extract_params(
-                options=target_options, target_keys=extraction_any_keys
-            )
-            int_params = self._extract_params(
-                options=target_options,
-                target_keys=extraction_int_keys,
-                convert_value=lambda x: int(x),
-            )
-            params = params | any_params | int_params
-        return iosys_urlgenerate.build_search_url(**params)
-
-    async def _build_geo_url(self, searchrequest: SearchRequest):
-        params = {
-            "search_keyword": searchrequest.search_keyword,
-        }
-        return geo_urlgenerate.build_search_url(**params)
-
-    async def _build_sofmap_url(self, searchrequest: SearchRequest):
-        params = {
-            "search_keyword": searchrequest.search_keyword,
-        }
-        if searchrequest.options:
-            extraction_any_keys = [
-                "is_akiba",
-                "direct_search",
-                "product_type",
-                "gid",
-                "order_by",
-            ]
-            extraction_int_keys = ["display_count"]
-            if not isinstance(searchrequest.options, dict):
-                target_options = searchrequest.options.model_dump(exclude_none=True)
-            else:
-                target_options = searchrequest.options
-            any_params = self._extract_params(
-                options=target_options, target_keys=extraction_any_keys
-            )
-            int_params = self._extract_params(
-                options=target_options,
-                target_keys=extraction_int_keys,
-                convert_value=lambda x: int(x),
-            )
-            category_name = target_options.get("category")
-            if not any_params.get("gid") and category_name:
-                gid = await sofmap_category.get_category_id(
-                    ses=self.session,
-                    is_akiba=any_params.get("is_akiba", False),
-                    category_name=category_name,
-                )
-                if gid:
-                    any_params["gid"] = gid
-            params = params | any_params | int_params
-        return sofmap_urlgenerate.build_search_url(**params)
-
-    def _extract_params(
-        self,
-        options: dict,
-        target_keys: list[str],
-        convert_value: Callable | None = None,
-    ) -> dict:
-        if convert_value is None:
-            return {k: v for k, v in options.items() if v and k in target_keys}
-        return {
-            k: convert_value(v) for k, v in options.items() if v and k in target_keys
-        }
+        handler = site_registry.get(sitename)
+        if handler is None:
+            raise ValueError(f"not supported sitename : {sitename}")
+        return await handler.build_url(ses=self.session, searchrequest=searchrequest)
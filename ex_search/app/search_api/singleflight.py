@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+import json
+import uuid
+from typing import Awaitable, Callable
+
+import redis.asyncio as aredis
+from pydantic import BaseModel
+import structlog
+
+from common import read_config
+from databases.redis.util import get_async_redis
+from domain.schemas.search import DownloadRequest
+
+logger = structlog.get_logger(__name__)
+
+RECHECK_INTERVAL = 5
+
+
+def create_request_key(
+    downloadrequest: DownloadRequest, extra: dict | None = None
+) -> str:
+    options = downloadrequest.options
+    if hasattr(options, "model_dump"):
+        options = options.model_dump(mode="json", exclude_none=True)
+    normalized = {
+        "url": downloadrequest.url,
+        "sitename": downloadrequest.sitename.lower(),
+        "options": options,
+        "no_cache": downloadrequest.no_cache,
+    }
+    if extra:
+        normalized["extra"] = extra
+    data = json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    同一キーの処理を1つにまとめる。
+    ワーカー内はasyncio.Future、ワーカー間はRedisの処理中マーカーと完了通知で先行処理の結果を共有する。
+    """
+
+    HEADER = "singleflight:"
+    result_model: type[BaseModel]
+    r: aredis.Redis | None
+    marker_seconds: int
+    result_seconds: int
+
+    def __init__(
+        self,
+        result_model: type[BaseModel],
+        r: aredis.Redis | None = None,
+        marker_seconds: int = 300,
+        result_seconds: int = 30,
+    ):
+        self.result_model = result_model
+        self.r = r
+        self.marker_seconds = marker_seconds
+        self.result_seconds = result_seconds
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, func: Callable[[], Awaitable[BaseModel]]):
+        while True:
+            fut = self._inflight.get(key)
+            if fut is None:
+                break
+            try:
+                result = await asyncio.shield(fut)
+            except asyncio.CancelledError:
+                if fut.cancelled():
+                    # 先行処理がキャンセルされた場合は自分で処理し直す
+                    continue
+                raise
+            return result.model_copy(deep=True)
+
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            if self.r is None:
+                result = await func()
+            else:
+                result = await self._do_across_workers(key=key, func=func)
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            # 待機者がいない場合の未回収例外の警告を抑止する
+            fut.exception()
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _do_across_workers(
+        self, key: str, func: Callable[[], Awaitable[BaseModel]]
+    ):
+        marker_key = self._marker_key(key)
+        while True:
+            flight_id = uuid.uuid4().hex
+            if await self.r.set(marker_key, flight_id, nx=True, ex=self.marker_seconds):
+                return await self._lead(key=key, flight_id=flight_id, func=func)
+            running_flight_id = await self.r.get(marker_key)
+            if running_flight_id is None:
+                continue
+            if isinstance(running_flight_id, bytes):
+                running_flight_id = running_flight_id.decode("utf-8")
+            result = await self._wait_remote(key=key, flight_id=running_flight_id)
+            if result is not None:
+                return result
+            logger.debug("singleflight leader lost, fallback", key=key)
+            return await func()
+
+    async def _lead(
+        self, key: str, flight_id: str, func: Callable[[], Awaitable[BaseModel]]
+    ):
+        try:
+            result = await func()
+        except BaseException:
+            async with self.r.pipeline(transaction=True) as pipe:
+                pipe.delete(self._marker_key(key))
+                pipe.publish(self._channel(key), flight_id)
+                await pipe.execute()
+            raise
+        async with self.r.pipeline(transaction=True) as pipe:
+            pipe.set(
+                self._result_key(key, flight_id),
+                result.model_dump_json(),
+                ex=self.result_seconds,
+            )
+            pipe.delete(self._marker_key(key))
+            pipe.publish(self._channel(key), flight_id)
+            await pipe.execute()
+        return result
+
+    async def _wait_remote(self, key: str, flight_id: str):
+        async with self.r.pubsub() as pubsub:
+            await pubsub.subscribe(self._channel(key))
+            while True:
+                cached = await self.r.get(self._result_key(key, flight_id))
+                if cached:
+                    return self.result_model.model_validate_json(cached)
+                running_flight_id = await self.r.get(self._marker_key(key))
+                if isinstance(running_flight_id, bytes):
+                    running_flight_id = running_flight_id.decode("utf-8")
+                if running_flight_id != flight_id:
+                    # 完了直後に結果が書き込まれている可能性があるため再確認する
+                    cached = await self.r.get(self._result_key(key, flight_id))
+                    if cached:
+                        return self.result_model.model_validate_json(cached)
+                    return None
+                await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=RECHECK_INTERVAL
+                )
+
+    def _marker_key(self, key: str) -> str:
+        return f"{self.HEADER}{key}:marker"
+
+    def _result_key(self, key: str, flight_id: str) -> str:
+        return f"{self.HEADER}{key}:result:{flight_id}"
+
+    def _channel(self, key: str) -> str:
+        return f"{self.HEADER}{key}:done"
+
+
+_singleflights: dict[type[BaseModel], SingleFlight] = {}
+
+
+def get_singleflight(result_model: type[BaseModel]) -> SingleFlight:
+    if result_model in _singleflights:
+        return _singleflights[result_model]
+    sfopts = read_config.get_singleflight_options()
+    match sfopts.backend:
+        case "redis":
+            singleflight = SingleFlight(
+                result_model=result_model,
+                r=get_async_redis(),
+                marker_seconds=sfopts.marker_seconds,
+                result_seconds=sfopts.result_seconds,
+            )
+        case _:
+            singleflight = SingleFlight(result_model=result_model)
+    _singleflights[result_model] = singleflight
+    return singleflight
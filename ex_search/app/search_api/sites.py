@@ -0,0 +1,460 @@
+from abc import ABC, abstractmethod
+from types import MappingProxyType, ModuleType
+from typing import Callable, Literal, Mapping
+from urllib.parse import urlparse
+
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from common import read_config
+from domain.models.cache import enums as c_enums
+from domain.schemas.search import (
+    SearchRequest,
+    SearchResults,
+    AskGeminiOptions,
+    SofmapOptions,
+    DownloadRequest,
+)
+import sofmap.parser
+import sofmap.model
+import sofmap.constants
+import geo.parser
+import geo.model
+import geo.constants
+import iosys.parser
+import iosys.model
+import iosys.constants
+from app.sofmap import (
+    web_scraper as sofmap_scraper,
+    model_convert as sofmap_modelconvert,
+    urlgenerate as sofmap_urlgenerate,
+    category as sofmap_category,
+    tasks as sofmap_tasks,
+)
+from app.geo import (
+    urlgenerate as geo_urlgenerate,
+    web_scraper as geo_scraper,
+    model_convert as geo_modelconvert,
+    constants as geo_app_constants,
+    tasks as geo_tasks,
+)
+from app.iosys import (
+    urlgenerate as iosys_urlgenerate,
+    web_scraper as iosys_scraper,
+    model_convert as iosys_modelconvert,
+)
+from app.gemini_api import web_scraper as gemini_webscraper
+from .enums import SuppoertedDomain, SupportedSiteName
+
+EXTERNAL_API_KIND_LITERAL = Literal["url_generation", "downloader", "parser"]
+
+
+class SiteDownloadResult(BaseModel):
+    ok: bool
+    result: str
+    download_type: str
+    redirect_url: str | None = None
+
+
+def get_gemini_label(searchrequest: SearchRequest) -> tuple[AskGeminiOptions, str]:
+    if isinstance(searchrequest.options, AskGeminiOptions):
+        geminiopts = searchrequest.options
+    else:
+        geminiopts = AskGeminiOptions(**searchrequest.options)
+    parsed_url = urlparse(searchrequest.url)
+    label = (
+        geminiopts.label
+        or parsed_url._replace(params="", query="", fragment="").geturl()
+    )
+    return geminiopts, label
+
+
+def extract_params(
+    options: dict,
+    target_keys: list[str],
+    convert_value: Callable | None = None,
+) -> dict:
+    if convert_value is None:
+        return {k: v for k, v in options.items() if v and k in target_keys}
+    return {k: convert_value(v) for k, v in options.items() if v and k in target_keys}
+
+
+def _options_to_dict(options) -> dict:
+    if not isinstance(options, dict):
+        return options.model_dump(exclude_none=True)
+    return options
+
+
+class SiteHandler(ABC):
+    """
+    サイト毎のURLの生成、ダウンロード、解析をまとめたもの。
+    is_paginatedがTrueのサイトはparse_htmlとconvert_resultsでページ毎に解析し、
+    Falseのサイトはparse_searchでまとめて解析する。
+    """
+
+    sitename: str
+    domains: tuple[str, ...] = ()
+    is_paginated: bool = False
+    # 解析済みの結果のキャッシュで、パーサーの版を作るモジュール。解析結果に関わるモデルや定数も含める
+    parser_modules: tuple[ModuleType, ...] = ()
+
+    def convert_url(
+        self, url: str, options: SofmapOptions | AskGeminiOptions | dict
+    ) -> str:
+        """ダウンロードする前にURLを変換する"""
+        return url
+
+    async def build_url(self, ses: AsyncSession, searchrequest: SearchRequest) -> str:
+        raise ValueError(f"not supported sitename : {self.sitename}")
+
+    @abstractmethod
+    async def download(
+        self,
+        downloadrequest: DownloadRequest,
+        target_url: str,
+        dl_waittimeopts: read_config.DownloadWaitTimeOptions,
+    ) -> SiteDownloadResult:
+        pass
+
+    async def parse_html(self, html: str, url: str):
+        raise ValueError(f"not supported sitename : {self.sitename}")
+
+    def convert_results(self, parsed_result, remove_duplicates: bool) -> SearchResults:
+        raise ValueError(f"not supported sitename : {self.sitename}")
+
+    async def parse_search(
+        self,
+        ses: AsyncSession,
+        searchrequest: SearchRequest,
+        html: str,
+        remove_duplicates: bool,
+    ) -> SearchResults | None:
+        raise ValueError(f"not supported sitename : {self.sitename}")
+
+
+class SofmapSiteHandler(SiteHandler):
+    sitename = SupportedSiteName.SOFMAP.value
+    domains = (SuppoertedDomain.SOFMAP.value, SuppoertedDomain.A_SOFMAP.value)
+    is_paginated = True
+    parser_modules = (
+        sofmap.parser,
+        sofmap.model,
+        sofmap.constants,
+        sofmap_modelconvert,
+    )
+
+    def convert_url(self, url, options):
+        if isinstance(options, SofmapOptions) and options.convert_to_direct_search:
+            return sofmap_urlgenerate.convert_to_direct_search(url=url)
+        return url
+
+    async def build_url(self, ses, searchrequest):
+        params = {
+            "search_keyword": searchrequest.search_keyword,
+        }
+        if searchrequest.options:
+            extraction_any_keys = [
+                "is_akiba",
+                "direct_search",
+                "product_type",
+                "gid",
+                "order_by",
+            ]
+            extraction_int_keys = ["display_count"]
+            target_options = _options_to_dict(searchrequest.options)
+            any_params = extract_params(
+                options=target_options, target_keys=extraction_any_keys
+            )
+            int_params = extract_params(
+                options=target_options,
+                target_keys=extraction_int_keys,
+                convert_value=lambda x: int(x),
+            )
+            category_name = target_options.get("category")
+            if not any_params.get("gid") and category_name:
+                gid = await sofmap_category.get_category_id(
+                    ses=ses,
+                    is_akiba=any_params.get("is_akiba", False),
+                    category_name=category_name,
+                )
+                if gid:
+                    any_params["gid"] = gid
+            params = params | any_params | int_params
+        return sofmap_urlgenerate.build_search_url(**params)
+
+    async def download(self, downloadrequest, target_url, dl_waittimeopts):
+        if sofmap_urlgenerate.is_direct_search(url=target_url):
+            searchopts = read_config.get_search_options()
+            ok, result = await sofmap_scraper.get_html(
+                sofmap_scraper.GetCommandWithHttpx(
+                    url=target_url,
+                    timeout=dl_waittimeopts.timeout_for_each_url,
+                    delay_seconds=dl_waittimeopts.min_wait_time_of_dl,
+                    is_ucaa=not searchopts.safe_search,
+                )
+            )
+            download_type = c_enums.DownloadType.HTTPX.value
+        else:
+            ok, result = await sofmap_tasks.async_download_sofmap(url=target_url)
+            download_type = c_enums.DownloadType.SELENIUM.value
+        return SiteDownloadResult(ok=ok, result=result, download_type=download_type)
+
+    async def parse_html(self, html, url):
+        return await sofmap_scraper.parse_html(html=html, url=url)
+
+    def convert_results(self, parsed_result, remove_duplicates):
+        return sofmap_modelconvert.ModelConverter.parseresults_to_searchresults(
+            results=parsed_result, remove_duplicates=remove_duplicates
+        )
+
+
+class GeoSiteHandler(SiteHandler):
+    sitename = SupportedSiteName.GEO.value
+    domains = (SuppoertedDomain.GEO.value,)
+    is_paginated = True
+    parser_modules = (
+        geo.parser,
+        geo.model,
+        geo.constants,
+        geo_modelconvert,
+        geo_app_constants,
+    )
+
+    async def build_url(self, ses, searchrequest):
+        params = {
+            "search_keyword": searchrequest.search_keyword,
+        }
+        return geo_urlgenerate.build_search_url(**params)
+
+    async def download(self, downloadrequest, target_url, dl_waittimeopts):
+        ok, result = await geo_tasks.async_download_geo(url=target_url)
+        return SiteDownloadResult(
+            ok=ok, result=result, download_type=c_enums.DownloadType.SELENIUM.value
+        )
+
+    async def parse_html(self, html, url):
+        return await geo_scraper.parse_html(html=html, url=url)
+
+    def convert_results(self, parsed_result, remove_duplicates):
+        return geo_modelconvert.ModelConverter.parseresults_to_searchresults(
+            results=parsed_result
+        )
+
+
+class IosysSiteHandler(SiteHandler):
+    sitename = SupportedSiteName.IOSYS.value
+    domains = (SuppoertedDomain.IOSYS.value,)
+    is_paginated = True
+    parser_modules = (
+        iosys.parser,
+        iosys.model,
+        iosys.constants,
+        iosys_modelconvert,
+    )
+
+    async def build_url(self, ses, searchrequest):
+        params = {
+            "search_keyword": searchrequest.search_keyword,
+        }
+        if searchrequest.options:
+            extraction_any_keys = [
+                "condition",
+                "sort",
+            ]
+            extraction_int_keys = [
+                "min_price",
+                "max_price",
+            ]
+            target_options = _options_to_dict(searchrequest.options)
+            any_params = extract_params(
+                options=target_options, target_keys=extraction_any_keys
+            )
+            int_params = extract_params(
+                options=target_options,
+                target_keys=extraction_int_keys,
+                convert_value=lambda x: int(x),
+            )
+            params = params | any_params | int_params
+        return iosys_urlgenerate.build_search_url(**params)
+
+    async def download(self, downloadrequest, target_url, dl_waittimeopts):
+        ok, result = await iosys_scraper.get_html(
+            iosys_scraper.GetCommandWithHttpx(
+                url=target_url,
+                timeout=dl_waittimeopts.timeout_for_each_url,
+                delay_seconds=dl_waittimeopts.min_wait_time_of_dl,
+            )
+        )
+        return SiteDownloadResult(
+            ok=ok, result=result, download_type=c_enums.DownloadType.HTTPX.value
+        )
+
+    async def parse_html(self, html, url):
+        return await iosys_scraper.parse_html(html=html, url=url)
+
+    def convert_results(self, parsed_result, remove_duplicates):
+        return iosys_modelconvert.ModelConverter.parseresults_to_searchresults(
+            results=parsed_result
+        )
+
+
+class GeminiSiteHandler(SiteHandler):
+    """任意のサイトをgeminiで作成したパーサーで解析する。URLのドメインでは選ばない"""
+
+    sitename = SupportedSiteName.GEMINI.value
+
+    async def download(self, downloadrequest, target_url, dl_waittimeopts):
+        if isinstance(downloadrequest.options, AskGeminiOptions):
+            geminiopts = downloadrequest.options
+        else:
+            geminiopts = AskGeminiOptions(**downloadrequest.options)
+        if geminiopts.selenium:
+            selenium_opt = read_config.get_selenium_options()
+            ok, result = await gemini_webscraper.get_html_with_selenium(
+                command=gemini_webscraper.GetCommandWithSelenium(
+                    url=target_url,
+                    wait_css_selector=geminiopts.selenium.wait_css_selector,
+                    page_load_timeout=geminiopts.selenium.page_load_timeout,
+                    tag_wait_timeout=geminiopts.selenium.tag_wait_timeout,
+                    selenium_url=selenium_opt.remote_url,
+                    page_wait_time=geminiopts.selenium.page_wait_time,
+                    cookie_options=geminiopts.selenium.cookie,
+                )
+            )
+            return SiteDownloadResult(
+                ok=ok,
+                result=result,
+                download_type=c_enums.DownloadType.SELENIUM.value,
+            )
+        elif geminiopts.nodriver:
+            ok, result, redirect_url = (
+                await gemini_webscraper.get_html_with_nodriver_api(
+                    command=gemini_webscraper.GetCommandWithNodriver(
+                        url=target_url,
+                        nodriver_options=geminiopts.nodriver,
+                    )
+                )
+            )
+            return SiteDownloadResult(
+                ok=ok,
+                result=result if isinstance(result, str) else result.result,
+                download_type=c_enums.DownloadType.NODRIVER.value,
+                redirect_url=redirect_url,
+            )
+        else:
+            ok, result, redirect_url = await gemini_webscraper.get_html(
+                command=gemini_webscraper.GetCommandWithHttpx(
+                    url=target_url,
+                    timeout=dl_waittimeopts.timeout_for_each_url,
+                    delay_seconds=dl_waittimeopts.min_wait_time_of_dl,
+                    httpx_options=geminiopts.httpx,
+                )
+            )
+            return SiteDownloadResult(
+                ok=ok,
+                result=result,
+                download_type=c_enums.DownloadType.HTTPX.value,
+                redirect_url=redirect_url,
+            )
+
+    async def parse_search(self, ses, searchrequest, html, remove_duplicates):
+        geminiopts, label = get_gemini_label(searchrequest)
+        return await gemini_webscraper.parse_html_and_convert(
+            html=html,
+            url=searchrequest.url,
+            label=label,
+            session=ses,
+            sitename=geminiopts.sitename or urlparse(searchrequest.url).netloc,
+            remove_duplicates=remove_duplicates,
+            recreate=geminiopts.recreate_parser,
+            exclude_script=geminiopts.exclude_script,
+            compress_whitespace=geminiopts.compress_whitespace,
+            prompt=geminiopts.prompt,
+        )
+
+
+def create_default_site_handlers() -> list[SiteHandler]:
+    return [
+        SofmapSiteHandler(),
+        GeoSiteHandler(),
+        IosysSiteHandler(),
+        GeminiSiteHandler(),
+    ]
+
+
+class SiteRegistry:
+    """
+    サイト名、ドメインからSiteHandlerと外部APIの設定を引く。
+    起動時に一度作り、リクエスト毎には辞書を引くだけにする。
+    """
+
+    def __init__(
+        self,
+        handlers: list[SiteHandler],
+        external_api_config: Mapping | None = None,
+    ):
+        self._by_sitename: dict[str, SiteHandler] = {}
+        self._by_netloc: dict[str, SiteHandler] = {}
+        for handler in handlers:
+            self.register(handler)
+        external_api_config = external_api_config or {}
+        self._external_apis: dict[str, Mapping] = {
+            kind: external_api_config.get(kind) or MappingProxyType({})
+            for kind in ["url_generation", "downloader", "parser"]
+        }
+
+    def register(self, handler: SiteHandler):
+        self._by_sitename[handler.sitename] = handler
+        for domain in handler.domains:
+            self._by_netloc[domain] = handler
+
+    def get(self, sitename: str) -> SiteHandler | None:
+        return self._by_sitename.get(sitename.lower())
+
+    def get_by_netloc(self, netloc: str) -> SiteHandler | None:
+        return self._by_netloc.get(netloc)
+
+    def find_external_api(
+        self,
+        kind: EXTERNAL_API_KIND_LITERAL,
+        sitename: str,
+        netloc: str | None = None,
+    ) -> Mapping | None:
+        """
+        urlが設定された外部APIを返す。geminiはドメインのみ、他のサイトはサイト名、ドメインの順で探す。
+        """
+        apis = self._external_apis[kind]
+        if sitename.lower() == SupportedSiteName.GEMINI.value:
+            target_api = apis.get(netloc) if netloc else None
+        else:
+            target_api = apis.get(sitename.lower()) or (
+                apis.get(netloc) if netloc else None
+            )
+        if target_api and target_api.get("url"):
+            return target_api
+        return None
+
+
+_site_registry: SiteRegistry | None = None
+
+
+def get_site_registry() -> SiteRegistry:
+    global _site_registry
+    if _site_registry is None:
+        _site_registry = SiteRegistry(
+            handlers=create_default_site_handlers(),
+            external_api_config=read_config.get_external_api_config(),
+        )
+    return _site_registry
+
+
+def init_site_registry():
+    get_site_registry()
+
+
+def _reset_site_registry():
+    global _site_registry
+    _site_registry = None
+
+
+read_config.add_reload_listener(_reset_site_registry)
@@ -0,0 +1,117 @@
+import asyncio
+from typing import AsyncIterator, Callable
+
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+import structlog
+
+from domain.models.cache import repository as i_cacherepo
+from domain.schemas.search import (
+    SearchRequest,
+    SearchResponse,
+    SearchResults,
+    SearchStreamResult,
+    BatchSearchStreamResponse,
+    SearchStreamEnd,
+)
+from .search import SearchClient
+from .batch import BatchSearchClient
+
+logger = structlog.get_logger(__name__)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+SSE_MEDIA_TYPE = "text/event-stream"
+
+
+def select_media_type(accept: str | None) -> str:
+    if accept and SSE_MEDIA_TYPE in accept:
+        return SSE_MEDIA_TYPE
+    return NDJSON_MEDIA_TYPE
+
+
+def encode_event(event: BaseModel, media_type: str) -> str:
+    data = event.model_dump_json()
+    if media_type == SSE_MEDIA_TYPE:
+        return f"event: {event.event}\ndata: {data}\n\n"
+    return f"{data}\n"
+
+
+async def encode_stream(
+    events: AsyncIterator[BaseModel], media_type: str
+) -> AsyncIterator[str]:
+    async for event in events:
+        yield encode_event(event=event, media_type=media_type)
+
+
+async def stream_search(
+    searchrequest: SearchRequest,
+    sessionmaker: async_sessionmaker[AsyncSession],
+    searchcache_repository_factory: Callable[
+        [AsyncSession], i_cacherepo.ISearchCacheRepository
+    ],
+    caller_type: str = "",
+) -> AsyncIterator[BaseModel]:
+    """
+    ページ毎に解析できた結果から順に返す。
+    キャッシュや他の同一リクエストの結果を使った場合は最後にまとめて返す。
+    """
+    pages: asyncio.Queue[SearchResults | None] = asyncio.Queue()
+
+    async def execute() -> SearchResponse:
+        try:
+            # レスポンス送信中も使うためセッションはストリーム側で開く
+            async with sessionmaker() as ses:
+                client = SearchClient(
+                    ses=ses,
+                    searchrequest=searchrequest,
+                    searchcache_repository=searchcache_repository_factory(ses),
+                    caller_type=caller_type,
+                    page_callback=pages.put,
+                )
+                return await client.execute()
+        finally:
+            pages.put_nowait(None)
+
+    task = asyncio.create_task(execute())
+    count = 0
+    streamed = False
+    try:
+        while (page := await pages.get()) is not None:
+            streamed = True
+            for result in page.results:
+                if searchrequest.max_results and count >= searchrequest.max_results:
+                    break
+                count += 1
+                yield SearchStreamResult(result=result)
+        try:
+            response = await task
+        except Exception as e:
+            logger.error(
+                "Search stream failed", error_type=type(e).__name__, error=str(e)
+            )
+            yield SearchStreamEnd(count=count, error_msg=str(e))
+            return
+        if not streamed:
+            for result in response.results:
+                count += 1
+                yield SearchStreamResult(result=result)
+        yield SearchStreamEnd(
+            count=count,
+            error_msg=response.error_msg,
+            redirect_url=response.redirect_url,
+            stale=response.stale,
+        )
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+
+async def stream_batch_search(
+    client: BatchSearchClient,
+) -> AsyncIterator[BaseModel]:
+    count = 0
+    async for index, response in client.stream():
+        count += 1
+        yield BatchSearchStreamResponse(index=index, response=response)
+    yield SearchStreamEnd(count=count)
@@ -3,7 +3,7 @@ import asyncio
 import httpx
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from sofmap.parser import CategoryParser
+from sofmap.parser import parse_category
 from sofmap.model import CategoryResult
 from domain.models.category import (
     repository as cate_repo,
@@ -11,6 +11,8 @@ from domain.models.category import (
     command as cate_cmd,
 )
 from databases.sql.category.repository import CategoryRepository
+from app.downloader.http_client import get_shared_transport
+from app.parse_executor import run_parse
 
 from .constants import (
     SOFMAP_TOP_URL,
@@ -23,7 +25,7 @@ from .constants import (
 async def dl_sofmap_top(
     url: str, max_retries: int = 2, delay_seconds: int = 1, timeout: int = 4
 ):
-    async with httpx.AsyncClient() as client:
+    async with httpx.AsyncClient(transport=get_shared_transport(url)) as client:
         for attempt in range(max_retries + 1):
             try:
                 res = await client.get(url, timeout=timeout)
@@ -55,10 +57,9 @@ async def create_category_data(ses: AsyncSession):
     ):
         try:
             top_text = await dl_sofmap_top(url=url)
-            cp = CategoryParser(html_str=top_text)
-            cp.execute()
+            category_result = await run_parse(parse_category, top_text)
             category_list = convert_categoryresult_to_categorydomain(
-                result=cp.get_results(), entity_type=entity_type
+                result=category_result, entity_type=entity_type
             )
             await repository.save_all(cate_entries=category_list)
         except Exception:
@@ -2,10 +2,11 @@ from urllib.parse import urlparse
 from typing import Any
 from pydantic import BaseModel, Field
 
-from sofmap.parser import SearchResultParser
+from sofmap.parser import parse_search_result
+from app.parse_executor import run_parse
 from . import cookie_util
 from .constants import A_SOFMAP_NETLOC
-from app.downloader import download_remotely, async_get
+from app.downloader import async_download_remotely, async_get
 
 
 class GetCommandWithSelenium(BaseModel):
@@ -55,7 +56,7 @@ async def get_html_with_selenium(command: GetCommandWithSelenium):
     if command.selenium_url:
         params["selenium_url"] = command.selenium_url
     try:
-        html = download_remotely(**params)
+        html = await async_download_remotely(**params)
     except Exception as e:
         return False, f"download error, {e} , url:{command.url}"
     return True, html
@@ -79,6 +80,4 @@ async def get_html(command: GetCommandWithHttpx):
 
 
 async def parse_html(html: str, url: str):
-    sparser = SearchResultParser(html_str=html, url=url)
-    sparser.execute()
-    return sparser.get_results()
+    return await run_parse(parse_search_result, html, url)
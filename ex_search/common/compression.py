@@ -0,0 +1,139 @@
+import functools
+import gzip
+from typing import Literal
+
+import structlog
+from sqlalchemy import LargeBinary
+from sqlalchemy.types import TypeDecorator
+
+from common import read_config
+
+logger = structlog.get_logger(__name__)
+
+try:
+    # Python 3.14以降
+    from compression import zstd as _zstd
+
+    def _zstd_compress(data: bytes, level: int | None) -> bytes:
+        return _zstd.compress(data, level=level)
+
+    def _zstd_decompress(data: bytes) -> bytes:
+        return _zstd.decompress(data)
+
+except ImportError:
+    try:
+        import zstandard as _zstd
+
+        def _zstd_compress(data: bytes, level: int | None) -> bytes:
+            return _zstd.ZstdCompressor(level=level or 3).compress(data)
+
+        def _zstd_decompress(data: bytes) -> bytes:
+            return _zstd.ZstdDecompressor().decompress(data)
+
+    except ImportError:
+        _zstd = None
+
+COMPRESSION_LITERAL = Literal["zstd", "gzip", "none"]
+
+# 圧縮したデータの先頭に付ける目印。付いていないものは圧縮前の形式として扱う
+MAGIC = b"\x89EXC"
+METHOD_IDS: dict[str, bytes] = {"none": b"\x00", "gzip": b"\x01", "zstd": b"\x02"}
+METHOD_NAMES = {v: k for k, v in METHOD_IDS.items()}
+HEADER_SIZE = len(MAGIC) + 1
+
+
+def is_zstd_available() -> bool:
+    return _zstd is not None
+
+
+def resolve_method(method: COMPRESSION_LITERAL) -> COMPRESSION_LITERAL:
+    if method == "zstd" and not is_zstd_available():
+        logger.warning("zstd is not available, gzip is used instead")
+        return "gzip"
+    return method
+
+
+def is_compressed(data: bytes) -> bool:
+    return data[: len(MAGIC)] == MAGIC and data[len(MAGIC) : HEADER_SIZE] in (
+        METHOD_NAMES
+    )
+
+
+def compress(
+    data: bytes, method: COMPRESSION_LITERAL = "gzip", level: int | None = None
+) -> bytes:
+    resolved = resolve_method(method)
+    if resolved != method:
+        # 代わりの方式では指定のレベルが範囲外になりうるため既定値を使う
+        method, level = resolved, None
+    match method:
+        case "zstd":
+            body = _zstd_compress(data, level)
+        case "gzip":
+            body = gzip.compress(data, compresslevel=6 if level is None else level)
+        case _:
+            body = data
+    return MAGIC + METHOD_IDS[method] + body
+
+
+def decompress(data: bytes) -> bytes:
+    """目印の無いデータはそのまま返す"""
+    if not is_compressed(data):
+        return data
+    method = METHOD_NAMES[data[len(MAGIC) : HEADER_SIZE]]
+    body = data[HEADER_SIZE:]
+    match method:
+        case "zstd":
+            if not is_zstd_available():
+                raise RuntimeError("zstd is not available to decompress data")
+            return _zstd_decompress(body)
+        case "gzip":
+            return gzip.decompress(body)
+        case _:
+            return body
+
+
+class Compressor:
+    method: COMPRESSION_LITERAL
+    level: int | None
+
+    def __init__(self, method: COMPRESSION_LITERAL = "gzip", level: int | None = None):
+        self.method = resolve_method(method)
+        self.level = level if self.method == method else None
+
+    def compress_text(self, text: str) -> bytes:
+        return compress(text.encode("utf-8"), method=self.method, level=self.level)
+
+    def decompress_text(self, data: bytes | str) -> str:
+        if isinstance(data, str):
+            return data
+        return decompress(data).decode("utf-8")
+
+
+@functools.cache
+def get_cache_compressor() -> Compressor:
+    cacheopts = read_config.get_cache_options()
+    return Compressor(method=cacheopts.compression, level=cacheopts.compression_level)
+
+
+read_config.add_reload_listener(get_cache_compressor.cache_clear)
+
+
+class CompressedText(TypeDecorator):
+    """
+    文字列を圧縮して保存する列の型。
+    圧縮済みのbytesはそのまま保存し、読み込み時は圧縮前に保存された文字列もそのまま返す。
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, bytes):
+            return value
+        return get_cache_compressor().compress_text(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return value
+        return get_cache_compressor().decompress_text(value)
@@ -0,0 +1,45 @@
+from lxml import etree
+
+# 文字列を返すXPathの結果が元の木を参照し続けないようにsmart_stringsは無効にする
+_TEXT = etree.XPath("string()", smart_strings=False)
+
+
+def parse_html(html_str: str) -> etree._Element | None:
+    if not html_str or not html_str.strip():
+        return None
+    return etree.HTML(html_str)
+
+
+def has_class(*class_names: str) -> str:
+    """CSSのクラスセレクタに相当するXPathの条件式を返す"""
+    return " and ".join(
+        f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+        for name in class_names
+    )
+
+
+def compile_xpath(path: str) -> etree.XPath:
+    return etree.XPath(path, smart_strings=False)
+
+
+def get_text(elem: etree._Element) -> str:
+    """子孫を含めたテキスト(コメントは含まない)"""
+    return _TEXT(elem)
+
+
+def get_first_string(elem: etree._Element) -> str | None:
+    """文書順で最初のテキストノード"""
+    if elem.text is not None:
+        return elem.text
+    for child in elem:
+        if isinstance(child.tag, str):
+            text = get_first_string(child)
+            if text is not None:
+                return text
+        if child.tail is not None:
+            return child.tail
+    return None
+
+
+def get_classes(elem: etree._Element) -> list[str]:
+    return (elem.get("class") or "").split()
@@ -1,32 +1,54 @@
-from typing import Literal
-
-from pydantic import BaseModel, Field
+import copy
+import functools
+import importlib
+import json
+import os
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Callable, Literal
+
+import structlog
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 
 import settings
 
+logger = structlog.get_logger(__name__)
+
+# 環境変数で設定を上書きする際の接頭辞。EX_SEARCH__CACHE_OPTIONS__EXPIRES=600 のように指定する
+ENV_PREFIX = "EX_SEARCH__"
+ENV_FILE_ENV = "EX_SEARCH_ENV_FILE"
+
+
+class FrozenOptions(BaseModel):
+    """読み込んだ設定は共有するため変更できないようにする"""
+
+    model_config = ConfigDict(frozen=True)
+
 
-class SeleniumOptions(BaseModel):
+class SeleniumOptions(FrozenOptions):
     remote_url: str
+    max_sessions: int = Field(default=2, ge=1, le=100)
+    max_uses_per_session: int = Field(default=20, ge=1, le=10000)
 
 
-class NodriverOptions(BaseModel):
+class NodriverOptions(FrozenOptions):
     base_url: str
 
 
-class SelenimuTimeoutOptions(BaseModel):
+class SelenimuTimeoutOptions(FrozenOptions):
     page_load_timeout: int = Field(ge=2, le=100)
     tag_wait_timeout: int = Field(ge=1, le=99)
 
 
-class SofmapOptions(BaseModel):
+class SofmapOptions(FrozenOptions):
     selenium: SelenimuTimeoutOptions
 
 
-class GeoOptions(BaseModel):
+class GeoOptions(FrozenOptions):
     selenium: SelenimuTimeoutOptions
 
 
-class SQLParams(BaseModel):
+class SQLParams(FrozenOptions):
     drivername: str
     database: str
     username: str | None = None
@@ -35,39 +57,196 @@ class SQLParams(BaseModel):
     port: str | None = None
 
 
-class DataBaseOptions(BaseModel):
+class SQLiteOptions(FrozenOptions):
+    enabled: bool = Field(default=True)
+    journal_mode: Literal["WAL", "DELETE", "TRUNCATE", "PERSIST", "MEMORY"] = Field(
+        default="WAL"
+    )
+    synchronous: Literal["OFF", "NORMAL", "FULL", "EXTRA"] = Field(default="NORMAL")
+    busy_timeout: int = Field(default=5000, ge=0)
+    cache_size: int = Field(default=-20000)
+    mmap_size: int = Field(default=268435456, ge=0)
+    temp_store: Literal["DEFAULT", "FILE", "MEMORY"] = Field(default="MEMORY")
+    # 新規に作成するDBにのみ反映される
+    auto_vacuum: Literal["NONE", "FULL", "INCREMENTAL"] = Field(default="INCREMENTAL")
+
+
+class DataBasePoolOptions(FrozenOptions):
+    pool_size: int = Field(default=5, ge=1, le=100)
+    max_overflow: int = Field(default=10, ge=0, le=100)
+    pool_timeout: float = Field(default=30, gt=0)
+    pool_recycle: int = Field(default=-1)
+    pool_pre_ping: bool = Field(default=False)
+
+
+class DataBaseOptions(FrozenOptions):
     sync: SQLParams
     a_sync: SQLParams
 
 
-class RedisOptions(BaseModel):
+class RedisOptions(FrozenOptions):
     host: str
     port: int
     db: int
+    max_connections: int | None = Field(default=None, ge=1)
 
 
-class LogOptions(BaseModel):
+class LogOptions(FrozenOptions):
     directory_path: str
 
 
-class SearchOptions(BaseModel):
+class SearchOptions(FrozenOptions):
     safe_search: bool
 
 
 CACHE_BACKEND_LITERAL = Literal["redis", "sql"]
 
 
-class CacheOptions(BaseModel):
-    expires: int | None = Field(ge=1, le=86400)
-    backend: CACHE_BACKEND_LITERAL = Field(default="sql")
+CACHE_COMPRESSION_LITERAL = Literal["zstd", "gzip", "none"]
+# 圧縮方式毎に指定できる圧縮レベルの範囲
+COMPRESSION_LEVEL_RANGES = {"gzip": (0, 9), "zstd": (-7, 22)}
 
 
-class DownloadWaitTimeOptions(BaseModel):
+class CacheOptions(FrozenOptions):
+    expires: int | None = Field(ge=1, le=86400)
+    backend: CACHE_BACKEND_LITERAL = Field(default="sql")
+    compression: CACHE_COMPRESSION_LITERAL = Field(default="zstd")
+    compression_level: int | None = Field(default=None, ge=-7, le=22)
+    parsed_cache: bool = Field(default=True)
+    stale_while_revalidate: int | None = Field(default=None, ge=0, le=86400)
+
+    @model_validator(mode="after")
+    def check_compression_level(self):
+        level_range = COMPRESSION_LEVEL_RANGES.get(self.compression)
+        if self.compression_level is None or level_range is None:
+            return self
+        low, high = level_range
+        if not low <= self.compression_level <= high:
+            raise ValueError(
+                f"compression_level of {self.compression} must be between {low} and {high}"
+            )
+        return self
+
+
+class CacheSweeperOptions(FrozenOptions):
+    enabled: bool = Field(default=True)
+    interval: int = Field(default=300, ge=1, le=86400)
+    batch_size: int = Field(default=500, ge=1, le=10000)
+    max_total_bytes: int | None = Field(default=536870912, ge=0)
+    vacuum_pages: int = Field(default=1000, ge=0)
+
+
+class DownloadWaitTimeOptions(FrozenOptions):
     timeout_for_each_url: int = Field(ge=1, le=3600)
     timeout_util_downloadable: int = Field(ge=1, le=86400)
     min_wait_time_of_dl: float = Field(ge=0, le=15)
 
 
+DOMAIN_LOCK_BACKEND_LITERAL = Literal["redis", "local"]
+
+
+class DomainLockOptions(FrozenOptions):
+    backend: DOMAIN_LOCK_BACKEND_LITERAL = Field(default="redis")
+    hold_seconds: int = Field(default=300, ge=1, le=86400)
+
+
+RATE_LIMIT_BACKEND_LITERAL = Literal["redis", "local"]
+
+
+class DomainRateOptions(FrozenOptions):
+    # 1秒あたりのダウンロード数
+    rate: float = Field(default=0.66, gt=0, le=100)
+    burst: int = Field(default=1, ge=1, le=100)
+    # 同時にダウンロードする数。ドメインロックとバッチ検索のドメイン毎の制限に使う
+    max_concurrency: int = Field(default=1, ge=1, le=100)
+
+
+class RateLimitOptions(FrozenOptions):
+    backend: RATE_LIMIT_BACKEND_LITERAL = Field(default="redis")
+    default: DomainRateOptions = Field(default_factory=DomainRateOptions)
+    domains: dict[str, DomainRateOptions] = Field(default_factory=dict)
+    # 429等やエラーが多い場合にrateに掛ける値
+    backoff_factor: float = Field(default=0.5, gt=0, lt=1)
+    # 成功が続いた場合に設定のrateに対してこの割合ずつ戻す
+    increase_step: float = Field(default=0.1, gt=0, le=1)
+    window_size: int = Field(default=10, ge=1, le=1000)
+    error_ratio: float = Field(default=0.3, gt=0, le=1)
+    min_rate: float = Field(default=0.05, gt=0, le=100)
+    state_seconds: int = Field(default=3600, ge=1, le=86400)
+
+    def get_domain(self, domain: str) -> DomainRateOptions:
+        return self.domains.get(domain, self.default)
+
+
+CIRCUIT_BREAKER_BACKEND_LITERAL = Literal["redis", "local"]
+
+
+class CircuitBreakerOptions(FrozenOptions):
+    enabled: bool = Field(default=True)
+    backend: CIRCUIT_BREAKER_BACKEND_LITERAL = Field(default="redis")
+    failure_threshold: int = Field(default=5, ge=1, le=1000)
+    cooldown_seconds: float = Field(default=30, gt=0, le=3600)
+    # half_openで試行中の1件が結果を記録しないまま終わった場合に、次の試行を許すまでの秒数
+    probe_timeout: float = Field(default=120, gt=0, le=3600)
+    state_seconds: int = Field(default=3600, ge=1, le=86400)
+
+
+class MetricsOptions(FrozenOptions):
+    enabled: bool = Field(default=True)
+    # ラベルに使うドメインの数。超えた分は"other"にまとめる
+    max_domain_labels: int = Field(default=100, ge=0, le=10000)
+
+
+SINGLEFLIGHT_BACKEND_LITERAL = Literal["redis", "local"]
+
+
+class SingleFlightOptions(FrozenOptions):
+    backend: SINGLEFLIGHT_BACKEND_LITERAL = Field(default="redis")
+    marker_seconds: int = Field(default=300, ge=1, le=86400)
+    result_seconds: int = Field(default=30, ge=1, le=3600)
+
+
+class HTTPClientOptions(FrozenOptions):
+    max_connections_per_host: int = Field(default=10, ge=1, le=1000)
+    max_keepalive_connections_per_host: int = Field(default=5, ge=0, le=1000)
+    keepalive_expiry: float = Field(default=30, ge=0, le=3600)
+    http2: bool = Field(default=False)
+
+
+class BatchSearchOptions(FrozenOptions):
+    max_requests: int = Field(default=500, ge=1, le=10000)
+    max_concurrency: int = Field(default=10, ge=1, le=1000)
+
+
+PARSE_EXECUTOR_BACKEND_LITERAL = Literal["process", "thread", "inline"]
+
+
+class ParseExecutorOptions(FrozenOptions):
+    backend: PARSE_EXECUTOR_BACKEND_LITERAL = Field(default="process")
+    max_workers: int = Field(default=2, ge=1, le=64)
+    max_tasks_per_child: int | None = Field(default=1000, ge=1)
+    warn_queue_depth: int = Field(default=20, ge=1)
+
+
+ACTIVITYLOG_WRITER_LITERAL = Literal["buffered", "direct"]
+
+
+class ActivityLogOptions(FrozenOptions):
+    writer: ACTIVITYLOG_WRITER_LITERAL = Field(default="buffered")
+    max_queue_size: int = Field(default=10000, ge=1)
+    batch_size: int = Field(default=200, ge=1, le=10000)
+    flush_interval: float = Field(default=0.5, gt=0, le=60)
+    database: SQLParams | None = None
+
+
+class SandboxOptions(FrozenOptions):
+    max_workers: int = Field(default=2, ge=1, le=32)
+    max_jobs_per_worker: int = Field(default=50, ge=1, le=10000)
+    memory_limit_mb: int = Field(default=512, ge=64, le=65536)
+    cpu_seconds_per_job: int = Field(default=10, ge=1, le=600)
+    max_cached_parsers: int = Field(default=32, ge=0, le=1000)
+
+
 def to_lower_keys(obj):
     if isinstance(obj, dict):
         # 新しい辞書を構築し、各キーを小文字に変換
@@ -84,68 +263,310 @@ def to_lower_keys(obj):
         return obj
 
 
+_MISSING = object()
+# 読み込み済みの設定。get_*()の結果を関数名毎に保持し、reload_settings()で作り直す
+_snapshot_values: dict[str, Any] = {}
+_snapshot_getters: list[Callable[[], Any]] = []
+_reload_listeners: list[Callable[[], None]] = []
+
+
+def _snapshot(func: Callable[[], Any]) -> Callable[[], Any]:
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper():
+        try:
+            return _snapshot_values[name]
+        except KeyError:
+            pass
+        value = func()
+        _snapshot_values[name] = value
+        return value
+
+    _snapshot_getters.append(wrapper)
+    return wrapper
+
+
+def _freeze(obj):
+    if isinstance(obj, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in obj.items()})
+    elif isinstance(obj, (list, tuple)):
+        return tuple(_freeze(elem) for elem in obj)
+    return obj
+
+
+def _read_env_file(path: Path) -> dict[str, str]:
+    values = {}
+    if not path.is_file():
+        return values
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        key = key.strip().removeprefix("export ").strip()
+        value = value.strip()
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+            value = value[1:-1]
+        values[key] = value
+    return values
+
+
+def _get_env_overrides() -> dict[str, str]:
+    """.envと環境変数から上書きする値を集める。環境変数を優先する"""
+    try:
+        return _snapshot_values["_env_overrides"]
+    except KeyError:
+        pass
+    env_file = (
+        os.environ.get(ENV_FILE_ENV)
+        or Path(getattr(settings, "BASE_DIR", ".")) / ".env"
+    )
+    values = {
+        k.upper(): v
+        for k, v in _read_env_file(Path(env_file)).items()
+        if k.upper().startswith(ENV_PREFIX)
+    }
+    values.update(
+        {
+            k.upper(): v
+            for k, v in os.environ.items()
+            if k.upper().startswith(ENV_PREFIX)
+        }
+    )
+    _snapshot_values["_env_overrides"] = values
+    return values
+
+
+def _parse_env_value(value: str):
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def _get_setting(name: str, default=_MISSING):
+    if default is _MISSING:
+        value = getattr(settings, name)
+    else:
+        value = getattr(settings, name, default)
+    prefix = ENV_PREFIX + name
+    overrides = sorted(
+        (k, v)
+        for k, v in _get_env_overrides().items()
+        if k == prefix or k.startswith(prefix + "__")
+    )
+    if not overrides:
+        return value
+    value = copy.deepcopy(value)
+    for key, raw_value in overrides:
+        path = key[len(prefix) :].split("__")[1:]
+        if not path:
+            value = _parse_env_value(raw_value)
+            continue
+        if not isinstance(value, dict):
+            value = {}
+        target = value
+        for part in path[:-1]:
+            matched = _match_key(target, part)
+            if not isinstance(target.get(matched), dict):
+                target[matched] = {}
+            target = target[matched]
+        target[_match_key(target, path[-1])] = _parse_env_value(raw_value)
+    return value
+
+
+def _match_key(target: dict, key: str):
+    # 設定のキーは大文字小文字を区別しないため、既存のキーに合わせる
+    for k in target:
+        if isinstance(k, str) and k.lower() == key.lower():
+            return k
+    return key.lower()
+
+
+def load_settings():
+    """全ての設定を読み込む。起動時に呼び出し、設定の誤りをその時点で検出する"""
+    for getter in _snapshot_getters:
+        getter()
+
+
+def add_reload_listener(listener: Callable[[], None]):
+    """設定を読み込み直した後に呼び出す処理を登録する"""
+    _reload_listeners.append(listener)
+
+
+def reload_settings():
+    """
+    settings.pyと環境変数を読み込み直す。読み込みに失敗した場合は元の設定のまま例外を送出する。
+    DBの接続先や接続プール、ワーカー数など起動時に作るものへの反映には再起動が必要。
+    """
+    previous = dict(_snapshot_values)
+    _snapshot_values.clear()
+    try:
+        importlib.reload(settings)
+        load_settings()
+    except Exception:
+        _snapshot_values.clear()
+        _snapshot_values.update(previous)
+        raise
+    for listener in _reload_listeners:
+        listener()
+    logger.info("settings reloaded")
+
+
+@_snapshot
 def get_selenium_options():
-    lower_key_dict = to_lower_keys(settings.SELENIUM_OPTIONS)
+    lower_key_dict = to_lower_keys(_get_setting("SELENIUM_OPTIONS"))
     return SeleniumOptions(**lower_key_dict)
 
 
+@_snapshot
 def get_nodriver_options():
-    lower_key_dict = to_lower_keys(settings.NODRIVER_API_OPTIONS)
+    lower_key_dict = to_lower_keys(_get_setting("NODRIVER_API_OPTIONS"))
     return NodriverOptions(**lower_key_dict)
 
 
+@_snapshot
 def get_sofmap_options():
-    lower_key_dict = to_lower_keys(settings.SOFMAP_OPTIONS)
+    lower_key_dict = to_lower_keys(_get_setting("SOFMAP_OPTIONS"))
     return SofmapOptions(**lower_key_dict)
 
 
+@_snapshot
 def get_geo_options():
-    lower_key_dict = to_lower_keys(settings.GEO_OPTIONS)
+    lower_key_dict = to_lower_keys(_get_setting("GEO_OPTIONS"))
     return GeoOptions(**lower_key_dict)
 
 
+@_snapshot
 def get_databases():
-    lower_key_dict = to_lower_keys(settings.DATABASES)
+    lower_key_dict = to_lower_keys(_get_setting("DATABASES"))
     return DataBaseOptions(**lower_key_dict)
 
 
+@_snapshot
+def get_sqlite_options():
+    lower_key_dict = to_lower_keys(_get_setting("SQLITE_OPTIONS", {}))
+    return SQLiteOptions(**lower_key_dict)
+
+
+@_snapshot
+def get_database_pool_options():
+    lower_key_dict = to_lower_keys(_get_setting("DATABASE_POOL_OPTIONS", {}))
+    return DataBasePoolOptions(**lower_key_dict)
+
+
+@_snapshot
 def get_redis_options():
-    lower_key_dict = to_lower_keys(settings.REDIS_OPTIONS)
+    lower_key_dict = to_lower_keys(_get_setting("REDIS_OPTIONS"))
     return RedisOptions(**lower_key_dict)
 
 
+@_snapshot
 def get_log_options():
-    lower_key_dict = to_lower_keys(settings.LOG_OPTIONS)
+    lower_key_dict = to_lower_keys(_get_setting("LOG_OPTIONS"))
     return LogOptions(**lower_key_dict)
 
 
+@_snapshot
 def get_cache_options():
-    lower_key_dict = to_lower_keys(settings.CACHE_OPTIONS)
+    lower_key_dict = to_lower_keys(_get_setting("CACHE_OPTIONS"))
     return CacheOptions(**lower_key_dict)
 
 
+@_snapshot
+def get_cache_sweeper_options():
+    lower_key_dict = to_lower_keys(_get_setting("CACHE_SWEEPER_OPTIONS", {}))
+    return CacheSweeperOptions(**lower_key_dict)
+
+
+@_snapshot
 def get_download_waittime_options():
-    lower_key_dict = to_lower_keys(settings.DOWNLOAD_WAITTIME_OPTIONS)
+    lower_key_dict = to_lower_keys(_get_setting("DOWNLOAD_WAITTIME_OPTIONS"))
     return DownloadWaitTimeOptions(**lower_key_dict)
 
 
+@_snapshot
+def get_domain_lock_options():
+    lower_key_dict = to_lower_keys(_get_setting("DOMAIN_LOCK_OPTIONS", {}))
+    return DomainLockOptions(**lower_key_dict)
+
+
+@_snapshot
+def get_rate_limit_options():
+    lower_key_dict = to_lower_keys(_get_setting("RATE_LIMIT_OPTIONS", {}))
+    return RateLimitOptions(**lower_key_dict)
+
+
+@_snapshot
+def get_circuit_breaker_options():
+    lower_key_dict = to_lower_keys(_get_setting("CIRCUIT_BREAKER_OPTIONS", {}))
+    return CircuitBreakerOptions(**lower_key_dict)
+
+
+@_snapshot
+def get_metrics_options():
+    lower_key_dict = to_lower_keys(_get_setting("METRICS_OPTIONS", {}))
+    return MetricsOptions(**lower_key_dict)
+
+
+@_snapshot
+def get_singleflight_options():
+    lower_key_dict = to_lower_keys(_get_setting("SINGLEFLIGHT_OPTIONS", {}))
+    return SingleFlightOptions(**lower_key_dict)
+
+
+@_snapshot
+def get_http_client_options():
+    lower_key_dict = to_lower_keys(_get_setting("HTTP_CLIENT_OPTIONS", {}))
+    return HTTPClientOptions(**lower_key_dict)
+
+
+@_snapshot
+def get_batch_search_options():
+    lower_key_dict = to_lower_keys(_get_setting("BATCH_SEARCH_OPTIONS", {}))
+    return BatchSearchOptions(**lower_key_dict)
+
+
+@_snapshot
+def get_parse_executor_options():
+    lower_key_dict = to_lower_keys(_get_setting("PARSE_EXECUTOR_OPTIONS", {}))
+    return ParseExecutorOptions(**lower_key_dict)
+
+
+@_snapshot
+def get_sandbox_options():
+    lower_key_dict = to_lower_keys(_get_setting("SANDBOX_OPTIONS", {}))
+    return SandboxOptions(**lower_key_dict)
+
+
+@_snapshot
+def get_activitylog_options():
+    lower_key_dict = to_lower_keys(_get_setting("ACTIVITYLOG_OPTIONS", {}))
+    return ActivityLogOptions(**lower_key_dict)
+
+
+@_snapshot
 def get_search_options():
-    lower_key_dict = to_lower_keys(settings.SEARCH_OPTIONS)
+    lower_key_dict = to_lower_keys(_get_setting("SEARCH_OPTIONS"))
     return SearchOptions(**lower_key_dict)
 
 
+@_snapshot
 def get_cookie_dir_path():
-    return settings.COOKIE_DIR_PATH
+    return _get_setting("COOKIE_DIR_PATH")
 
 
+@_snapshot
 def get_model_escalation_list():
-    return settings.MODEL_ESCALATION_LIST
+    return _freeze(_get_setting("MODEL_ESCALATION_LIST"))
 
 
+@_snapshot
 def get_external_api_config() -> dict:
     """
     settings.py から外部API連携の設定を取得します。
     設定が存在しない場合は空の構成を返します。
     """
     default_config = {"url_generation": {}, "downloader": {}, "parser": {}}
-    return getattr(settings, "EXTERNAL_API_CONFIG", default_config)
+    return _freeze(_get_setting("EXTERNAL_API_CONFIG", default_config))
@@ -1,8 +1,10 @@
 import json
 import uuid
+from datetime import datetime, timezone
 
 import redis.asyncio as aredis
 
+from common.compression import decompress, get_cache_compressor
 from domain.models.cache import cache, command, repository
 
 
@@ -21,24 +23,62 @@ class SearchCacheRedisRepository(repository.ISearchCacheRepository):
     async def save(self, data: cache.SearchCache):
         if not data.id:
             data.id = uuid.uuid4().int
-        async with self.r.client() as client:
-            key = await self._create_key(data.url)
-            await client.set(key, data.model_dump_json(), ex=self.expiry_seconds)
+        key = await self._create_key(data.url)
+        value = get_cache_compressor().compress_text(data.model_dump_json())
+        await self.r.set(key, value, ex=self.expiry_seconds)
 
     async def get(
         self, command: command.SearchCacheGetCommand
     ) -> list[cache.SearchCache]:
         if not command.url:
             return []
-        async with self.r.client() as client:
-            key = await self._create_key(command.url)
-            cached_data = await client.get(key)
-            if not cached_data:
-                return []
-            try:
-                return [cache.SearchCache(**json.loads(cached_data))]
-            except Exception as e:
-                return []
+        key = await self._create_key(command.url)
+        cached_data = await self.r.get(key)
+        if not cached_data:
+            return []
+        try:
+            # 圧縮前に保存されたものはそのまま読み込む
+            data = cache.SearchCache(**json.loads(decompress(cached_data)))
+        except Exception as e:
+            return []
+        if (
+            command.expires_start
+            and data.expires
+            and _as_aware(data.expires) < command.expires_start
+        ):
+            return []
+        return [data]
 
     async def _create_key(self, url: str) -> str:
         return self.HEADER + url
+
+
+class ParsedSearchCacheRedisRepository(repository.IParsedSearchCacheRepository):
+    HEADER = "PARSED:"
+    r: aredis.Redis
+
+    def __init__(self, r: aredis.Redis):
+        self.r = r
+
+    async def save(self, data: cache.ParsedSearchCache):
+        expires = _as_aware(data.expires)
+        expiry_seconds = int((expires - datetime.now(timezone.utc)).total_seconds())
+        if expiry_seconds <= 0:
+            return
+        value = get_cache_compressor().compress_text(data.model_dump_json())
+        await self.r.set(self.HEADER + data.cache_key, value, ex=expiry_seconds)
+
+    async def get(self, cache_key: str) -> cache.ParsedSearchCache | None:
+        cached_data = await self.r.get(self.HEADER + cache_key)
+        if not cached_data:
+            return None
+        try:
+            return cache.ParsedSearchCache(**json.loads(decompress(cached_data)))
+        except Exception:
+            return None
+
+
+def _as_aware(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
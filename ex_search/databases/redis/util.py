@@ -1,10 +1,47 @@
 from common.read_config import get_redis_options
 import redis.asyncio as a_redis
 
+_connection_pool: a_redis.ConnectionPool | None = None
+
+
+def create_redis_pool() -> a_redis.ConnectionPool:
+    redisopts = get_redis_options()
+    return a_redis.ConnectionPool(
+        host=redisopts.host,
+        port=redisopts.port,
+        db=redisopts.db,
+        max_connections=redisopts.max_connections,
+    )
+
+
+def get_redis_pool() -> a_redis.ConnectionPool:
+    global _connection_pool
+    if _connection_pool is None:
+        _connection_pool = create_redis_pool()
+    return _connection_pool
+
+
+def init_redis_pool():
+    get_redis_pool()
+
+
+async def close_redis_pool():
+    global _connection_pool
+    if _connection_pool is None:
+        return
+    await _connection_pool.aclose()
+    _connection_pool = None
+
 
 def get_async_redis(
     host: str | None = None, port: int | None = None, db: int | None = None
 ):
+    """
+    接続先を指定しない場合はプロセスで共有する接続プールを使う。
+    指定した場合はその接続先用のクライアントを新たに作る。
+    """
+    if host is None and port is None and db is None:
+        return a_redis.Redis(connection_pool=get_redis_pool())
     redisopts = get_redis_options()
     params = {}
     if host is None:
@@ -14,7 +51,7 @@ def get_async_redis(
     if port is None:
         params["port"] = redisopts.port
     else:
-        params["post"] = port
+        params["port"] = port
     if db is None:
         params["db"] = redisopts.db
     else:
@@ -45,6 +45,25 @@ class ActivityLogRepository(a_repo.IActivityLogRepository):
     async def get(
         self, command: a_cmd.ActivityLogGetCommand
     ) -> list[m_actlog.ActivityLog]:
+        stmt = self._create_select_stmt(command)
+        res = await self.session.execute(stmt)
+        results = res.scalars()
+        if not results:
+            return []
+        return results.all()
+
+    async def get_latest(
+        self, command: a_cmd.ActivityLogGetCommand
+    ) -> m_actlog.ActivityLog | None:
+        stmt = (
+            self._create_select_stmt(command)
+            .order_by(m_actlog.ActivityLog.updated_at.desc())
+            .limit(1)
+        )
+        res = await self.session.execute(stmt)
+        return res.scalars().first()
+
+    def _create_select_stmt(self, command: a_cmd.ActivityLogGetCommand):
         stmt = select(m_actlog.ActivityLog)
         if command.id:
             stmt = stmt.where(m_actlog.ActivityLog.id == command.id)
@@ -69,10 +88,6 @@ class ActivityLogRepository(a_repo.IActivityLogRepository):
                 m_actlog.ActivityLog.updated_at >= command.updated_at_start
             )
         if command.updated_at_end:
-            stmt = stmt.where(m_actlog.ActivityLog.updated_at >= command.updated_at_end)
+            stmt = stmt.where(m_actlog.ActivityLog.updated_at <= command.updated_at_end)
 
-        res = await self.session.execute(stmt)
-        results = res.scalars()
-        if not results:
-            return []
-        return results.all()
+        return stmt
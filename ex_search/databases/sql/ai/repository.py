@@ -1,5 +1,7 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import defer
 from sqlalchemy.sql import func
 
 from domain.models.ai import (
@@ -28,6 +30,9 @@ class ParserGenerationLogRepository(a_repo.IParserGenerationLogRepository):
 
             if not db_ailog:
                 raise ValueError(f"not found update_entry.id ,{log_entry.id}")
+            if db_ailog is log_entry:
+                # 同じセッションで読み込んだものは変更が追跡されているためそのまま保存する
+                continue
             db_ailog.label = log_entry.label
             db_ailog.target_url = log_entry.target_url
             db_ailog.query = log_entry.query
@@ -44,6 +49,23 @@ class ParserGenerationLogRepository(a_repo.IParserGenerationLogRepository):
     async def get(
         self, command: a_cmd.ParserGenerationLogGetCommand
     ) -> list[m_ailog.ParserGenerationLog]:
+        stmt = self._create_select_stmt(command)
+        res = await self.session.execute(stmt)
+        return res.scalars().all()
+
+    async def get_latest(
+        self, command: a_cmd.ParserGenerationLogGetCommand
+    ) -> m_ailog.ParserGenerationLog | None:
+        # 生成時に送ったHTMLは大きいため読み込まない
+        stmt = (
+            self._create_select_stmt(command)
+            .options(defer(m_ailog.ParserGenerationLog.query))
+            .limit(1)
+        )
+        res = await self.session.execute(stmt)
+        return res.scalars().first()
+
+    def _create_select_stmt(self, command: a_cmd.ParserGenerationLogGetCommand):
         stmt = select(m_ailog.ParserGenerationLog)
         if command.id:
             stmt = stmt.where(m_ailog.ParserGenerationLog.id == command.id)
@@ -66,9 +88,41 @@ class ParserGenerationLogRepository(a_repo.IParserGenerationLogRepository):
                 stmt = stmt.where(m_ailog.ParserGenerationLog.error_info.is_(None))
             else:
                 stmt = stmt.where(m_ailog.ParserGenerationLog.error_info.is_not(None))
-        stmt = stmt.order_by(m_ailog.ParserGenerationLog.id.desc())
+        return stmt.order_by(m_ailog.ParserGenerationLog.id.desc())
+
+
+class ActiveParserRepository(a_repo.IActiveParserRepository):
+    session: AsyncSession
+
+    def __init__(self, ses: AsyncSession):
+        self.session = ses
+
+    async def get(self, label: str) -> m_ailog.ActiveParser | None:
+        stmt = select(m_ailog.ActiveParser).where(m_ailog.ActiveParser.label == label)
         res = await self.session.execute(stmt)
-        return res.scalars().all()
+        return res.scalars().first()
+
+    async def save(self, active_parser: m_ailog.ActiveParser):
+        ses = self.session
+        db_active = await self.get(label=active_parser.label)
+        if db_active:
+            db_active.log_id = active_parser.log_id
+            db_active.code = active_parser.code
+            db_active.code_hash = active_parser.code_hash
+        else:
+            ses.add(active_parser)
+        try:
+            await ses.commit()
+        except IntegrityError:
+            # 同じlabelを同時に登録した場合は先に登録された方を使う
+            await ses.rollback()
+
+    async def delete(self, label: str, log_id: int | None = None):
+        stmt = delete(m_ailog.ActiveParser).where(m_ailog.ActiveParser.label == label)
+        if log_id is not None:
+            stmt = stmt.where(m_ailog.ActiveParser.log_id == log_id)
+        await self.session.execute(stmt)
+        await self.session.commit()
 
 
 class DownloadConfigGenerationLogRepository(
@@ -1,9 +1,46 @@
+from collections import OrderedDict
+from datetime import datetime, timezone
+
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete, func, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import select, delete, update, func, or_, text, bindparam, cast
+from sqlalchemy import LargeBinary
 
+from common.compression import get_cache_compressor
 from domain.models.cache import cache, command, repository
 
 
+class SearchCacheAccessTracker:
+    """
+    キャッシュの参照時刻をメモリに溜める。
+    参照の度に書き込まないよう、DBへの反映はメンテナンス時にまとめて行う。
+    """
+
+    maxsize: int
+
+    def __init__(self, maxsize: int = 100000):
+        self.maxsize = maxsize
+        self._access_times: OrderedDict[int, datetime] = OrderedDict()
+
+    def record(self, id: int, accessed_at: datetime | None = None):
+        self._access_times[id] = accessed_at or datetime.now(timezone.utc)
+        self._access_times.move_to_end(id)
+        while len(self._access_times) > self.maxsize:
+            self._access_times.popitem(last=False)
+
+    def pop_all(self) -> dict[int, datetime]:
+        access_times = dict(self._access_times)
+        self._access_times.clear()
+        return access_times
+
+
+_access_tracker = SearchCacheAccessTracker()
+
+
+def get_access_tracker() -> SearchCacheAccessTracker:
+    return _access_tracker
+
+
 class SearchCacheRepository(repository.ISearchCacheRepository):
     session: AsyncSession
 
@@ -12,7 +49,15 @@ class SearchCacheRepository(repository.ISearchCacheRepository):
 
     async def save(self, data: cache.SearchCache):
         ses = self.session
+        stored_text = data.download_text
+        if isinstance(stored_text, str):
+            stored_text = get_cache_compressor().compress_text(stored_text)
+        data.data_size = len(stored_text)
         if not data.id:
+            if data.last_accessed_at is None:
+                data.last_accessed_at = datetime.now(timezone.utc)
+            # 保存後のrefreshで展開した文字列に戻る
+            data.download_text = stored_text
             ses.add(data)
             await ses.commit()
             await ses.refresh(data)
@@ -23,8 +68,9 @@ class SearchCacheRepository(repository.ISearchCacheRepository):
         db_data.domain = data.domain
         db_data.url = data.url
         db_data.download_type = data.download_type
-        db_data.download_text = data.download_text
+        db_data.download_text = stored_text
         db_data.error_msg = data.error_msg
+        db_data.data_size = data.data_size
         db_data.expires = db_data.expires
         await ses.commit()
         await ses.refresh(data)
@@ -48,7 +94,54 @@ class SearchCacheRepository(repository.ISearchCacheRepository):
         result = res.scalars()
         if not result:
             return []
-        return result.all()
+        results = result.all()
+        if results:
+            get_access_tracker().record(results[0].id)
+        return results
+
+
+class ParsedSearchCacheRepository(repository.IParsedSearchCacheRepository):
+    session: AsyncSession
+
+    def __init__(self, ses: AsyncSession):
+        self.session = ses
+
+    async def save(self, data: cache.ParsedSearchCache):
+        ses = self.session
+        db_data = await self._get(cache_key=data.cache_key)
+        if db_data:
+            db_data.url = data.url
+            db_data.sitename = data.sitename
+            db_data.parser_version = data.parser_version
+            db_data.response = data.response
+            db_data.expires = data.expires
+        else:
+            ses.add(data)
+        try:
+            await ses.commit()
+        except IntegrityError:
+            # 同じキーを同時に保存した場合は先に保存された方を使う
+            await ses.rollback()
+
+    async def get(self, cache_key: str) -> cache.ParsedSearchCache | None:
+        db_data = await self._get(cache_key=cache_key)
+        if not db_data or _as_aware(db_data.expires) < datetime.now(timezone.utc):
+            return None
+        return db_data
+
+    async def _get(self, cache_key: str) -> cache.ParsedSearchCache | None:
+        stmt = select(cache.ParsedSearchCache).where(
+            cache.ParsedSearchCache.cache_key == cache_key
+        )
+        res = await self.session.execute(stmt)
+        return res.scalars().first()
+
+
+def _as_aware(value: datetime) -> datetime:
+    # SQLiteから読み込んだ日時はタイムゾーンを持たない
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
 
 
 class SearchCacheDeleteRepository(repository.ISearchCacheDeleteRepository):
@@ -74,3 +167,113 @@ class SearchCacheDeleteRepository(repository.ISearchCacheDeleteRepository):
                     )
                 )
         await self.session.execute(stmt)
+
+
+class SearchCacheMaintenanceRepository(repository.ISearchCacheMaintenanceRepository):
+    session: AsyncSession
+
+    def __init__(self, ses: AsyncSession):
+        self.session = ses
+
+    async def update_access_times(self, access_times: dict[int, datetime]):
+        if not access_times:
+            return
+        table = cache.SearchCache.__table__
+        stmt = (
+            update(table)
+            .where(table.c.id == bindparam("b_id"))
+            .values(last_accessed_at=bindparam("b_accessed_at"))
+        )
+        conn = await self.session.connection()
+        await conn.execute(
+            stmt,
+            [{"b_id": k, "b_accessed_at": v} for k, v in access_times.items()],
+        )
+        await self.session.commit()
+
+    async def delete_expired(self, now: datetime, limit: int) -> int:
+        ids = select(cache.SearchCache.id).where(cache.SearchCache.expires <= now)
+        return await self._delete_in(ids.limit(limit))
+
+    async def delete_expired_parsed(self, now: datetime, limit: int) -> int:
+        ids = (
+            select(cache.ParsedSearchCache.id)
+            .where(cache.ParsedSearchCache.expires <= now)
+            .limit(limit)
+        )
+        stmt = delete(cache.ParsedSearchCache).where(
+            cache.ParsedSearchCache.id.in_(ids.scalar_subquery())
+        )
+        res = await self.session.execute(stmt)
+        await self.session.commit()
+        return res.rowcount
+
+    async def fill_data_size(self, limit: int) -> int:
+        """列の追加前に保存されたキャッシュのサイズを設定する"""
+        ids = (
+            select(cache.SearchCache.id)
+            .where(cache.SearchCache.data_size == 0)
+            .where(func.length(cache.SearchCache.download_text) > 0)
+            .limit(limit)
+        )
+        stmt = (
+            update(cache.SearchCache)
+            .where(cache.SearchCache.id.in_(ids.scalar_subquery()))
+            .values(
+                data_size=func.length(
+                    cast(cache.SearchCache.download_text, LargeBinary)
+                )
+            )
+            .execution_options(synchronize_session=False)
+        )
+        res = await self.session.execute(stmt)
+        await self.session.commit()
+        return res.rowcount
+
+    async def get_total_size(self) -> int:
+        stmt = select(func.coalesce(func.sum(cache.SearchCache.data_size), 0))
+        res = await self.session.execute(stmt)
+        return res.scalar_one()
+
+    async def get_least_recently_used(self, limit: int) -> list[tuple[int, int]]:
+        stmt = (
+            select(cache.SearchCache.id, cache.SearchCache.data_size)
+            .order_by(cache.SearchCache.last_accessed_at.asc())
+            .limit(limit)
+        )
+        res = await self.session.execute(stmt)
+        return [(row.id, row.data_size) for row in res]
+
+    async def delete_by_ids(self, ids: list[int]) -> int:
+        if not ids:
+            return 0
+        stmt = delete(cache.SearchCache).where(cache.SearchCache.id.in_(ids))
+        res = await self.session.execute(stmt)
+        await self.session.commit()
+        return res.rowcount
+
+    async def incremental_vacuum(self, pages: int) -> int:
+        """auto_vacuumがINCREMENTALの場合に空きページを解放し、減ったバイト数を返す"""
+        conn = await self.session.connection()
+        if conn.dialect.name != "sqlite":
+            return 0
+        if (await conn.execute(text("PRAGMA auto_vacuum"))).scalar() != 2:
+            return 0
+        page_size = (await conn.execute(text("PRAGMA page_size"))).scalar()
+        before = (await conn.execute(text("PRAGMA page_count"))).scalar()
+        await self.session.commit()
+        conn = await self.session.connection()
+        await conn.exec_driver_sql(f"PRAGMA incremental_vacuum({int(pages)})")
+        await self.session.commit()
+        conn = await self.session.connection()
+        after = (await conn.execute(text("PRAGMA page_count"))).scalar()
+        await self.session.commit()
+        return (before - after) * page_size
+
+    async def _delete_in(self, ids_stmt) -> int:
+        stmt = delete(cache.SearchCache).where(
+            cache.SearchCache.id.in_(ids_stmt.scalar_subquery())
+        )
+        res = await self.session.execute(stmt)
+        await self.session.commit()
+        return res.rowcount
@@ -1,25 +1,95 @@
 from sqlmodel import SQLModel, create_engine
-from sqlalchemy import URL
+from sqlalchemy import URL, Engine, event, inspect, text
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
     create_async_engine,
     async_sessionmaker,
 )
 
 from common import read_config
 
-databases = read_config.get_databases()
-sync_db_params = URL.create(**databases.sync.model_dump(exclude_none=True))
-async_db_params = URL.create(**databases.a_sync.model_dump(exclude_none=True))
 
-sub_params = {
-    "echo": False,
-}
-if "sqlite" in databases.sync.drivername or "sqlite" in databases.a_sync.drivername:
-    sub_params["connect_args"] = {"check_same_thread": False}
+def is_sqlite_memory(url: URL) -> bool:
+    return url.database in (None, "", ":memory:")
+
+
+def create_sqlite_pragmas(options: read_config.SQLiteOptions) -> list[str]:
+    return [
+        f"PRAGMA auto_vacuum={options.auto_vacuum}",
+        f"PRAGMA journal_mode={options.journal_mode}",
+        f"PRAGMA synchronous={options.synchronous}",
+        f"PRAGMA busy_timeout={options.busy_timeout}",
+        f"PRAGMA cache_size={options.cache_size}",
+        f"PRAGMA mmap_size={options.mmap_size}",
+        f"PRAGMA temp_store={options.temp_store}",
+    ]
+
+
+def set_sqlite_pragmas(engine: Engine, options: read_config.SQLiteOptions):
+    """接続を作成する度にPRAGMAを設定する。非同期エンジンの場合はsync_engineを渡す"""
+    pragmas = create_sqlite_pragmas(options)
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+def create_engine_params(url: URL) -> dict:
+    sub_params = {
+        "echo": False,
+    }
+    if "sqlite" in url.drivername:
+        sub_params["connect_args"] = {"check_same_thread": False}
+        if is_sqlite_memory(url):
+            # インメモリDBは接続毎に別のDBになるためプールの設定はしない
+            return sub_params
+    pool_options = read_config.get_database_pool_options()
+    sub_params |= pool_options.model_dump()
+    return sub_params
+
+
+def create_db_engine(
+    params: read_config.SQLParams,
+    sqlite_options: read_config.SQLiteOptions | None = None,
+) -> Engine:
+    url = URL.create(**params.model_dump(exclude_none=True))
+    db_engine = create_engine(url, **create_engine_params(url))
+    _set_sqlite_pragmas_if_enabled(db_engine, url, sqlite_options)
+    return db_engine
+
+
+def create_async_db_engine(
+    params: read_config.SQLParams,
+    sqlite_options: read_config.SQLiteOptions | None = None,
+) -> AsyncEngine:
+    url = URL.create(**params.model_dump(exclude_none=True))
+    db_engine = create_async_engine(url, **create_engine_params(url))
+    _set_sqlite_pragmas_if_enabled(db_engine.sync_engine, url, sqlite_options)
+    return db_engine
 
-engine = create_engine(sync_db_params, **sub_params)
 
-async_engine = create_async_engine(async_db_params, **sub_params)
+def _set_sqlite_pragmas_if_enabled(
+    db_engine: Engine, url: URL, sqlite_options: read_config.SQLiteOptions | None
+):
+    if "sqlite" not in url.drivername:
+        return
+    if sqlite_options is None:
+        sqlite_options = read_config.get_sqlite_options()
+    if sqlite_options.enabled:
+        set_sqlite_pragmas(db_engine, sqlite_options)
+
+
+databases = read_config.get_databases()
+
+engine = create_db_engine(databases.sync)
+
+async_engine = create_async_db_engine(databases.a_sync)
 aSessionLocal = async_sessionmaker(autocommit=False, autoflush=False, bind=async_engine)
 
 
@@ -28,8 +98,34 @@ async def get_async_session():
         yield ses
 
 
+def get_async_sessionmaker():
+    return aSessionLocal
+
+
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    ensure_columns()
+    ensure_indexes()
+
+
+def ensure_columns(db_engine: Engine | None = None):
+    """既存のテーブルにはcreate_allで列が追加されないため、無いものを追加する"""
+    with (db_engine or engine).begin() as conn:
+        inspector = inspect(conn)
+        for table in SQLModel.metadata.sorted_tables:
+            exists = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in exists:
+                    continue
+                column_ddl = CreateColumn(column).compile(dialect=conn.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column_ddl}"))
+
+
+def ensure_indexes():
+    """既存のテーブルにはcreate_allで索引が追加されないため、無いものを作成する"""
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
 
 
 async def create_async_db_and_tables():
@@ -1,5 +1,5 @@
 from sqlmodel import Field
-from sqlalchemy import JSON, Column
+from sqlalchemy import JSON, Column, Index
 from sqlalchemy.ext.mutable import MutableDict
 
 from domain.models.base_model import SQLBase
@@ -7,7 +7,19 @@ from . import enums
 
 
 class ActivityLog(SQLBase, table=True):
-    target_id: str
+    # 種類、状態毎の最新のログと、呼び出し元毎のログを引くための索引
+    __table_args__ = (
+        Index(
+            "ix_activitylog_type_state_updated_at",
+            "activity_type",
+            "current_state",
+            "updated_at",
+        ),
+        Index("ix_activitylog_caller_type_updated_at", "caller_type", "updated_at"),
+        Index("ix_activitylog_updated_at", "updated_at"),
+    )
+
+    target_id: str = Field(index=True)
     target_table: str
     activity_type: str = Field(index=True)
     current_state: str = Field(default=enums.UpdateStatus.PENDING.name, index=True)
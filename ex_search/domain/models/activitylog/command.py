@@ -5,7 +5,7 @@ from pydantic import BaseModel, Field
 
 class ActivityLogGetCommand(BaseModel):
     id: int | None = None
-    target_id: int | None = None
+    target_id: str | None = None
     target_table: str = ""
     activity_types: list[str] = Field(default_factory=list)
     current_states: list[str] = Field(default_factory=list)
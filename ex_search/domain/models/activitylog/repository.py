@@ -11,3 +11,7 @@ class IActivityLogRepository(ABC):
     @abstractmethod
     async def get(self, command: ActivityLogGetCommand) -> list[ActivityLog]:
         pass
+
+    @abstractmethod
+    async def get_latest(self, command: ActivityLogGetCommand) -> ActivityLog | None:
+        pass
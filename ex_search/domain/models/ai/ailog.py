@@ -1,13 +1,24 @@
 from sqlmodel import Field
-from sqlalchemy import JSON, Column
+from sqlalchemy import JSON, Column, Index, text
 from sqlalchemy.ext.mutable import MutableDict
 
 from domain.models.base_model import SQLBase
 
 
 class ParserGenerationLog(SQLBase, table=True):
+    # 最新の成功したパーサーを引くための索引
+    __table_args__ = (
+        Index(
+            "ix_parsergenerationlog_label_active_id",
+            "label",
+            "id",
+            sqlite_where=text("error_info IS NULL"),
+            postgresql_where=text("error_info IS NULL"),
+        ),
+    )
+
     label: str = Field(index=True)
-    target_url: str
+    target_url: str = Field(index=True)
     query: str
     response: dict = Field(
         default_factory=dict, sa_column=Column(MutableDict.as_mutable(JSON))
@@ -20,6 +31,15 @@ class ParserGenerationLog(SQLBase, table=True):
     )
 
 
+class ActiveParser(SQLBase, table=True):
+    """labelごとに現在使用するパーサーのコードだけを保持する"""
+
+    label: str = Field(index=True, unique=True)
+    log_id: int = Field(index=True)
+    code: str
+    code_hash: str
+
+
 class DownloadConfigGenerationLog(SQLBase, table=True):
     label: str = Field(index=True)
     target_url: str
@@ -36,8 +56,13 @@ class DownloadConfigGenerationLog(SQLBase, table=True):
 
 
 class CodeValidationErrors(SQLBase, table=True):
+    # label毎にエラーの種類で絞り込むための索引
+    __table_args__ = (
+        Index("ix_codevalidationerrors_label_error_type", "label", "error_type"),
+    )
+
     label: str = Field(index=True)
-    target_url: str
+    target_url: str = Field(index=True)
     raw_input_code: str
     error_type: str
     error_details: dict | None = Field(
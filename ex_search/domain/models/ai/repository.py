@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
 from .ailog import (
     ParserGenerationLog,
+    ActiveParser,
     DownloadConfigGenerationLog,
     CodeValidationErrors,
 )
@@ -18,6 +19,26 @@ class IParserGenerationLogRepository(ABC):
     ) -> list[ParserGenerationLog]:
         pass
 
+    @abstractmethod
+    async def get_latest(
+        self, command: ParserGenerationLogGetCommand
+    ) -> ParserGenerationLog | None:
+        pass
+
+
+class IActiveParserRepository(ABC):
+    @abstractmethod
+    async def get(self, label: str) -> ActiveParser | None:
+        pass
+
+    @abstractmethod
+    async def save(self, active_parser: ActiveParser):
+        pass
+
+    @abstractmethod
+    async def delete(self, label: str, log_id: int | None = None):
+        pass
+
 
 class IDownloadConfigGenerationLogRepository(ABC):
     @abstractmethod
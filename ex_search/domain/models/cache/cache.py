@@ -1,13 +1,42 @@
 from datetime import datetime
 from sqlmodel import Field
+from sqlalchemy import Column, Index
+
+from common.compression import CompressedText
 
 from domain.models.base_model import SQLBase
 
 
 class SearchCache(SQLBase, table=True):
+    # url毎の有効なキャッシュの検索と、期限切れのキャッシュの削除に使う索引
+    __table_args__ = (
+        Index("ix_searchcache_url_expires_created_at", "url", "expires", "created_at"),
+        Index("ix_searchcache_domain_expires", "domain", "expires"),
+        Index("ix_searchcache_expires", "expires"),
+        # LRUでの削除と合計サイズの集計に使う索引
+        Index(
+            "ix_searchcache_last_accessed_at_data_size", "last_accessed_at", "data_size"
+        ),
+    )
+
     domain: str
     url: str
     download_type: str
-    download_text: str = Field(default="")
+    # 圧縮して保存する
+    download_text: str = Field(default="", sa_column=Column(CompressedText))
     expires: datetime | None = Field(default=None)
     error_msg: str = Field(default="")
+    data_size: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    last_accessed_at: datetime | None = Field(default=None)
+
+
+class ParsedSearchCache(SQLBase, table=True):
+    """解析済みのSearchResponseのキャッシュ。元のHTMLのキャッシュと同じ期限で破棄する"""
+
+    cache_key: str = Field(index=True, unique=True)
+    url: str
+    sitename: str
+    parser_version: str
+    # SearchResponseのJSON
+    response: str = Field(default="", sa_column=Column(CompressedText))
+    expires: datetime = Field(index=True)
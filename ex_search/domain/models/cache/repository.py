@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
-from .cache import SearchCache
+from datetime import datetime
+from .cache import SearchCache, ParsedSearchCache
 from .command import SearchCacheGetCommand, SearchCacheDeleteCommand
 
 
@@ -17,3 +18,47 @@ class ISearchCacheDeleteRepository(ABC):
     @abstractmethod
     async def delete_all(self, command: SearchCacheDeleteCommand):
         pass
+
+
+class IParsedSearchCacheRepository(ABC):
+    @abstractmethod
+    async def save(self, data: ParsedSearchCache):
+        pass
+
+    @abstractmethod
+    async def get(self, cache_key: str) -> ParsedSearchCache | None:
+        pass
+
+
+class ISearchCacheMaintenanceRepository(ABC):
+    @abstractmethod
+    async def update_access_times(self, access_times: dict[int, datetime]):
+        pass
+
+    @abstractmethod
+    async def delete_expired(self, now: datetime, limit: int) -> int:
+        pass
+
+    @abstractmethod
+    async def delete_expired_parsed(self, now: datetime, limit: int) -> int:
+        pass
+
+    @abstractmethod
+    async def fill_data_size(self, limit: int) -> int:
+        pass
+
+    @abstractmethod
+    async def get_total_size(self) -> int:
+        pass
+
+    @abstractmethod
+    async def get_least_recently_used(self, limit: int) -> list[tuple[int, int]]:
+        pass
+
+    @abstractmethod
+    async def delete_by_ids(self, ids: list[int]) -> int:
+        pass
+
+    @abstractmethod
+    async def incremental_vacuum(self, pages: int) -> int:
+        pass
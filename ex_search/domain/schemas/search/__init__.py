@@ -1,6 +1,12 @@
 from .search import (
     SearchRequest,
     SearchResponse,
+    SearchResults,
+    BatchSearchRequest,
+    BatchSearchResponse,
+    SearchStreamResult,
+    BatchSearchStreamResponse,
+    SearchStreamEnd,
     AskGeminiOptions,
     SeleniumWaitOptions,
     SofmapOptions,
@@ -19,6 +25,12 @@ from .downloadconfig import (
 __all__ = [
     "SearchRequest",
     "SearchResponse",
+    "SearchResults",
+    "BatchSearchRequest",
+    "BatchSearchResponse",
+    "SearchStreamResult",
+    "BatchSearchStreamResponse",
+    "SearchStreamEnd",
     "InfoRequest",
     "InfoResponse",
     "AskGeminiOptions",
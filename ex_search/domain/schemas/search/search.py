@@ -1,4 +1,4 @@
-from typing import Any, Optional
+from typing import Any, Literal, Optional
 from pydantic import BaseModel, Field
 from .constants import INIT_PAGE_LOAD_TIMEOUT, INIT_TAG_WAIT_TIMEOUT
 
@@ -110,6 +110,10 @@ class SearchRequest(BaseModel):
         default_factory=dict
     )
     no_cache: bool = Field(default=False)
+    max_pages: int = Field(default=1, ge=1, le=20)
+    max_results: int | None = Field(default=None, ge=1)
+    # 期限切れから何秒までのキャッシュを受け入れるか。CACHE_OPTIONSの猶予より長くはできない
+    max_stale: int | None = Field(default=None, ge=0)
 
 
 class SearchResult(BaseModel):
@@ -137,7 +141,35 @@ class SearchResults(BaseModel):
 
 
 class SearchResponse(SearchResults):
-    pass
+    # 期限切れのキャッシュから作った結果の場合にTrue。裏で更新している
+    stale: bool = False
+
+
+class BatchSearchRequest(BaseModel):
+    requests: list[SearchRequest] = Field(min_length=1)
+
+
+class BatchSearchResponse(BaseModel):
+    results: list[SearchResponse] = Field(default_factory=list)
+
+
+class SearchStreamResult(BaseModel):
+    event: Literal["result"] = "result"
+    result: SearchResult
+
+
+class BatchSearchStreamResponse(BaseModel):
+    event: Literal["response"] = "response"
+    index: int
+    response: SearchResponse
+
+
+class SearchStreamEnd(BaseModel):
+    event: Literal["end"] = "end"
+    count: int = 0
+    error_msg: str = Field(default="")
+    redirect_url: str | None = None
+    stale: bool = False
 
 
 class DownloadRequest(BaseModel):
@@ -147,9 +179,11 @@ class DownloadRequest(BaseModel):
         default_factory=dict
     )
     no_cache: bool = Field(default=False)
+    max_stale: int | None = Field(default=None, ge=0)
 
 
 class DownLoadResponse(BaseModel):
     value: str | None = Field(default=None)
     error_msg: str = Field(default="")
     redirect_url: str | None = None
+    stale: bool = False
@@ -1,8 +1,9 @@
 from .model import ParseResult, ParseResults
-from .parser import SearchResultParser
+from .parser import SearchResultParser, parse_search_result
 
 __all__ = [
     "ParseResult",
     "ParseResults",
     "SearchResultParser",
+    "parse_search_result",
 ]
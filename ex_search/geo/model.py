@@ -23,6 +23,7 @@ class PageInfo(BaseModel):
     current_page: int = 0
     more_page: bool = False
     enable: bool = False
+    page_urls: dict[int, str] = Field(default_factory=dict)
 
 
 class ParseResults(BaseModel):
@@ -1,8 +1,29 @@
 import re
-from bs4 import BeautifulSoup
+from urllib.parse import urljoin
+
+from common.lxml_util import (
+    parse_html,
+    has_class,
+    compile_xpath,
+    get_text,
+    get_classes,
+)
 from .model import ParseResult, ParseResults, PageInfo
 from .constants import ERROR_IMAGE_URL, NONE_PRICE
 
+# セレクタはモジュール読み込み時に一度だけコンパイルする
+ITEMS = compile_xpath(f"//ul[{has_class('itemList')}]//li")
+ITEM_NAME = compile_xpath(f".//*[{has_class('itemName')}]")
+ITEM_LINK = compile_xpath(f".//a[{has_class('sendDatalayer')}]")
+CATEGORY = compile_xpath(f".//*[{has_class('itemCarrier')}]")
+IMAGE = compile_xpath(f".//*[{has_class('itemImage')}]//img")
+PRICE = compile_xpath(f".//*[{has_class('sellPtnLeftPrice')}]")
+SITUATION = compile_xpath(f".//*[{has_class('labelSituation')}]")
+PAGER_ITEMS = compile_xpath(f"//*[{has_class('pager')}]//li")
+PAGER_LINKS = compile_xpath(f"//*[{has_class('pager')}]//li//a")
+CURRENT_PAGE = compile_xpath(f"//*[{has_class('pager')}]//li[{has_class('current')}]")
+NEXT_PAGE = compile_xpath(f"//*[{has_class('pager')}]//li[{has_class('next')}]")
+
 
 class SearchResultParser:
     html_str: str
@@ -18,15 +39,17 @@ class SearchResultParser:
         return self.results
 
     def execute(self):
-        soup = BeautifulSoup(self.html_str, "html.parser")
+        root = parse_html(self.html_str)
+        if root is None:
+            self.results = ParseResults(pageinfo=PageInfo())
+            return
         results = ParseResults()
-        results = self._parse_items(soup)
-        results.pageinfo = self._parse_page(soup)
+        results = self._parse_items(root)
+        results.pageinfo = self._parse_page(root)
         self.results = results
 
-    def _parse_items(self, soup):
-        q = r"ul.itemList li"
-        ret = soup.select(q)
+    def _parse_items(self, root):
+        ret = ITEMS(root)
         results = ParseResults()
         if len(ret) == 0:
             return results
@@ -45,10 +68,10 @@ class SearchResultParser:
         return results
 
     def _get_title(self, elem):
-        titleo = elem.select(".itemName")
-        title = titleo[0].text.replace("\u3000", " ")
-        titleurlo = elem.select("a.sendDatalayer")
-        sub_url = self._create_geo_full_url(titleurlo[0]["href"])
+        titleo = ITEM_NAME(elem)
+        title = get_text(titleo[0]).replace("\u3000", " ")
+        titleurlo = ITEM_LINK(elem)
+        sub_url = self._create_geo_full_url(titleurlo[0].attrib["href"])
         return title, sub_url
 
     def _create_geo_full_url(self, url):
@@ -59,14 +82,14 @@ class SearchResultParser:
         return "https://ec.geo-online.co.jp" + url
 
     def _get_category(self, elem):
-        cateo = elem.select(".itemCarrier")
-        return cateo[0].text.replace("\u3000", " ")
+        cateo = CATEGORY(elem)
+        return get_text(cateo[0]).replace("\u3000", " ")
 
     def _get_image(self, elem):
-        imageo = elem.select(".itemImage img")
+        imageo = IMAGE(elem)
         if len(imageo) == 0:
             return ERROR_IMAGE_URL
-        return imageo[0]["src"]
+        return imageo[0].attrib["src"]
 
     def _del_space(self, text):
         return text.replace(" ", "")
@@ -81,9 +104,8 @@ class SearchResultParser:
         return text
 
     def _get_price(self, elem):
-        q = r".sellPtnLeftPrice"
-        priceo = elem.select(q)
-        pricetext = self._trim_html(priceo[0].text)
+        priceo = PRICE(elem)
+        pricetext = self._trim_html(get_text(priceo[0]))
         try:
             price = int(re.sub("\\D", "", pricetext))
         except Exception:
@@ -91,26 +113,29 @@ class SearchResultParser:
         return price
 
     def _get_condition(self, elem):
-        q = r".labelSituation"
-        tro = elem.select(q)
+        tro = SITUATION(elem)
         condition = ""
         yoyaku = ""
         for tr in tro:
-            if "予約" in tr.text:
-                yoyaku = tr.text
+            text = get_text(tr)
+            if "予約" in text:
+                yoyaku = text
                 continue
             if condition == "":
-                condition = tr.text
+                condition = text
         return condition, yoyaku
 
-    def _parse_page_num(self, soup):
-        q = r".pager li"
-        pages = soup.select(q)
+    def _parse_page_num(self, root):
+        pages = PAGER_ITEMS(root)
         if len(pages) == 0:
             return 0, 0
-        text = str(pages)
-        ptn = r">([0-9]+)<"
-        m = re.findall(ptn, text)
+        # タグに挟まれた数字のみのテキストをページ番号とする
+        m = [
+            text
+            for page in pages
+            for text in self._iter_strings(page)
+            if re.fullmatch(r"[0-9]+", text)
+        ]
         pmin = -1
         pmax = -1
         for v in m:
@@ -124,32 +149,54 @@ class SearchResultParser:
                 pmax = int(v)
         return pmin, pmax
 
-    def _parse_page(self, soup):
+    def _iter_strings(self, elem):
+        for node in elem.iter():
+            if isinstance(node.tag, str) and node.text:
+                yield node.text
+            if node is not elem and node.tail:
+                yield node.tail
+
+    def _parse_page(self, root):
         result = PageInfo()
-        result.min_page, result.max_page = self._parse_page_num(soup)
+        result.min_page, result.max_page = self._parse_page_num(root)
         if (
             result.min_page > 0
             and result.max_page > 0
             and result.min_page != result.max_page
         ):
             result.enable = True
-        result.current_page = self._get_current_page(soup)
-        result.more_page = self._get_more_page(soup)
+        result.current_page = self._get_current_page(root)
+        result.more_page = self._get_more_page(root)
+        result.page_urls = self._get_page_urls(root)
         return result
 
-    def _get_current_page(self, soup):
-        q = r".pager li.current"
-        cur = soup.select(q)
+    def _get_page_urls(self, root) -> dict[int, str]:
+        page_urls: dict[int, str] = {}
+        for tag in PAGER_LINKS(root):
+            text = get_text(tag).strip()
+            if not text.isdigit() or not tag.get("href"):
+                continue
+            page_urls.setdefault(int(text), urljoin(self.url, tag.attrib["href"]))
+        return page_urls
+
+    def _get_current_page(self, root):
+        cur = CURRENT_PAGE(root)
         if not cur:
             return 0
-        return int(cur[0].text)
+        return int(get_text(cur[0]))
 
-    def _get_more_page(self, soup):
-        q = r".pager li.next"
-        moreo = soup.select(q)
+    def _get_more_page(self, root):
+        moreo = NEXT_PAGE(root)
         if len(moreo) == 0:
             return False
-        nmo = moreo[0].get("class")
+        nmo = get_classes(moreo[0])
         if "noMove" in nmo:
             return False
         return True
+
+
+def parse_search_result(html_str: str, url: str = "") -> ParseResults:
+    """解析用プロセスから呼び出すためのモジュールレベルの関数"""
+    parser = SearchResultParser(html_str=html_str, url=url)
+    parser.execute()
+    return parser.get_results()
@@ -1,9 +1,36 @@
 import re
+from urllib.parse import urljoin, urlparse
+
+from common.lxml_util import (
+    parse_html,
+    has_class,
+    compile_xpath,
+    get_text,
+    get_classes,
+)
+from .model import ParseResult, ParseResults, PageInfo
+from .constants import IOSYS, NONE_PRICE
 
-from bs4 import BeautifulSoup
+# セレクタはモジュール読み込み時に一度だけコンパイルする
+ITEMS = compile_xpath(f"//ul[{has_class('items-container')}]//li[{has_class('item')}]")
+IMAGE_SOURCE = compile_xpath(f".//div[{has_class('photo')}]//picture//source")
+NAME = compile_xpath(f".//p[{has_class('name')}]")
+PRICE = compile_xpath(f".//div[{has_class('price')}]//p")
+CONDITION = compile_xpath(f".//p[{has_class('condition')}]")
+MAKER = compile_xpath(f".//p[{has_class('maker')}]")
+RELEASE_DATE = compile_xpath(f".//p[{has_class('release')}]")
+ACCESSORY = compile_xpath(f".//p[{has_class('accessory')}]")
+STOCK = compile_xpath(f".//p[{has_class('stock')}]")
+DETAIL_LINK = compile_xpath(".//a")
+SUB_INFOS = compile_xpath(f".//div[{has_class('photo')}]//div")
+PAGE_LINKS = compile_xpath("//a[contains(@href, 'page=')]")
 
-from .model import ParseResult, ParseResults
-from .constants import IOSYS, NONE_PRICE
+
+def _first(xpath, elem):
+    tags = xpath(elem)
+    if not tags:
+        return None
+    return tags[0]
 
 
 class SearchResultParser:
@@ -20,9 +47,10 @@ class SearchResultParser:
         return self.results
 
     def execute(self):
-        soup = BeautifulSoup(self.html_str, "html.parser")
-        ptn = r"ul.items-container li.item"
-        elems = soup.select(ptn)
+        root = parse_html(self.html_str)
+        if root is None:
+            return
+        elems = ITEMS(root)
         if not elems:
             return
 
@@ -44,6 +72,7 @@ class SearchResultParser:
             if self.url:
                 result.url = self.url
             results.results.append(result)
+        results.pageinfo = self._parse_page(root)
         self.results = results
 
     @classmethod
@@ -60,66 +89,57 @@ class SearchResultParser:
         return text.translate(table).strip()
 
     def _get_image_url(self, elem) -> str:
-        ptn = r"div.photo picture source"
-        tag = elem.select_one(ptn)
-        if not tag:
+        tag = _first(IMAGE_SOURCE, elem)
+        if tag is None:
             return ""
         return tag.get("data-srcset", "")
 
     def _get_title(self, elem) -> str:
-        ptn = r"p.name"
-        tag = elem.select_one(ptn)
-        if not tag:
+        tag = _first(NAME, elem)
+        if tag is None:
             return ""
-        return self._trim_str(str(tag.text))
+        return self._trim_str(get_text(tag))
 
     def _get_price(self, elem) -> int:
-        ptn = r"div.price p"
-        tag = elem.select_one(ptn)
-        if not tag:
+        tag = _first(PRICE, elem)
+        if tag is None:
             return NONE_PRICE
-        price = int(re.sub("\\D", "", tag.text))
+        price = int(re.sub("\\D", "", get_text(tag)))
         return price
 
     def _get_condition(self, elem) -> str:
-        ptn = r"p.condition"
-        tag = elem.select_one(ptn)
-        if not tag:
+        tag = _first(CONDITION, elem)
+        if tag is None:
             return ""
-        return self._trim_str(str(tag.text))
+        return self._trim_str(get_text(tag))
 
     def _get_maker(self, elem) -> str:
-        ptn = r"p.maker"
-        tag = elem.select_one(ptn)
-        if not tag:
+        tag = _first(MAKER, elem)
+        if tag is None:
             return ""
-        return self._trim_str(str(tag.text).replace("メーカー：", ""))
+        return self._trim_str(get_text(tag).replace("メーカー：", ""))
 
     def _get_release_date(self, elem) -> str:
-        ptn = r"p.release"
-        tag = elem.select_one(ptn)
-        if not tag:
+        tag = _first(RELEASE_DATE, elem)
+        if tag is None:
             return ""
-        return self._trim_str(str(tag.text).replace("発売日：", ""))
+        return self._trim_str(get_text(tag).replace("発売日：", ""))
 
     def _get_accessories(self, elem) -> str:
-        ptn = r"p.accessory"
-        tag = elem.select_one(ptn)
-        if not tag:
+        tag = _first(ACCESSORY, elem)
+        if tag is None:
             return ""
-        return self._trim_str(str(tag.text).replace("付属品:", ""))
+        return self._trim_str(get_text(tag).replace("付属品:", ""))
 
     def _get_stock_quantity(self, elem) -> str:
-        ptn = r"p.stock"
-        tag = elem.select_one(ptn)
-        if not tag:
+        tag = _first(STOCK, elem)
+        if tag is None:
             return ""
-        return self._trim_str(str(tag.text).replace("在庫数：", ""))
+        return self._trim_str(get_text(tag).replace("在庫数：", ""))
 
     def _get_detail_url(self, elem) -> str:
-        ptn = r"a"
-        tag = elem.select_one(ptn)
-        if not tag:
+        tag = _first(DETAIL_LINK, elem)
+        if tag is None:
             return ""
         href = tag.get("href", "")
         if href.startswith("http"):
@@ -128,14 +148,50 @@ class SearchResultParser:
 
     def _get_sub_infos(self, elem) -> dict:
         infos = {}
-        ptn = r"div.photo div"
-        tags = elem.select(ptn)
+        tags = SUB_INFOS(elem)
         if not tags:
             return infos
         for tag in tags:
-            keys = tag.get("class", [])
+            keys = get_classes(tag)
             if not keys:
                 continue
-            text = self._trim_str(str(tag.text))
+            text = self._trim_str(get_text(tag))
             infos[keys[-1]] = text
         return infos
+
+    def _parse_page(self, root) -> PageInfo:
+        result = PageInfo()
+        result.current_page = self._get_page_num(self.url) or 1
+        result.page_urls = self._get_page_urls(root)
+        pages = set(result.page_urls.keys()) | {result.current_page}
+        result.min_page = min(pages)
+        result.max_page = max(pages)
+        result.enable = result.min_page != result.max_page
+        result.more_page = result.max_page > result.current_page
+        return result
+
+    def _get_page_num(self, url: str) -> int:
+        m = re.search(r"[?&]page=(\d+)", url)
+        if not m:
+            return 0
+        return int(m.group(1))
+
+    def _get_page_urls(self, root) -> dict[int, str]:
+        page_urls: dict[int, str] = {}
+        for tag in PAGE_LINKS(root):
+            page_num = self._get_page_num(tag.attrib["href"])
+            if page_num <= 0:
+                continue
+            page_url = urljoin(self.url, tag.attrib["href"])
+            # 検索結果以外のページへのリンクは除外する
+            if self.url and urlparse(page_url).path != urlparse(self.url).path:
+                continue
+            page_urls.setdefault(page_num, page_url)
+        return page_urls
+
+
+def parse_search_result(html_str: str, url: str = "") -> ParseResults:
+    """解析用プロセスから呼び出すためのモジュールレベルの関数"""
+    parser = SearchResultParser(html_str=html_str, url=url)
+    parser.execute()
+    return parser.get_results()
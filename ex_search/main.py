@@ -1,26 +1,75 @@
+import asyncio
+import signal
 from contextlib import asynccontextmanager
 
+import structlog
 from fastapi import FastAPI
 
 from routers import (
     api,
+    metrics,
 )
-from databases.redis.util import get_async_redis
+from databases.redis.util import get_async_redis, init_redis_pool, close_redis_pool
 from app.search_api.repository import URLDomainCacheRepository
 from databases.sql.create_table import create_table
+from app.downloader.selenium_pool import shutdown_selenium_service
+from app.downloader.http_client import init_http_transports, close_http_transports
+from app.parse_executor import init_parse_executor, shutdown_parse_executor
+from app.gemini_api.sandbox import init_sandbox_pool, shutdown_sandbox_pool
+from app.activitylog.writer import init_activitylog_writer, shutdown_activitylog_writer
+from app.search_api.cache_sweeper import init_cache_sweeper, shutdown_cache_sweeper
+from app.search_api.revalidate import shutdown_cache_revalidator
+from app.search_api.sites import init_site_registry
 from common.logger_config import configure_logger
+from common import read_config
 
 configure_logger(filename="app.log", logging_level="INFO")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    read_config.load_settings()
+    add_settings_reload_handler()
+    init_redis_pool()
+    init_site_registry()
     await delete_all_domain_cache()
     create_table()
+    await init_activitylog_writer()
+    init_cache_sweeper()
+    init_http_transports()
+    await init_parse_executor()
+    init_sandbox_pool()
     yield
+    await shutdown_cache_revalidator()
+    await shutdown_cache_sweeper()
+    await shutdown_activitylog_writer()
+    await close_http_transports()
+    shutdown_selenium_service()
+    shutdown_parse_executor()
+    shutdown_sandbox_pool()
+    await close_redis_pool()
+
+
+def add_settings_reload_handler():
+    """SIGHUPで設定を読み込み直す"""
+
+    def _reload():
+        try:
+            read_config.reload_settings()
+        except Exception as e:
+            structlog.get_logger(__name__).error(
+                "failed to reload settings", error_type=type(e).__name__, error=str(e)
+            )
+
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, _reload)
+    except (AttributeError, NotImplementedError):
+        # SIGHUPの無い環境
+        pass
 
 
 async def delete_all_domain_cache():
+    # ダウンロード中の状態はRATE_LIMIT_OPTIONSの制限に置き換えたため、残っているものを消す
     repo = URLDomainCacheRepository(r=get_async_redis())
     await repo.delete_all()
 
@@ -28,3 +77,4 @@ async def delete_all_domain_cache():
 app = FastAPI(lifespan=lifespan)
 
 app.include_router(api.router)
+app.include_router(metrics.router)
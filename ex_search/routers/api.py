@@ -1,19 +1,19 @@
 import uuid
 
 from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 import structlog
 
 
-from common.read_config import get_cache_options
-from databases.sql.util import get_async_session
-from databases.redis.util import get_async_redis
+from common.read_config import get_batch_search_options
+from databases.sql.util import get_async_session, get_async_sessionmaker
 from databases.sql.category import repository as cate_repo
-from databases.redis.cache import repository as redis_cache_repo
-from databases.sql.cache import repository as sql_cache_repo
 from domain.schemas.search import (
     SearchRequest,
     SearchResponse,
+    BatchSearchRequest,
+    BatchSearchResponse,
     InfoResponse,
     InfoRequest,
     DownloadRequest,
@@ -22,6 +22,9 @@ from domain.schemas.search import (
     DownloadConfigGenerateResponse,
 )
 from app.search_api.search import SearchClient, HTMLDownloader
+from app.search_api.batch import create_batch_search_client
+from app.search_api.revalidate import create_searchcache_repository
+from app.search_api import stream as search_stream
 from app.search_api.info import SearchInfo
 from app.downloadconfig import config_generator
 from app.gemini_api.models import BasicErrorInfo
@@ -53,15 +56,7 @@ async def api_get_search_result(
         raise HTTPException(
             status_code=404, detail="URL or search keyword is required."
         )
-    cache_options = get_cache_options()
-    log.debug("Cache options", options=cache_options)
-    if cache_options.backend == "redis":
-        searchcache_repo = redis_cache_repo.SearchCacheRedisRepository(
-            r=get_async_redis(),
-            expiry_seconds=cache_options.expires,
-        )
-    else:
-        searchcache_repo = sql_cache_repo.SearchCacheRepository(ses=db)
+    searchcache_repo = create_searchcache_repository(ses=db)
 
     client = SearchClient(
         ses=db,
@@ -77,6 +72,118 @@ async def api_get_search_result(
     return response
 
 
+@router.post(
+    "/search/batch/",
+    response_model=BatchSearchResponse,
+    description="複数の検索をまとめて実行し、リクエストと同じ順番で結果を返します。",
+)
+async def api_get_batch_search_result(
+    request: Request,
+    batchreq: BatchSearchRequest,
+    sessionmaker=Depends(get_async_sessionmaker),
+):
+    structlog.contextvars.clear_contextvars()
+    structlog.contextvars.bind_contextvars(
+        router_path=request.url.path,
+        request_id=str(uuid.uuid4()),
+    )
+    log = structlog.get_logger(__name__)
+    log.info("API Batch Search called", count=len(batchreq.requests))
+    max_requests = get_batch_search_options().max_requests
+    if len(batchreq.requests) > max_requests:
+        log.warning("Too many requests in batch.", max_requests=max_requests)
+        raise HTTPException(
+            status_code=400,
+            detail=f"too many requests. max_requests:{max_requests}",
+        )
+    client = create_batch_search_client(
+        batchrequest=batchreq,
+        sessionmaker=sessionmaker,
+        searchcache_repository_factory=create_searchcache_repository,
+        caller_type=CALLER_TYPE,
+    )
+    return await client.execute()
+
+
+@router.post(
+    "/search/stream/",
+    response_class=StreamingResponse,
+    description=(
+        "検索結果を1件ずつNDJSONで返します。"
+        "Acceptにtext/event-streamを指定した場合はServer-Sent Eventsで返します。"
+    ),
+)
+async def api_stream_search_result(
+    request: Request,
+    searchreq: SearchRequest,
+    sessionmaker=Depends(get_async_sessionmaker),
+):
+    structlog.contextvars.clear_contextvars()
+    structlog.contextvars.bind_contextvars(
+        router_path=request.url.path,
+        request_id=str(uuid.uuid4()),
+    )
+    log = structlog.get_logger(__name__)
+    log.info("API Search Stream called", searchreq=searchreq)
+    if not searchreq.url and not searchreq.search_keyword:
+        log.warning("URL or search keyword is required.")
+        raise HTTPException(
+            status_code=404, detail="URL or search keyword is required."
+        )
+    media_type = search_stream.select_media_type(request.headers.get("accept"))
+    events = search_stream.stream_search(
+        searchrequest=searchreq,
+        sessionmaker=sessionmaker,
+        searchcache_repository_factory=create_searchcache_repository,
+        caller_type=CALLER_TYPE,
+    )
+    return StreamingResponse(
+        search_stream.encode_stream(events=events, media_type=media_type),
+        media_type=media_type,
+    )
+
+
+@router.post(
+    "/search/batch/stream/",
+    response_class=StreamingResponse,
+    description=(
+        "複数の検索を実行し、完了したものから順にNDJSONで返します。"
+        "Acceptにtext/event-streamを指定した場合はServer-Sent Eventsで返します。"
+    ),
+)
+async def api_stream_batch_search_result(
+    request: Request,
+    batchreq: BatchSearchRequest,
+    sessionmaker=Depends(get_async_sessionmaker),
+):
+    structlog.contextvars.clear_contextvars()
+    structlog.contextvars.bind_contextvars(
+        router_path=request.url.path,
+        request_id=str(uuid.uuid4()),
+    )
+    log = structlog.get_logger(__name__)
+    log.info("API Batch Search Stream called", count=len(batchreq.requests))
+    max_requests = get_batch_search_options().max_requests
+    if len(batchreq.requests) > max_requests:
+        log.warning("Too many requests in batch.", max_requests=max_requests)
+        raise HTTPException(
+            status_code=400,
+            detail=f"too many requests. max_requests:{max_requests}",
+        )
+    media_type = search_stream.select_media_type(request.headers.get("accept"))
+    client = create_batch_search_client(
+        batchrequest=batchreq,
+        sessionmaker=sessionmaker,
+        searchcache_repository_factory=create_searchcache_repository,
+        caller_type=CALLER_TYPE,
+    )
+    events = search_stream.stream_batch_search(client=client)
+    return StreamingResponse(
+        search_stream.encode_stream(events=events, media_type=media_type),
+        media_type=media_type,
+    )
+
+
 @router.post(
     "/search/info/",
     response_model=InfoResponse,
@@ -126,15 +233,7 @@ async def api_get_download_result(
     log = structlog.get_logger(__name__)
     log.info("API Download called", downloadreq=downloadreq)
 
-    cache_options = get_cache_options()
-    log.debug("Cache options", options=cache_options)
-    if cache_options.backend == "redis":
-        searchcache_repo = redis_cache_repo.SearchCacheRedisRepository(
-            r=get_async_redis(),
-            expiry_seconds=cache_options.expires,
-        )
-    else:
-        searchcache_repo = sql_cache_repo.SearchCacheRepository(ses=db)
+    searchcache_repo = create_searchcache_repository(ses=db)
 
     downloader = HTMLDownloader(
         downloadrequest=downloadreq,
@@ -151,7 +250,9 @@ async def api_get_download_result(
         raise HTTPException(status_code=404, detail=str(e))
     if ok:
         return DownLoadResponse(
-            value=result.searchcache.download_text, redirect_url=result.redirect_url
+            value=result.searchcache.download_text,
+            redirect_url=result.redirect_url,
+            stale=result.is_stale,
         )
     else:
         return DownLoadResponse(
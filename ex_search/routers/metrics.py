@@ -0,0 +1,18 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import Response
+
+from common.read_config import get_metrics_options
+from app.metrics import generate_metrics
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get(
+    "/metrics",
+    description="Prometheus形式で各段階の処理時間、キャッシュ、実行中のダウンロード数等を返します。",
+)
+async def get_metrics():
+    if not get_metrics_options().enabled:
+        raise HTTPException(status_code=404, detail="metrics is disabled.")
+    content, content_type = await generate_metrics()
+    return Response(content=content, media_type=content_type)
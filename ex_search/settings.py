@@ -1,5 +1,8 @@
 from pathlib import Path
 
+# 各設定は起動時に一度だけ読み込む。
+# EX_SEARCH__CACHE_OPTIONS__EXPIRES=600 のような環境変数、または BASE_DIR の .env で上書きできる。
+# SIGHUP でこのファイルと環境変数を読み込み直す。DB、Redis の接続先やワーカー数などは再起動が必要。
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATABASES = {
     "sync": {
@@ -11,13 +14,35 @@ DATABASES = {
         "database": f"{BASE_DIR}/db/database.db",
     },
 }
+# SQLiteの接続毎に設定するPRAGMA
+SQLITE_OPTIONS = {
+    "enabled": True,
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "cache_size": -20000,
+    "mmap_size": 268435456,
+    "temp_store": "MEMORY",
+    "auto_vacuum": "INCREMENTAL",
+}
+DATABASE_POOL_OPTIONS = {
+    "pool_size": 5,
+    "max_overflow": 10,
+    "pool_timeout": 30,
+    "pool_recycle": -1,
+    "pool_pre_ping": False,
+}
 REDIS_OPTIONS = {
     "host": "redis",
     "port": 6379,
     "db": 0,
+    # プロセスで共有する接続プールの上限。Noneは無制限
+    "max_connections": None,
 }
 SELENIUM_OPTIONS = {
     "REMOTE_URL": "http://selenium:4444/wd/hub",
+    "MAX_SESSIONS": 2,
+    "MAX_USES_PER_SESSION": 20,
 }
 NODRIVER_API_OPTIONS = {
     "base_url": "http://nodriver:8090",
@@ -30,15 +55,103 @@ SOFMAP_OPTIONS = {
 }
 GEO_OPTIONS = {"selenium": {"PAGE_LOAD_TIMEOUT": 30, "TAG_WAIT_TIMEOUT": 15}}
 LOG_OPTIONS = {"directory_path": f"{BASE_DIR}/log/"}
+# compression: "zstd", "gzip", "none"。zstdが使えない環境ではgzipになる
+# compression_level: gzipは0から9、zstdは-7から22。Noneで既定値
 CACHE_OPTIONS = {
     "expires": 300,
     "backend": "redis",
+    "compression": "zstd",
+    "compression_level": None,
+    # 解析済みの結果もキャッシュする
+    "parsed_cache": True,
+    # 期限切れから指定秒数の間は古いキャッシュをすぐ返し、裏でダウンロードし直す。0で無効
+    "stale_while_revalidate": 0,
+}
+# backendが"sql"の場合にキャッシュを定期的に整理する
+CACHE_SWEEPER_OPTIONS = {
+    "enabled": True,
+    "interval": 300,
+    "batch_size": 500,
+    "max_total_bytes": 536870912,
+    "vacuum_pages": 1000,
 }
 DOWNLOAD_WAITTIME_OPTIONS = {
     "timeout_for_each_url": 40,
     "timeout_util_downloadable": 150,
     "min_wait_time_of_dl": 1,
 }
+DOMAIN_LOCK_OPTIONS = {
+    "backend": "redis",
+    # 取得中は延長し続けるため、ワーカーが落ちた場合にロックが解放されるまでの秒数になる
+    "hold_seconds": 300,
+}
+# ドメイン毎のダウンロード間隔(トークンバケット)と同時実行数。backendが"redis"の場合はワーカー間で共有する
+# 429/403/503やエラーが多い場合はrateを下げ、成功が続くと設定値まで戻す
+RATE_LIMIT_OPTIONS = {
+    "backend": "redis",
+    "default": {"rate": 0.66, "burst": 1, "max_concurrency": 1},
+    "domains": {
+        "iosys.co.jp": {"rate": 2, "burst": 4, "max_concurrency": 4},
+    },
+    "backoff_factor": 0.5,
+    "increase_step": 0.1,
+    "window_size": 10,
+    "error_ratio": 0.3,
+    "min_rate": 0.05,
+}
+# selenium、nodriver、外部API、ダウンロード先のドメイン毎に、連続して失敗した場合は一定時間すぐに失敗させる
+CIRCUIT_BREAKER_OPTIONS = {
+    "enabled": True,
+    "backend": "redis",
+    "failure_threshold": 5,
+    "cooldown_seconds": 30,
+    "probe_timeout": 120,
+}
+# /metricsでPrometheus形式の値を返す
+METRICS_OPTIONS = {
+    "enabled": True,
+    "max_domain_labels": 100,
+}
+SINGLEFLIGHT_OPTIONS = {
+    "backend": "redis",
+    "marker_seconds": 300,
+    "result_seconds": 30,
+}
+HTTP_CLIENT_OPTIONS = {
+    "max_connections_per_host": 10,
+    "max_keepalive_connections_per_host": 5,
+    "keepalive_expiry": 30,
+    "http2": False,
+}
+BATCH_SEARCH_OPTIONS = {
+    "max_requests": 500,
+    "max_concurrency": 10,
+}
+PARSE_EXECUTOR_OPTIONS = {
+    "backend": "process",
+    "max_workers": 2,
+    "max_tasks_per_child": 1000,
+    "warn_queue_depth": 20,
+}
+SANDBOX_OPTIONS = {
+    "max_workers": 2,
+    "max_jobs_per_worker": 50,
+    "memory_limit_mb": 512,
+    "cpu_seconds_per_job": 10,
+    "max_cached_parsers": 32,
+}
+# writer: "buffered"はキューに溜めてバックグラウンドでまとめて書き込む。"direct"はリクエスト毎に書き込む
+# database: 指定するとbufferedの書き込み先を別のDBにする
+ACTIVITYLOG_OPTIONS = {
+    "writer": "buffered",
+    "max_queue_size": 10000,
+    "batch_size": 200,
+    "flush_interval": 0.5,
+    # "database": {
+    #     "drivername": "sqlite+aiosqlite",
+    #     "database": f"{BASE_DIR}/db/activitylog.db",
+    # },
+}
 SEARCH_OPTIONS = {
     "safe_search": True,
 }
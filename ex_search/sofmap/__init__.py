@@ -1,9 +1,16 @@
-from .parser import SearchResultParser, CategoryParser
+from .parser import (
+    SearchResultParser,
+    CategoryParser,
+    parse_search_result,
+    parse_category,
+)
 from .model import ParseResult, ParseResults, CategoryResult
 
 __all__ = [
     "SearchResultParser",
     "CategoryParser",
+    "parse_search_result",
+    "parse_category",
     "ParseResult",
     "ParseResults",
     "CategoryResult",
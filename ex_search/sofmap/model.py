@@ -22,8 +22,18 @@ class ParseResult(BaseModel):
     shops_with_stock: str = ""
 
 
+class PageInfo(BaseModel):
+    min_page: int = 0
+    max_page: int = 0
+    current_page: int = 0
+    more_page: bool = False
+    enable: bool = False
+    page_urls: dict[int, str] = Field(default_factory=dict)
+
+
 class ParseResults(BaseModel):
     results: list[ParseResult] = Field(default_factory=list)
+    pageinfo: PageInfo | None = Field(default=None)
 
 
 class CategoryResult(BaseModel):
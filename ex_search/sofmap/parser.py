@@ -1,14 +1,47 @@
 import re
+from urllib.parse import urljoin, urlparse
 
-from bs4 import BeautifulSoup
-
+from common.lxml_util import (
+    parse_html,
+    has_class,
+    compile_xpath,
+    get_text,
+    get_first_string,
+)
 from .model import (
     ParseResult,
     ParseResults,
+    PageInfo,
     CategoryResult,
 )
 from .constants import NONE_POINT, NONE_PRICE, NONE_STOCK_NUM, SOFMAP, A_SOFMAP
 
+# セレクタはモジュール読み込み時に一度だけコンパイルする
+ITEMS = compile_xpath("//*[@id='change_style_list']//li")
+TITLE_TAG = compile_xpath("//title")
+ITEM_IMAGES = compile_xpath(f".//a[{has_class('itemimg')}]//img")
+PRODUCT_NAME = compile_xpath(f".//a[{has_class('product_name')}]")
+PRICE = compile_xpath(f".//span[{has_class('price')}]")
+STOCK = compile_xpath(f".//*[{has_class('stock_review-box')}]")
+BRAND = compile_xpath(f".//*[{has_class('brand')}]")
+RELEASE_DATE = compile_xpath(f".//*[{has_class('date')}]")
+POINT = compile_xpath(f".//*[{has_class('point')}]")
+USED_TYPE = compile_xpath(f".//*[{has_class('ic', 'item-type', 'used')}]")
+USED_RANK = compile_xpath(f".//img[{has_class('ic', 'usedrank')}]")
+USED_LIST_LINK = compile_xpath(f".//*[{has_class('used_box', 'txt')}]//a")
+SUB_PRICE = compile_xpath(f".//*[{has_class('price-txt')}]")
+SHOP_LINK = compile_xpath(f".//dl[{has_class('used_link', 'shop')}]//a")
+PAGE_LINKS = compile_xpath("//a[contains(@href, 'pno=')]")
+SELECTS = compile_xpath("//select")
+OPTIONS = compile_xpath(".//option")
+
+
+def _first(xpath, elem):
+    tags = xpath(elem)
+    if not tags:
+        return None
+    return tags[0]
+
 
 class SearchResultParser:
     html_str: str
@@ -24,12 +57,13 @@ class SearchResultParser:
         return self.results
 
     def execute(self):
-        soup = BeautifulSoup(self.html_str, "html.parser")
-        ptn = r"#change_style_list li"
-        elems = soup.select(ptn)
+        root = parse_html(self.html_str)
+        if root is None:
+            return
+        elems = ITEMS(root)
         if not elems:
             return
-        sitename = self._get_sitename(soup)
+        sitename = self._get_sitename(root)
         results = ParseResults()
         for elem in elems:
             result = ParseResult()
@@ -55,6 +89,7 @@ class SearchResultParser:
             if self.url:
                 result.url = self.url
             results.results.append(result)
+        results.pageinfo = self._parse_page(root)
         self.results = results
 
     @classmethod
@@ -70,85 +105,75 @@ class SearchResultParser:
         )
         return text.translate(table).strip()
 
-    def _get_sitename(self, soup) -> str:
-        ptn = r"title"
-        tag = soup.select_one(ptn)
-        if not tag:
+    def _get_sitename(self, root) -> str:
+        tag = _first(TITLE_TAG, root)
+        if tag is None:
             return SOFMAP
-        title_str = str(tag.text).split("｜")[-1]
+        title_str = get_text(tag).split("｜")[-1]
         if "アキバ" in title_str:
             return A_SOFMAP
         return SOFMAP
 
     def _get_image_url(self, elem) -> str:
-        ptn = r"a.itemimg img"
-        tags = elem.select(ptn)
+        tags = ITEM_IMAGES(elem)
         if not tags:
             return ""
         if len(tags) == 1:
-            return tags[0]["src"]
+            return tags[0].attrib["src"]
         else:
-            return tags[1]["src"]
+            return tags[1].attrib["src"]
 
     def _get_title(self, elem) -> str:
-        ptn = r"a.product_name"
-        tag = elem.select_one(ptn)
-        if not tag:
+        tag = _first(PRODUCT_NAME, elem)
+        if tag is None:
             return ""
-        return self._trim_str(str(tag.text))
+        return self._trim_str(get_text(tag))
 
     def _get_price(self, elem) -> int:
-        ptn = r"span.price"
-        tag = elem.select_one(ptn)
-        if not tag:
+        tag = _first(PRICE, elem)
+        if tag is None:
             return NONE_PRICE
-        price = int(re.sub("\\D", "", tag.text))
+        price = int(re.sub("\\D", "", get_text(tag)))
         return price
 
     def _get_stock(self, elem) -> str:
-        ptn = r".stock_review-box"
-        tag = elem.select_one(ptn)
-        if not tag:
+        tag = _first(STOCK, elem)
+        if tag is None:
             return ""
-        return self._trim_str(str(tag.text))
+        return self._trim_str(get_text(tag))
 
     def _get_brand(self, elem) -> str:
-        ptn = r".brand"
-        tag = elem.select_one(ptn)
-        if not tag:
+        tag = _first(BRAND, elem)
+        if tag is None:
             return ""
-        return self._trim_str(str(tag.text))
+        return self._trim_str(get_text(tag))
 
     def _get_release_date(self, elem) -> str:
-        ptn = r".date"
-        tag = elem.select_one(ptn)
-        if not tag:
+        tag = _first(RELEASE_DATE, elem)
+        if tag is None:
             return ""
-        return self._trim_str(str(tag.text))
+        return self._trim_str(get_text(tag))
 
     def _get_point(self, elem) -> int:
-        ptn = r".point"
-        tag = elem.select_one(ptn)
-        if not tag:
+        tag = _first(POINT, elem)
+        if tag is None:
             return NONE_POINT
         try:
-            point = int(re.sub("\\D", "", tag.text))
+            point = int(re.sub("\\D", "", get_text(tag)))
         except Exception:
             return NONE_POINT
         return point
 
     def _get_condition(self, elem) -> str:
-        ptn = r".ic.item-type.used"
-        tag = elem.select_one(ptn)
-        if not tag:
+        tag = _first(USED_TYPE, elem)
+        if tag is None:
             return ""
-        condition = self._trim_str(str(tag.text))
+        condition = self._trim_str(get_text(tag))
 
-        rank_ptn = r"img.ic.usedrank"
-        rank_tag = elem.select_one(rank_ptn)
-        if not rank_tag:
+        rank_tag = _first(USED_RANK, elem)
+        if rank_tag is None:
             return condition
-        rank_url = rank_tag["src"]
+        rank_url = rank_tag.attrib["src"]
         match = re.search(r"usedrank_([A-Z])\.svg", rank_url)
         if match:
             extracted_char = match.group(1)
@@ -157,33 +182,65 @@ class SearchResultParser:
         return condition
 
     def _get_stock_quantity(self, elem) -> tuple[str, int, int]:
-        ptn = r".used_box.txt a"
-        tag = elem.select_one(ptn)
-        if not tag:
+        tag = _first(USED_LIST_LINK, elem)
+        if tag is None:
             return "", NONE_STOCK_NUM, NONE_PRICE
-        if hasattr(tag, "href"):
-            used_list_url = tag["href"]
-        else:
-            used_list_url = ""
+        used_list_url = tag.get("href", "")
         try:
-            stock_num = int(re.sub("\\D", "", str(tag.find(string=True))))
+            stock_num = int(re.sub("\\D", "", str(get_first_string(tag))))
         except Exception:
             return used_list_url, NONE_STOCK_NUM, NONE_PRICE
-        sub_price_tag = tag.select_one(r".price-txt")
-        if not sub_price_tag:
+        sub_price_tag = _first(SUB_PRICE, tag)
+        if sub_price_tag is None:
             return used_list_url, stock_num, NONE_PRICE
         try:
-            sub_price = int(re.sub("\\D", "", str(sub_price_tag.text)))
+            sub_price = int(re.sub("\\D", "", get_text(sub_price_tag)))
         except Exception:
             return used_list_url, stock_num, NONE_PRICE
         return used_list_url, stock_num, sub_price
 
     def _get_shops_with_stock(self, elem) -> str:
-        ptn = r"dl.used_link.shop a"
-        tag = elem.select_one(ptn)
-        if not tag:
+        tag = _first(SHOP_LINK, elem)
+        if tag is None:
             return ""
-        return self._trim_str(tag.text)
+        return self._trim_str(get_text(tag))
+
+    def _parse_page(self, root) -> PageInfo:
+        result = PageInfo()
+        result.current_page = self._get_page_num(self.url) or 1
+        result.page_urls = self._get_page_urls(root)
+        pages = set(result.page_urls.keys()) | {result.current_page}
+        result.min_page = min(pages)
+        result.max_page = max(pages)
+        result.enable = result.min_page != result.max_page
+        result.more_page = result.max_page > result.current_page
+        return result
+
+    def _get_page_num(self, url: str) -> int:
+        m = re.search(r"[?&]pno=(\d+)", url)
+        if not m:
+            return 0
+        return int(m.group(1))
+
+    def _get_page_urls(self, root) -> dict[int, str]:
+        page_urls: dict[int, str] = {}
+        for tag in PAGE_LINKS(root):
+            page_num = self._get_page_num(tag.attrib["href"])
+            if page_num <= 0:
+                continue
+            page_url = urljoin(self.url, tag.attrib["href"])
+            # 検索結果以外のページへのリンクは除外する
+            if self.url and urlparse(page_url).path != urlparse(self.url).path:
+                continue
+            page_urls.setdefault(page_num, page_url)
+        return page_urls
+
+
+def parse_search_result(html_str: str, url: str = "") -> ParseResults:
+    """解析用プロセスから呼び出すためのモジュールレベルの関数"""
+    parser = SearchResultParser(html_str=html_str, url=url)
+    parser.execute()
+    return parser.get_results()
 
 
 class CategoryParser:
@@ -198,28 +255,32 @@ class CategoryParser:
         return self.results
 
     def execute(self):
-        soup = BeautifulSoup(self.html_str, "html.parser")
-        tag_select = self._get_select(soup)
-        if not tag_select:
+        root = parse_html(self.html_str)
+        if root is None:
+            return
+        tag_select = self._get_select(root)
+        if tag_select is None:
             return
-        ptn = r"option"
-        options = tag_select.select(ptn)
+        options = OPTIONS(tag_select)
         results: CategoryResult = self.results
         if not options:
             return
 
         for option in options:
-            if option and "value" in option.attrs:
+            if "value" in option.attrib:
                 results.set_gid_and_category_name(
-                    gid=option["value"], category_name=option.text
+                    gid=option.attrib["value"], category_name=get_text(option)
                 )
                 continue
 
-    def _get_select(self, soup):
-        ptn = r"select"
-        selects = soup.select(ptn)
-        for sel in selects:
-            if sel and "name" in sel.attrs:
-                if sel["name"] == "gid":
-                    return sel
+    def _get_select(self, root):
+        for sel in SELECTS(root):
+            if sel.get("name") == "gid":
+                return sel
         return None
+
+
+def parse_category(html_str: str) -> CategoryResult:
+    parser = CategoryParser(html_str=html_str)
+    parser.execute()
+    return parser.get_results()
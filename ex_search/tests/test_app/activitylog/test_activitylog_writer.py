@@ -0,0 +1,93 @@
+import uuid
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from common.read_config import ActivityLogOptions, SQLParams
+from app.activitylog.update import UpdateActivityLog
+from app.activitylog.writer import (
+    ActivityLogWriter,
+    BufferedActivityLog,
+    create_activitylog_engine,
+)
+from domain.models.activitylog import command as act_cmd, enums as act_enums
+
+
+async def _get_log(sessionmaker, target_id: str):
+    async with sessionmaker() as ses:
+        return await UpdateActivityLog(ses).get(
+            act_cmd.ActivityLogGetCommand(target_id=target_id)
+        )
+
+
+@pytest.mark.asyncio
+async def test_buffered_create_and_update(test_db):
+    writer = ActivityLogWriter(
+        options=ActivityLogOptions(batch_size=10, flush_interval=0.05),
+        sessionmaker=async_sessionmaker(bind=test_db.bind),
+    )
+    writer.start()
+    upactlog = BufferedActivityLog(ses=test_db, writer=writer)
+    target_id = str(uuid.uuid4())
+    tasklog = await upactlog.create(
+        target_id=target_id, target_table="t", subinfo={"a": 1}
+    )
+    assert tasklog.id is None
+    await upactlog.completed(target_id=target_id, add_subinfo={"b": 2})
+    await writer.flush()
+
+    log = await _get_log(writer.sessionmaker, target_id)
+    assert log.current_state == act_enums.UpdateStatus.COMPLETED.name
+    assert log.meta == {"a": 1, "b": 2}
+
+    # 書き込み済みのログを更新する
+    await upactlog.failed(target_id=target_id, error_msg="error")
+    await writer.flush()
+    log = await _get_log(writer.sessionmaker, target_id)
+    assert log.current_state == act_enums.UpdateStatus.FAILED.name
+    assert log.error_msg == "error"
+    await writer.stop()
+
+
+@pytest.mark.asyncio
+async def test_stop_writes_pending_events(test_db):
+    writer = ActivityLogWriter(
+        options=ActivityLogOptions(batch_size=2, flush_interval=10),
+        sessionmaker=async_sessionmaker(bind=test_db.bind),
+    )
+    writer.start()
+    upactlog = BufferedActivityLog(ses=test_db, writer=writer)
+    target_ids = [str(uuid.uuid4()) for _ in range(5)]
+    for target_id in target_ids:
+        await upactlog.create(target_id=target_id)
+    await writer.stop()
+    assert not writer.is_running
+    for target_id in target_ids:
+        assert await _get_log(writer.sessionmaker, target_id) is not None
+
+
+@pytest.mark.asyncio
+async def test_write_to_separate_database(tmp_path):
+    options = ActivityLogOptions(
+        database=SQLParams(
+            drivername="sqlite+aiosqlite", database=str(tmp_path / "actlog.db")
+        )
+    )
+    engine = await create_activitylog_engine(options)
+    try:
+        writer = ActivityLogWriter(
+            options=options, sessionmaker=async_sessionmaker(bind=engine)
+        )
+        writer.start()
+        target_id = str(uuid.uuid4())
+        upactlog = BufferedActivityLog(ses=None, writer=writer)
+        await upactlog.create(target_id=target_id)
+        await writer.stop()
+        assert await _get_log(writer.sessionmaker, target_id) is not None
+        # 読み込みも書き込み先のDBから行う
+        command = act_cmd.ActivityLogGetCommand(target_id=target_id)
+        assert (await upactlog.get(command)).target_id == target_id
+        assert len(await upactlog.get_all(command)) == 1
+        assert await upactlog.get_latest(command)
+    finally:
+        await engine.dispose()
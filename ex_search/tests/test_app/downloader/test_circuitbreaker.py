@@ -0,0 +1,95 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.downloader import circuitbreaker
+
+NAME = circuitbreaker.domain_circuit_name("example.com")
+PARAMS = {"failure_threshold": 2, "cooldown_seconds": 0.05, "probe_timeout": 0.2}
+
+
+def create_breakers():
+    breakers = [circuitbreaker.LocalCircuitBreaker(**PARAMS)]
+    fakeredis = pytest.importorskip("fakeredis")
+    try:
+        import lupa  # noqa: F401
+    except ImportError:
+        return breakers
+    breakers.append(
+        circuitbreaker.RedisCircuitBreaker(
+            r=fakeredis.FakeAsyncRedis(), state_seconds=60, **PARAMS
+        )
+    )
+    return breakers
+
+
+@pytest.mark.asyncio
+async def test_open_half_open_close():
+    for breaker in create_breakers():
+        await breaker.record_failure(NAME)
+        assert await breaker.allow(NAME) == 0
+        await breaker.record_failure(NAME)
+        assert 0 < await breaker.allow(NAME) <= 0.05
+        with pytest.raises(circuitbreaker.CircuitOpenError):
+            await breaker.check(NAME)
+        assert (await breaker.get_states())[NAME] == {"state": "open", "failures": 2}
+
+        await asyncio.sleep(0.06)
+        # 待機後は1件だけ試行でき、失敗すると再びopenになる
+        assert await breaker.allow(NAME) == 0
+        assert await breaker.allow(NAME) > 0
+        await breaker.record_failure(NAME)
+        assert (await breaker.get_states())[NAME]["state"] == "open"
+
+        await asyncio.sleep(0.06)
+        assert await breaker.allow(NAME) == 0
+        await breaker.record_success(NAME)
+        assert await breaker.allow(NAME) == 0
+        assert (await breaker.get_states())[NAME] == {"state": "closed", "failures": 0}
+
+
+@pytest.mark.asyncio
+async def test_peek_and_release_probe():
+    for breaker in create_breakers():
+        assert await breaker.peek(NAME) == 0
+        for _ in range(2):
+            await breaker.record_failure(NAME)
+        assert 0 < await breaker.peek(NAME) <= 0.05
+
+        await asyncio.sleep(0.06)
+        # peekは試行の枠を取らない
+        assert await breaker.peek(NAME) == 0
+        assert await breaker.peek(NAME) == 0
+        assert await breaker.allow(NAME) == 0
+        assert 0 < await breaker.peek(NAME) <= 0.2
+        assert await breaker.allow(NAME) > 0
+        await breaker.release_probe(NAME)
+        assert await breaker.peek(NAME) == 0
+        assert await breaker.allow(NAME) == 0
+        assert (await breaker.get_states())[NAME]["state"] == "half_open"
+
+
+@pytest.mark.asyncio
+async def test_guard():
+    for breaker in create_breakers():
+        request = httpx.Request("POST", "http://api")
+        for _ in range(2):
+            with pytest.raises(httpx.HTTPStatusError):
+                async with breaker.guard(
+                    NAME, is_failure=circuitbreaker.is_backend_error
+                ):
+                    # 4xxは接続先が応答しているため失敗に数えない
+                    raise httpx.HTTPStatusError(
+                        "", request=request, response=httpx.Response(404)
+                    )
+        assert await breaker.allow(NAME) == 0
+        for _ in range(2):
+            with pytest.raises(httpx.ConnectError):
+                async with breaker.guard(
+                    NAME, is_failure=circuitbreaker.is_backend_error
+                ):
+                    raise httpx.ConnectError("", request=request)
+        with pytest.raises(circuitbreaker.CircuitOpenError):
+            async with breaker.guard(NAME):
+                pass
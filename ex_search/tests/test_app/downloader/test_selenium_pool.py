@@ -0,0 +1,236 @@
+import threading
+
+import pytest
+
+from app.downloader import circuitbreaker, selenium_pool
+
+SELENIUM_URL = "http://selenium:4444/wd/hub"
+
+
+class FakeDriver:
+    def __init__(self, command_executor, options):
+        self.command_executor = command_executor
+        self.cookies = []
+        self.storage = {}
+        self.scripts = []
+        self.url = selenium_pool.BLANK_PAGE
+        self.healthy = True
+        self.quitted = False
+
+    @property
+    def current_url(self):
+        if not self.healthy:
+            raise RuntimeError("invalid session id")
+        return self.url
+
+    def get(self, url):
+        self.url = url
+
+    def add_cookie(self, cookie):
+        self.cookies.append(cookie)
+
+    def execute_script(self, script):
+        if self.url == selenium_pool.BLANK_PAGE:
+            raise RuntimeError("SecurityError: Access is denied for this document.")
+        self.scripts.append((self.url, script))
+        self.storage.pop(self.url, None)
+
+    def delete_all_cookies(self):
+        self.cookies.clear()
+
+    def quit(self):
+        self.quitted = True
+
+
+@pytest.fixture
+def drivers(monkeypatch):
+    created: list[FakeDriver] = []
+
+    def create(command_executor, options):
+        driver = FakeDriver(command_executor, options)
+        created.append(driver)
+        return driver
+
+    monkeypatch.setattr(selenium_pool.webdriver, "Remote", create)
+    return created
+
+
+def test_session_is_reused_and_reset(drivers):
+    pool = selenium_pool.SeleniumSessionPool(SELENIUM_URL, max_sessions=1)
+    session = pool.acquire()
+    session.driver.get("https://example.com/")
+    session.driver.add_cookie({"name": "sid", "value": "1"})
+    session.driver.storage["https://example.com/"] = {"token": "1"}
+    pool.release(session)
+
+    # 次の利用者には前回のCookieやWeb Storage、ページを引き継がない
+    assert pool.acquire() is session
+    assert session.driver.cookies == []
+    assert session.driver.storage == {}
+    assert session.driver.scripts == [
+        ("https://example.com/", selenium_pool.CLEAR_STORAGE_SCRIPT)
+    ]
+    assert session.driver.current_url == selenium_pool.BLANK_PAGE
+    assert len(drivers) == 1
+
+    # 何も開いていないセッションはそのまま戻す
+    pool.release(session)
+    assert pool.acquire() is session
+    assert len(session.driver.scripts) == 1
+
+
+def test_session_is_recycled_after_max_uses(drivers):
+    pool = selenium_pool.SeleniumSessionPool(
+        SELENIUM_URL, max_sessions=1, max_uses_per_session=2
+    )
+    first = pool.acquire()
+    pool.release(first)
+    assert pool.acquire() is first
+    pool.release(first)
+    assert first.driver.quitted
+
+    second = pool.acquire()
+    assert second is not first
+    assert len(drivers) == 2
+
+
+def test_unhealthy_or_discarded_session_is_not_reused(drivers):
+    pool = selenium_pool.SeleniumSessionPool(SELENIUM_URL, max_sessions=1)
+    session = pool.acquire()
+    pool.release(session)
+    session.driver.healthy = False
+    replaced = pool.acquire()
+    assert replaced is not session
+    assert session.driver.quitted
+
+    pool.release(replaced, discard=True)
+    assert replaced.driver.quitted
+    assert pool.acquire() not in (session, replaced)
+    assert len(drivers) == 3
+
+
+def test_concurrent_sessions_are_bounded(drivers):
+    pool = selenium_pool.SeleniumSessionPool(SELENIUM_URL, max_sessions=2)
+    sessions = [pool.acquire(), pool.acquire()]
+    acquired = threading.Event()
+
+    def acquire():
+        pool.release(pool.acquire())
+        acquired.set()
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    assert not acquired.wait(0.2)
+    pool.release(sessions[0])
+    assert acquired.wait(5)
+    thread.join()
+    assert len(drivers) == 2
+
+
+def test_failed_session_creation_releases_slot(monkeypatch):
+    def create(command_executor, options):
+        raise ConnectionError("connection refused")
+
+    monkeypatch.setattr(selenium_pool.webdriver, "Remote", create)
+    pool = selenium_pool.SeleniumSessionPool(SELENIUM_URL, max_sessions=1)
+    for _ in range(2):
+        with pytest.raises(selenium_pool.SeleniumSessionError):
+            pool.acquire()
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = circuitbreaker.LocalCircuitBreaker(
+        failure_threshold=1, cooldown_seconds=60, probe_timeout=60
+    )
+    monkeypatch.setattr(selenium_pool, "get_circuit_breaker", lambda: breaker)
+    return breaker
+
+
+@pytest.mark.asyncio
+async def test_download_service_reuses_session(drivers, breaker, monkeypatch):
+    used = []
+
+    def download(url, driver, quit_driver, **kwargs):
+        assert not quit_driver
+        used.append(driver)
+        if url.endswith("error"):
+            raise TimeoutError("page load timeout")
+        driver.get(url)
+        return f"<html>{url}</html>"
+
+    monkeypatch.setattr(selenium_pool, "download_with_selenium", download)
+    service = selenium_pool.SeleniumDownloadService(max_sessions=1)
+    try:
+        for url in ["https://example.com/a", "https://example.com/b"]:
+            assert await service.download(url=url, selenium_url=SELENIUM_URL) == (
+                f"<html>{url}</html>"
+            )
+        assert used[0] is used[1]
+
+        # ダウンロードに失敗したセッションは捨てるが、selenium側の障害とはみなさない
+        with pytest.raises(TimeoutError):
+            await service.download(
+                url="https://example.com/error", selenium_url=SELENIUM_URL
+            )
+        assert used[2].quitted
+        await service.download(url="https://example.com/c", selenium_url=SELENIUM_URL)
+        assert used[3] is not used[2]
+        name = circuitbreaker.selenium_circuit_name(SELENIUM_URL)
+        assert await breaker.allow(name) == 0
+    finally:
+        service.shutdown()
+    assert used[3].quitted
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "cookie_kwargs",
+    [
+        {"cookie_dict_list": [{"name": "sid", "value": "1"}]},
+        {"cookie_load": True},
+        {"cookie_save": True},
+    ],
+)
+async def test_download_service_discards_session_using_cookies(
+    drivers, breaker, monkeypatch, cookie_kwargs
+):
+    used = []
+
+    def download(url, driver, quit_driver, **kwargs):
+        used.append(driver)
+        driver.get(url)
+        return "<html></html>"
+
+    monkeypatch.setattr(selenium_pool, "download_with_selenium", download)
+    service = selenium_pool.SeleniumDownloadService(max_sessions=1)
+    try:
+        await service.download(
+            url="https://example.com/a", selenium_url=SELENIUM_URL, **cookie_kwargs
+        )
+        assert used[0].quitted
+        await service.download(url="https://example.com/b", selenium_url=SELENIUM_URL)
+        assert used[1] is not used[0]
+        assert not used[1].quitted
+    finally:
+        service.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_download_service_opens_circuit_on_session_error(breaker, monkeypatch):
+    def create(command_executor, options):
+        raise ConnectionError("connection refused")
+
+    monkeypatch.setattr(selenium_pool.webdriver, "Remote", create)
+    service = selenium_pool.SeleniumDownloadService(max_sessions=1)
+    try:
+        with pytest.raises(selenium_pool.SeleniumSessionError):
+            await service.download(
+                url="https://example.com/", selenium_url=SELENIUM_URL
+            )
+        with pytest.raises(circuitbreaker.CircuitOpenError):
+            await service.download(
+                url="https://example.com/", selenium_url=SELENIUM_URL
+            )
+    finally:
+        service.shutdown()
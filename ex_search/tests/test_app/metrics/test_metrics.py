@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from common import read_config
+from app.downloader import circuitbreaker
+from app.metrics import metrics
+from routers import metrics as metrics_router
+
+
+def get_value(name: str, **labels) -> float:
+    return metrics.REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = circuitbreaker.LocalCircuitBreaker(
+        failure_threshold=1, cooldown_seconds=30, probe_timeout=30
+    )
+    monkeypatch.setattr(metrics, "get_circuit_breaker", lambda: breaker)
+    return breaker
+
+
+def test_observe_stage():
+    labels = {"sitename": "sofmap", "domain": "www.sofmap.com"}
+    name = "ex_search_stage_duration_seconds_count"
+    before = get_value(name, stage="download", download_type="httpx", **labels)
+    with metrics.observe_stage(
+        "download", sitename="Sofmap", domain="www.sofmap.com"
+    ) as stage_labels:
+        stage_labels["download_type"] = "httpx"
+    assert get_value(name, stage="download", download_type="httpx", **labels) == (
+        before + 1
+    )
+
+    with pytest.raises(ValueError):
+        with metrics.observe_stage("parse", sitename="geo"):
+            raise ValueError()
+    assert (
+        get_value(name, stage="parse", sitename="geo", domain="", download_type="") >= 1
+    )
+
+
+def test_sitename_label():
+    assert metrics.get_sitename_label("Sofmap") == "sofmap"
+    assert metrics.get_sitename_label("") == ""
+    assert metrics.get_sitename_label("unknown-site") == metrics.OTHER_SITENAME
+
+    name = "ex_search_stage_duration_seconds_count"
+    labels = {"stage": "search", "domain": "", "download_type": ""}
+    before = get_value(name, sitename=metrics.OTHER_SITENAME, **labels)
+    for sitename in ["a", "b"]:
+        with metrics.observe_stage("search", sitename=sitename):
+            pass
+    assert get_value(name, sitename=metrics.OTHER_SITENAME, **labels) == before + 2
+    assert get_value(name, sitename="a", **labels) == 0
+
+
+def test_domain_label_limit(monkeypatch):
+    monkeypatch.setattr(metrics, "_domain_labels", set())
+    monkeypatch.setattr(
+        read_config,
+        "get_metrics_options",
+        lambda: read_config.MetricsOptions(max_domain_labels=1),
+    )
+    assert metrics.get_domain_label("a.example.com") == "a.example.com"
+    assert metrics.get_domain_label("b.example.com") == metrics.OTHER_DOMAIN
+    assert metrics.get_domain_label("a.example.com") == "a.example.com"
+
+
+def test_domain_circuit_labels_are_limited(breaker, monkeypatch):
+    monkeypatch.setattr(metrics, "_domain_labels", set())
+    monkeypatch.setattr(
+        read_config,
+        "get_metrics_options",
+        lambda: read_config.MetricsOptions(max_domain_labels=1),
+    )
+    for domain in ["a.example.com", "b.example.com", "c.example.com"]:
+        asyncio.run(breaker.record_failure(circuitbreaker.domain_circuit_name(domain)))
+    asyncio.run(breaker.record_failure("selenium:http://selenium:4444/wd/hub"))
+    asyncio.run(metrics.update_circuit_metrics())
+
+    def get_state(circuit_name: str) -> float | None:
+        return metrics.REGISTRY.get_sample_value(
+            "ex_search_circuit_state", {"name": circuit_name}
+        )
+
+    # 上限を超えたドメインはotherにまとめる
+    assert get_state("domain:a.example.com") == 2
+    assert get_state(f"domain:{metrics.OTHER_DOMAIN}") == 2
+    assert get_state("domain:b.example.com") is None
+    assert get_state("selenium:http://selenium:4444/wd/hub") == 2
+
+
+def test_counters_and_in_flight():
+    name = "ex_search_cache_requests_total"
+    before = get_value(name, cache="search", result="hit")
+    metrics.count_cache("search", "hit")
+    assert get_value(name, cache="search", result="hit") == before + 1
+
+    metrics.count_gemini_model("gemini-2.5-pro", "escalated")
+    assert (
+        get_value(
+            "ex_search_gemini_model_requests_total",
+            model="gemini-2.5-pro",
+            result="escalated",
+        )
+        >= 1
+    )
+
+    with metrics.track_in_flight("in-flight.example.com"):
+        assert (
+            get_value("ex_search_downloads_in_flight", domain="in-flight.example.com")
+            == 1
+        )
+    assert (
+        get_value("ex_search_downloads_in_flight", domain="in-flight.example.com") == 0
+    )
+
+
+def test_metrics_endpoint(breaker):
+    asyncio.run(breaker.record_failure("selenium:http://selenium:4444/wd/hub"))
+    app = FastAPI()
+    app.include_router(metrics_router.router)
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert "ex_search_stage_duration_seconds_bucket" in text
+    assert (
+        'ex_search_circuit_state{name="selenium:http://selenium:4444/wd/hub"} 2.0'
+        in (text)
+    )
+    assert "ex_search_parse_executor_submitted_total" in text
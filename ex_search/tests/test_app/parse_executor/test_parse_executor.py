@@ -0,0 +1,70 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from common.read_config import ParseExecutorOptions
+from app.parse_executor import ParseExecutor
+from sofmap.parser import SearchResultParser, parse_search_result
+from sofmap.model import ParseResults
+from app.gemini_api.html_util import html_to_minimal_dict
+
+DATA_DIR = Path(__file__).parents[2] / "test_parser" / "data"
+URL = "https://www.sofmap.com/search_result.aspx?keyword=test"
+
+
+def _expected(html: str) -> ParseResults:
+    parser = SearchResultParser(html_str=html, url=URL)
+    parser.execute()
+    return parser.get_results()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", ["inline", "thread", "process"])
+async def test_run_returns_same_models(backend):
+    html = (DATA_DIR / "sofmap_search_result.html").read_text(encoding="utf-8")
+    executor = ParseExecutor(ParseExecutorOptions(backend=backend, max_workers=2))
+    try:
+        await executor.warm_up()
+        results = await asyncio.gather(
+            *[executor.run(parse_search_result, html, URL) for _ in range(4)]
+        )
+        minimal = await executor.run(html_to_minimal_dict, html)
+    finally:
+        executor.shutdown()
+    assert all(isinstance(r, ParseResults) for r in results)
+    assert all(r == _expected(html) for r in results)
+    assert minimal == html_to_minimal_dict(html)
+    stats = executor.stats()
+    assert stats.submitted == 5
+    assert stats.completed == 5
+    assert stats.in_flight == 0
+    assert stats.queue_depth == 0
+
+
+@pytest.mark.asyncio
+async def test_queue_depth_counts_waiting_tasks():
+    executor = ParseExecutor(ParseExecutorOptions(backend="thread", max_workers=1))
+    try:
+        tasks = [
+            asyncio.create_task(executor.run(parse_search_result, "", URL))
+            for _ in range(3)
+        ]
+        await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+    finally:
+        executor.shutdown()
+    stats = executor.stats()
+    assert stats.max_queue_depth == 2
+    assert stats.completed == 3
+
+
+@pytest.mark.asyncio
+async def test_failed_task_is_counted():
+    executor = ParseExecutor(ParseExecutorOptions(backend="inline"))
+    with pytest.raises(AttributeError):
+        # bodyの無いHTML
+        await executor.run(html_to_minimal_dict, "")
+    stats = executor.stats()
+    assert stats.failed == 1
+    assert stats.in_flight == 0
@@ -0,0 +1,96 @@
+import asyncio
+import contextlib
+
+import pytest
+
+from domain.schemas.search import SearchRequest, SearchResponse, BatchSearchRequest
+from common import read_config
+from app.search_api import batch
+
+
+class FakeSearchClient:
+    calls: list[str] = []
+    running: dict[str, int] = {}
+    max_running: dict[str, int] = {}
+
+    def __init__(self, ses, searchrequest, searchcache_repository, **kwargs):
+        self.searchrequest = searchrequest
+
+    async def execute(self):
+        sitename = self.searchrequest.sitename
+        FakeSearchClient.calls.append(self.searchrequest.search_keyword)
+        running = FakeSearchClient.running.get(sitename, 0) + 1
+        FakeSearchClient.running[sitename] = running
+        FakeSearchClient.max_running[sitename] = max(
+            running, FakeSearchClient.max_running.get(sitename, 0)
+        )
+        await asyncio.sleep(0.05)
+        FakeSearchClient.running[sitename] -= 1
+        return SearchResponse(error_msg=self.searchrequest.search_keyword)
+
+
+@contextlib.asynccontextmanager
+async def fake_sessionmaker():
+    yield None
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    FakeSearchClient.calls = []
+    FakeSearchClient.running = {}
+    FakeSearchClient.max_running = {}
+    monkeypatch.setattr(batch, "SearchClient", FakeSearchClient)
+    return FakeSearchClient
+
+
+@pytest.fixture
+def rate_limit_options(monkeypatch):
+    opts = read_config.RateLimitOptions(
+        default={"max_concurrency": 1},
+        domains={"iosys.co.jp": {"max_concurrency": 3}},
+    )
+    monkeypatch.setattr(read_config, "get_rate_limit_options", lambda: opts)
+    return opts
+
+
+@pytest.mark.asyncio
+async def test_execute_keeps_order_and_dedupes(fake_client):
+    keywords = ["a", "b", "a", "c", "b"]
+    batchreq = BatchSearchRequest(
+        requests=[SearchRequest(search_keyword=k, sitename="geo") for k in keywords]
+    )
+    client = batch.BatchSearchClient(
+        batchrequest=batchreq,
+        sessionmaker=fake_sessionmaker,
+        searchcache_repository_factory=lambda ses: None,
+        max_concurrency=10,
+    )
+    response = await client.execute()
+    assert [r.error_msg for r in response.results] == keywords
+    assert sorted(fake_client.calls) == ["a", "b", "c"]
+    assert response.results[0] is not response.results[2]
+
+
+@pytest.mark.asyncio
+async def test_execute_limits_concurrency_per_site(fake_client, rate_limit_options):
+    requests = [
+        SearchRequest(search_keyword=f"{sitename}{i}", sitename=sitename)
+        for i in range(4)
+        for sitename in ["sofmap", "geo", "iosys"]
+    ]
+    client = batch.BatchSearchClient(
+        batchrequest=BatchSearchRequest(requests=requests),
+        sessionmaker=fake_sessionmaker,
+        searchcache_repository_factory=lambda ses: None,
+        max_concurrency=5,
+    )
+    response = await client.execute()
+    assert len(response.results) == 12
+    # サイト名のリクエストもそのサイトのドメインのmax_concurrencyで制限する
+    assert fake_client.max_running == {"sofmap": 1, "geo": 1, "iosys": 3}
+
+
+def test_domain_limiter_uses_rate_limit_max_concurrency(rate_limit_options):
+    limiter = batch.DomainLimiter()
+    assert limiter.get_semaphore("iosys.co.jp")._value == 3
+    assert limiter.get_semaphore("www.sofmap.com")._value == 1
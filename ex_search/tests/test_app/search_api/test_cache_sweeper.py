@@ -0,0 +1,110 @@
+from datetime import datetime, timezone, timedelta
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlmodel import SQLModel
+
+from common.compression import Compressor, HEADER_SIZE
+from common.read_config import CacheSweeperOptions, SQLParams
+from databases.sql import create_table  # noqa: F401
+from databases.sql.util import create_async_db_engine
+from databases.sql.cache.repository import SearchCacheRepository
+from domain.models.cache import cache as m_cache, command as c_cmd
+from app.search_api.cache_sweeper import CacheSweeper
+
+TEXT_SIZE = 100000
+DATA_SIZE = TEXT_SIZE + HEADER_SIZE
+
+
+@pytest.mark.asyncio
+async def test_sweep_deletes_expired_and_least_recently_used(tmp_path, monkeypatch):
+    # サイズを固定するため圧縮しない
+    monkeypatch.setattr(
+        "databases.sql.cache.repository.get_cache_compressor",
+        lambda: Compressor(method="none"),
+    )
+    engine = create_async_db_engine(
+        SQLParams(drivername="sqlite+aiosqlite", database=str(tmp_path / "c.db"))
+    )
+    sessionmaker = async_sessionmaker(bind=engine)
+    now = datetime.now(timezone.utc)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+        async with sessionmaker() as ses:
+            repo = SearchCacheRepository(ses)
+            for i in range(6):
+                await repo.save(
+                    m_cache.SearchCache(
+                        domain="example.com",
+                        url=f"https://example.com/{i}",
+                        download_type="httpx",
+                        download_text="a" * TEXT_SIZE,
+                        # 0,1は期限切れ
+                        expires=now + timedelta(minutes=-1 if i < 2 else 5),
+                        last_accessed_at=now - timedelta(minutes=10 - i),
+                    )
+                )
+            # 最も古い有効なキャッシュを参照する
+            await repo.get(
+                c_cmd.SearchCacheGetCommand(
+                    url="https://example.com/2", expires_start=now
+                )
+            )
+
+        sweeper = CacheSweeper(
+            options=CacheSweeperOptions(batch_size=1, max_total_bytes=DATA_SIZE * 2),
+            sessionmaker=sessionmaker,
+        )
+        result = await sweeper.sweep()
+        assert result.expired_deleted == 2
+        assert result.evicted == 2
+        assert result.evicted_bytes == DATA_SIZE * 2
+        assert result.total_bytes == DATA_SIZE * 2
+        assert result.reclaimed_bytes > 0
+
+        async with sessionmaker() as ses:
+            res = await ses.execute(select(m_cache.SearchCache.url))
+            urls = sorted(res.scalars().all())
+        assert urls == ["https://example.com/2", "https://example.com/5"]
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_sweep_keeps_expired_within_stale_window(tmp_path):
+    engine = create_async_db_engine(
+        SQLParams(drivername="sqlite+aiosqlite", database=str(tmp_path / "c.db"))
+    )
+    sessionmaker = async_sessionmaker(bind=engine)
+    now = datetime.now(timezone.utc)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+        async with sessionmaker() as ses:
+            repo = SearchCacheRepository(ses)
+            for i, expired_minutes in enumerate([1, 10]):
+                await repo.save(
+                    m_cache.SearchCache(
+                        domain="example.com",
+                        url=f"https://example.com/{i}",
+                        download_type="httpx",
+                        download_text="a",
+                        expires=now - timedelta(minutes=expired_minutes),
+                    )
+                )
+
+        sweeper = CacheSweeper(
+            options=CacheSweeperOptions(max_total_bytes=None, vacuum_pages=0),
+            sessionmaker=sessionmaker,
+            stale_while_revalidate=300,
+        )
+        result = await sweeper.sweep()
+        assert result.expired_deleted == 1
+
+        async with sessionmaker() as ses:
+            res = await ses.execute(select(m_cache.SearchCache.url))
+            assert res.scalars().all() == ["https://example.com/0"]
+    finally:
+        await engine.dispose()
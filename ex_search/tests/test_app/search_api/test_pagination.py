@@ -0,0 +1,60 @@
+from sofmap.parser import SearchResultParser as SofmapParser
+from sofmap.model import PageInfo
+from app.search_api import pagination
+
+SOFMAP_URL = "https://www.sofmap.com/search_result.aspx?gid=&keyword=%83%7d%83%8a%83I"
+
+SOFMAP_HTML = """
+<html><head><title>検索結果｜ソフマップ</title></head><body>
+<ul id="change_style_list">
+  <li><a class="product_name">item1</a><span class="price">1,000円</span></li>
+</ul>
+<div class="pager">
+  <ul>
+    <li class="current">1</li>
+    <li><a href="/search_result.aspx?gid=&amp;keyword=%83%7d%83%8a%83I&amp;pno=2">2</a></li>
+    <li><a href="/search_result.aspx?gid=&amp;keyword=%83%7d%83%8a%83I&amp;pno=3">3</a></li>
+    <li><a href="/product_list.aspx?pno=9">other</a></li>
+  </ul>
+</div>
+</body></html>
+"""
+
+
+def test_sofmap_parser_extracts_pageinfo():
+    parser = SofmapParser(html_str=SOFMAP_HTML, url=SOFMAP_URL)
+    parser.execute()
+    pageinfo = parser.get_results().pageinfo
+    assert pageinfo.current_page == 1
+    assert pageinfo.max_page == 3
+    assert pageinfo.more_page
+    assert pageinfo.page_urls[2] == SOFMAP_URL + "&pno=2"
+    assert 9 not in pageinfo.page_urls
+
+
+def test_build_page_url_keeps_encoded_query():
+    url = pagination.build_page_url(url=SOFMAP_URL + "&pno=2", page_param="pno", page=3)
+    assert url == SOFMAP_URL + "&pno=3"
+
+
+def test_get_next_page_urls_limits_pages():
+    pageinfo = PageInfo(current_page=1, max_page=5, page_urls={2: "https://x/2"})
+    urls = pagination.get_next_page_urls(
+        url=SOFMAP_URL, sitename="sofmap", pageinfo=pageinfo, max_pages=3
+    )
+    assert urls == ["https://x/2", SOFMAP_URL + "&pno=3"]
+
+    urls = pagination.get_next_page_urls(
+        url=SOFMAP_URL,
+        sitename="sofmap",
+        pageinfo=pageinfo,
+        max_pages=10,
+        max_results=25,
+        results_per_page=10,
+    )
+    assert len(urls) == 2
+
+    urls = pagination.get_next_page_urls(
+        url=SOFMAP_URL, sitename="sofmap", pageinfo=pageinfo, max_pages=1
+    )
+    assert urls == []
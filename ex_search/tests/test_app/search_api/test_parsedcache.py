@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlmodel import SQLModel
+
+from app.search_api import parsedcache
+from common.read_config import SQLParams
+from databases.sql import create_table  # noqa: F401
+from databases.sql.util import create_async_db_engine
+from databases.sql.cache.repository import ParsedSearchCacheRepository
+from domain.schemas.search.search import SearchRequest, SearchResponse, SearchResult
+
+URL = "https://www.sofmap.com/search_result.aspx?keyword=test"
+
+
+@pytest.fixture
+async def sessionmaker(tmp_path):
+    engine = create_async_db_engine(
+        SQLParams(drivername="sqlite+aiosqlite", database=str(tmp_path / "p.db"))
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    yield async_sessionmaker(bind=engine)
+    await engine.dispose()
+
+
+def create_client(ses, **kwargs):
+    searchrequest = SearchRequest(url=URL, sitename="sofmap", **kwargs)
+    return parsedcache.ParsedSearchCacheClient(
+        ses=ses,
+        repository=ParsedSearchCacheRepository(ses),
+        searchrequest=searchrequest,
+        converted_url=URL,
+    )
+
+
+def create_response():
+    return SearchResponse(results=[SearchResult(title="test", price=100)])
+
+
+@pytest.mark.asyncio
+async def test_parsedcache_save_and_get(sessionmaker, monkeypatch):
+    expires = datetime.now(timezone.utc) + timedelta(hours=1)
+    async with sessionmaker() as ses:
+        client = create_client(ses)
+        assert await client.get() is None
+        await client.save(response=create_response(), expires=expires)
+        cached = await client.get()
+        assert cached == create_response()
+        assert await create_client(ses, no_cache=True).get() is None
+        assert await create_client(ses, max_results=1).get() is None
+
+        # パーサーが変わると別のキーになる
+        monkeypatch.setattr(parsedcache, "_get_module_version", lambda _: "changed")
+        assert await client.get() is None
+
+
+@pytest.mark.asyncio
+async def test_parsedcache_expired_and_error(sessionmaker):
+    async with sessionmaker() as ses:
+        client = create_client(ses)
+        await client.save(
+            response=create_response(),
+            expires=datetime.now(timezone.utc) - timedelta(seconds=1),
+        )
+        assert await client.get() is None
+
+        client = create_client(ses, max_pages=2)
+        await client.save(
+            response=SearchResponse(error_msg="failed"),
+            expires=datetime.now(timezone.utc) + timedelta(hours=1),
+        )
+        assert await client.get() is None
+
+
+def test_module_version_covers_parser_dependencies(monkeypatch):
+    from common import lxml_util
+    from app.search_api import pagination
+    from app.search_api.search import SearchClient
+    import sofmap.model
+    import sofmap.constants
+
+    sources = []
+
+    def getsource(obj):
+        sources.append(obj)
+        return obj.__name__
+
+    monkeypatch.setattr(parsedcache.inspect, "getsource", getsource)
+    parsedcache._get_module_version.cache_clear()
+    try:
+        parsedcache._get_module_version("sofmap")
+    finally:
+        parsedcache._get_module_version.cache_clear()
+    for source in [lxml_util, pagination, SearchClient, sofmap.model, sofmap.constants]:
+        assert source in sources
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from common import read_config
+from app.search_api import domainlock, ratelimit
+from app.search_api.enums import RateLimitResult
+
+DOMAIN = "example.com"
+
+
+@pytest.fixture
+def rateopts(monkeypatch):
+    opts = read_config.RateLimitOptions(
+        default={"rate": 10, "burst": 2},
+        domains={"slow.example.com": {"rate": 0.01, "burst": 1}},
+        backoff_factor=0.5,
+        increase_step=0.25,
+        window_size=4,
+        error_ratio=0.5,
+        min_rate=1,
+    )
+    monkeypatch.setattr(read_config, "get_rate_limit_options", lambda: opts)
+    return opts
+
+
+def create_limiters():
+    limiters = [ratelimit.LocalDomainRateLimiter()]
+    fakeredis = pytest.importorskip("fakeredis")
+    try:
+        import lupa  # noqa: F401
+    except ImportError:
+        return limiters
+    limiters.append(ratelimit.RedisDomainRateLimiter(r=fakeredis.FakeAsyncRedis()))
+    return limiters
+
+
+@pytest.mark.asyncio
+async def test_token_bucket(rateopts):
+    for limiter in create_limiters():
+        # burstの分はすぐに取得でき、その後はrateの間隔で待つ
+        assert await limiter._try_acquire(DOMAIN) == 0
+        assert await limiter._try_acquire(DOMAIN) == 0
+        wait = await limiter._try_acquire(DOMAIN)
+        assert 0 < wait <= 0.1
+        assert await limiter.acquire(DOMAIN, timeout=1)
+        assert await limiter.acquire("slow.example.com", timeout=0)
+        assert not await limiter.acquire("slow.example.com", timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_adaptive_rate(rateopts):
+    for limiter in create_limiters():
+        assert await limiter.record(DOMAIN, RateLimitResult.THROTTLED) == 5
+        assert await limiter.record(DOMAIN, RateLimitResult.THROTTLED) == 2.5
+        # 制限された直後はトークンが空になる
+        assert await limiter._try_acquire(DOMAIN) > 0
+        for _ in range(3):
+            assert await limiter.record(DOMAIN, RateLimitResult.OK) == 2.5
+        assert await limiter.record(DOMAIN, RateLimitResult.OK) == 5
+        for _ in range(2):
+            await limiter.record(DOMAIN, RateLimitResult.OK)
+        for _ in range(2):
+            rate = await limiter.record(DOMAIN, RateLimitResult.ERROR)
+        assert rate == 2.5
+        for _ in range(4 * 10):
+            rate = await limiter.record(DOMAIN, RateLimitResult.OK)
+        assert rate == 10
+        for _ in range(10):
+            rate = await limiter.record(DOMAIN, RateLimitResult.THROTTLED)
+        assert rate == 1
+
+
+def test_is_throttled_message():
+    assert ratelimit.is_throttled_message(
+        "Client error '429 Too Many Requests' for url 'https://example.com/'"
+    )
+    assert ratelimit.is_throttled_message("Server error '503 Service Unavailable'")
+    assert not ratelimit.is_throttled_message("https://example.com/item/403")
+    assert not ratelimit.is_throttled_message(None)
+
+
+@pytest.mark.asyncio
+async def test_local_domain_lock_limit():
+    lock = domainlock.LocalDomainLock(limit=1)
+    tokens = [await lock.acquire(domain=DOMAIN, timeout=1, limit=3) for _ in range(3)]
+    assert all(tokens)
+    assert await lock.acquire(domain=DOMAIN, timeout=0.05, limit=3) is None
+    other = await lock.acquire(domain="other.example.com", timeout=1)
+    assert await lock.acquire(domain="other.example.com", timeout=0.05) is None
+    await lock.release(domain="other.example.com", token=other)
+    waiter = asyncio.create_task(lock.acquire(domain=DOMAIN, timeout=1, limit=3))
+    await asyncio.sleep(0)
+    await lock.release(domain=DOMAIN, token=tokens[0])
+    assert await waiter
@@ -0,0 +1,108 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from common import read_config
+from domain.models.cache import cache as m_cache, command as c_cmd
+from domain.schemas.search import DownloadRequest
+from app.search_api import search
+from app.search_api.revalidate import CacheRevalidator, RevalidateResult
+from app.search_api.singleflight import SingleFlight
+
+URL = "https://www.sofmap.com/search_result.aspx?keyword=test"
+
+
+class FakeSearchCacheRepository:
+    def __init__(self, searchcache: m_cache.SearchCache):
+        self.searchcache = searchcache
+
+    async def get(self, command: c_cmd.SearchCacheGetCommand):
+        if self.searchcache.expires < command.expires_start:
+            return []
+        return [self.searchcache]
+
+
+class FakeRevalidator:
+    def __init__(self):
+        self.keys = []
+
+    def revalidate(self, key, func):
+        self.keys.append(key)
+
+
+def set_stale_while_revalidate(monkeypatch, seconds: int):
+    cacheopts = read_config.get_cache_options().model_copy(
+        update={"stale_while_revalidate": seconds}
+    )
+    monkeypatch.setattr(read_config, "get_cache_options", lambda: cacheopts)
+
+
+def create_downloader(expires: datetime, max_stale: int | None = None):
+    searchcache = m_cache.SearchCache(
+        domain="www.sofmap.com",
+        url=URL,
+        download_type="httpx",
+        download_text="<html></html>",
+        expires=expires,
+        created_at=datetime.now(timezone.utc),
+    )
+    return search.HTMLDownloader(
+        downloadrequest=DownloadRequest(
+            url=URL, sitename="sofmap", max_stale=max_stale
+        ),
+        searchcache_repository=FakeSearchCacheRepository(searchcache),
+        converted_url=URL,
+    )
+
+
+@pytest.mark.asyncio
+async def test_revalidate_runs_once_per_key():
+    revalidator = CacheRevalidator(singleflight=SingleFlight(RevalidateResult))
+    call_count = 0
+
+    async def func():
+        nonlocal call_count
+        call_count += 1
+        await asyncio.sleep(0.1)
+        return RevalidateResult()
+
+    task = revalidator.revalidate(key="key", func=func)
+    assert revalidator.revalidate(key="key", func=func) is None
+    await task
+    assert call_count == 1
+    await revalidator.revalidate(key="key", func=func)
+    assert call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_stale_cache_is_returned_and_revalidated(monkeypatch):
+    set_stale_while_revalidate(monkeypatch, 60)
+    revalidator = FakeRevalidator()
+    monkeypatch.setattr(search, "get_cache_revalidator", lambda: revalidator)
+    expired = datetime.now(timezone.utc) - timedelta(seconds=30)
+
+    ok, result = await create_downloader(expires=expired).execute()
+    assert ok
+    assert result.is_stale
+    assert len(revalidator.keys) == 1
+
+    ok, result = await create_downloader(
+        expires=datetime.now(timezone.utc) + timedelta(seconds=30)
+    ).execute()
+    assert ok
+    assert not result.is_stale
+    assert len(revalidator.keys) == 1
+
+
+@pytest.mark.asyncio
+async def test_max_stale_limits_grace_window(monkeypatch):
+    set_stale_while_revalidate(monkeypatch, 60)
+    expired = datetime.now(timezone.utc) - timedelta(seconds=30)
+    assert create_downloader(expires=expired)._get_max_stale() == 60
+    assert create_downloader(expires=expired, max_stale=10)._get_max_stale() == 10
+    assert create_downloader(expires=expired, max_stale=120)._get_max_stale() == 60
+
+    set_stale_while_revalidate(monkeypatch, 0)
+    downloader = create_downloader(expires=expired)
+    assert await downloader._get_search_cache() is None
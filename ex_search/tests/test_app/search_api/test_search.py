@@ -1,41 +1,176 @@
+import asyncio
+
 import pytest
-import redis.asyncio as a_redis
 
-from common import read_config
-from domain.schemas.search import SearchRequest
-from app.search_api import search, repository
+from domain.schemas.search import DownloadRequest
+from app.downloader import circuitbreaker
+from app.search_api import search, domainlock
 
 
-class TestSearchClient:
+class TestHTMLDownloader:
 
-    async def delete_redis_key(self, repo: repository.URLDomainCacheRepository):
-        async with repo.r.client() as client:
-            keys = await client.keys("domain:*")
-            if keys:
-                await client.delete(keys)
+    def create_downloader(self) -> search.HTMLDownloader:
+        return search.HTMLDownloader(
+            downloadrequest=DownloadRequest(url="", sitename="", options={}),
+            searchcache_repository=None,
+        )
 
     @pytest.mark.asyncio
     async def test_wait_downloadable_no_cache(self):
-        sclient = search.SearchClient(
-            ses=None,
-            searchrequest=SearchRequest(
-                url="", search_keyword="", sitename="", options={}
-            ),
-            searchcache_repository=None,
-            caller_type="test",
-        )
-        redisopts = read_config.get_redis_options()
-        cacheopts = read_config.get_cache_options()
-        domainrepo = repository.URLDomainCacheRepository(
-            r=a_redis.Redis(host=redisopts.host, port=redisopts.port, db=redisopts.db),
-            expiry_seconds=cacheopts.expires,
-        )
+        downloader = self.create_downloader()
+        lock = domainlock.LocalDomainLock()
         wait_time_util_dl = 30
-        ok, msg = await sclient._wait_downloadable(
+        ok, msg, token = await downloader._wait_downloadable(
             domain="test_domain",
-            repository=domainrepo,
+            lock=lock,
             timeout_util_downloadable=wait_time_util_dl,
         )
         assert ok == True
         assert msg == ""
-        await self.delete_redis_key(repo=domainrepo)
+        assert token
+        await lock.release(domain="test_domain", token=token)
+
+    @pytest.mark.asyncio
+    async def test_wait_downloadable_timeout(self):
+        downloader = self.create_downloader()
+        lock = domainlock.LocalDomainLock()
+        token = await lock.acquire(domain="test_domain", timeout=1)
+        ok, msg, next_token = await downloader._wait_downloadable(
+            domain="test_domain",
+            lock=lock,
+            timeout_util_downloadable=0.1,
+        )
+        assert ok == False
+        assert "time out" in msg
+        assert next_token is None
+        await lock.release(domain="test_domain", token=token)
+
+    @pytest.fixture
+    def half_open_breaker(self, monkeypatch):
+        breaker = circuitbreaker.LocalCircuitBreaker(
+            failure_threshold=1, cooldown_seconds=0.01, probe_timeout=60
+        )
+        monkeypatch.setattr(search, "get_circuit_breaker", lambda: breaker)
+        monkeypatch.setattr(search, "get_domain_lock", domainlock.LocalDomainLock)
+        return breaker
+
+    def create_no_cache_downloader(self) -> search.HTMLDownloader:
+        return search.HTMLDownloader(
+            downloadrequest=DownloadRequest(
+                url="https://www.sofmap.com/", sitename="sofmap", no_cache=True
+            ),
+            searchcache_repository=None,
+        )
+
+    @pytest.mark.asyncio
+    async def test_probe_is_not_claimed_while_waiting(
+        self, half_open_breaker, monkeypatch
+    ):
+        name = circuitbreaker.domain_circuit_name("www.sofmap.com")
+        await half_open_breaker.record_failure(name)
+        await asyncio.sleep(0.02)
+        downloader = self.create_no_cache_downloader()
+
+        async def wait_rate_limit(**kwargs):
+            # 待っている間は他のリクエストも試行できる
+            assert await half_open_breaker.peek(name) == 0
+            return False, "time out"
+
+        monkeypatch.setattr(downloader, "_wait_rate_limit", wait_rate_limit)
+        ok, result = await downloader.execute()
+        assert not ok and result.error_msg == "time out"
+        assert await half_open_breaker.allow(name) == 0
+
+    @pytest.mark.asyncio
+    async def test_probe_is_released_when_download_raises(
+        self, half_open_breaker, monkeypatch
+    ):
+        name = circuitbreaker.domain_circuit_name("www.sofmap.com")
+        await half_open_breaker.record_failure(name)
+        await asyncio.sleep(0.02)
+        downloader = self.create_no_cache_downloader()
+
+        async def wait_rate_limit(**kwargs):
+            return True, ""
+
+        async def download(**kwargs):
+            assert await half_open_breaker.peek(name) > 0
+            raise asyncio.CancelledError()
+
+        monkeypatch.setattr(downloader, "_wait_rate_limit", wait_rate_limit)
+        monkeypatch.setattr(downloader, "_download", download)
+        with pytest.raises(asyncio.CancelledError):
+            await downloader.execute()
+        assert await half_open_breaker.allow(name) == 0
+
+
+class TestLocalDomainLock:
+
+    @pytest.mark.asyncio
+    async def test_release_wakes_waiters_in_fifo_order(self):
+        lock = domainlock.LocalDomainLock()
+        first = await lock.acquire(domain="test_domain", timeout=1)
+        order = []
+
+        async def waiter(name: str):
+            token = await lock.acquire(domain="test_domain", timeout=1)
+            order.append(name)
+            await lock.release(domain="test_domain", token=token)
+
+        tasks = [asyncio.create_task(waiter(name)) for name in ["a", "b", "c"]]
+        await asyncio.sleep(0)
+        assert order == []
+        await lock.release(domain="test_domain", token=first)
+        await asyncio.gather(*tasks)
+        assert order == ["a", "b", "c"]
+
+
+class TestRedisDomainLock:
+
+    def create_lock(self, **kwargs) -> domainlock.RedisDomainLock:
+        fakeredis = pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")
+        return domainlock.RedisDomainLock(r=fakeredis.FakeAsyncRedis(), **kwargs)
+
+    @pytest.mark.asyncio
+    async def test_acquire_and_release(self):
+        lock = self.create_lock(limit=1)
+        first = await lock.acquire(domain="test_domain", timeout=1)
+        assert first
+        assert await lock.acquire(domain="test_domain", timeout=0.1) is None
+        # limitを指定すると同時に取得できる
+        second = await lock.acquire(domain="test_domain", timeout=1, limit=2)
+        assert second
+        await lock.release(domain="test_domain", token=second)
+
+        waiter = asyncio.create_task(lock.acquire(domain="test_domain", timeout=5))
+        await asyncio.sleep(0.1)
+        assert not waiter.done()
+        await lock.release(domain="test_domain", token=first)
+        third = await asyncio.wait_for(waiter, timeout=5)
+        assert third
+        await lock.release(domain="test_domain", token=third)
+        assert await lock.r.llen(lock._queue_key("test_domain")) == 0
+        assert not lock._renewals
+
+    @pytest.mark.asyncio
+    async def test_lease_is_renewed_while_held(self):
+        lock = self.create_lock(limit=1, hold_seconds=1)
+        token = await lock.acquire(domain="test_domain", timeout=1)
+        await asyncio.sleep(1.5)
+        assert await lock.r.exists(lock._lease_key("test_domain", token))
+        assert await lock.acquire(domain="test_domain", timeout=0.1) is None
+        await lock.release(domain="test_domain", token=token)
+        assert not await lock.r.exists(lock._lease_key("test_domain", token))
+        assert await lock.acquire(domain="test_domain", timeout=1)
+
+    @pytest.mark.asyncio
+    async def test_expired_holder_is_purged(self):
+        lock = self.create_lock(limit=1, hold_seconds=1)
+        token = await lock.acquire(domain="test_domain", timeout=1)
+        # ワーカーが落ちて延長されなくなった状態
+        lock._renewals.pop(token).cancel()
+        assert await lock.acquire(domain="test_domain", timeout=2)
+        assert token.encode() not in await lock.r.lrange(
+            lock._queue_key("test_domain"), 0, -1
+        )
@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from domain.schemas.search import DownloadRequest, SearchResponse, SofmapOptions
+from app.search_api.search import SearchFlightResult
+from app.search_api.singleflight import SingleFlight, create_request_key
+
+
+@pytest.mark.asyncio
+async def test_do_coalesces_concurrent_calls():
+    singleflight = SingleFlight(result_model=SearchFlightResult)
+    call_count = 0
+
+    async def func():
+        nonlocal call_count
+        call_count += 1
+        await asyncio.sleep(0.1)
+        return SearchFlightResult(response=SearchResponse(error_msg="done"))
+
+    results = await asyncio.gather(*[singleflight.do("key", func) for _ in range(5)])
+    assert call_count == 1
+    assert all(r.response.error_msg == "done" for r in results)
+    assert len({id(r) for r in results}) == 5
+
+
+def test_create_request_key_ignores_option_order_and_sitename_case():
+    url = "https://www.sofmap.com/search_result.aspx?keyword=test"
+    req1 = DownloadRequest(
+        url=url,
+        sitename="sofmap",
+        options=SofmapOptions(remove_duplicates=False, is_akiba=False),
+    )
+    req2 = DownloadRequest(
+        url=url,
+        sitename="SOFMAP",
+        options={"is_akiba": False, "remove_duplicates": False},
+    )
+    assert create_request_key(req1) == create_request_key(req2)
+    req3 = DownloadRequest(url=url, sitename="sofmap", no_cache=True)
+    assert create_request_key(req1) != create_request_key(req3)
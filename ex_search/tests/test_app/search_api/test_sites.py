@@ -0,0 +1,83 @@
+import pytest
+from urllib.parse import parse_qs, urlparse
+
+from app.search_api import sites
+from domain.schemas.search.search import SearchRequest, SofmapOptions
+
+EXTERNAL_API_CONFIG = {
+    "downloader": {
+        "gemini": {"url": "http://dl/gemini"},
+        "example.com": {"url": "http://dl/example"},
+        "geo": {"url": "http://dl/geo"},
+        "iosys": {"timeout": 10},
+    },
+}
+
+
+@pytest.fixture
+def registry():
+    return sites.SiteRegistry(
+        handlers=sites.create_default_site_handlers(),
+        external_api_config=EXTERNAL_API_CONFIG,
+    )
+
+
+def test_get_handler(registry):
+    assert isinstance(registry.get("Sofmap"), sites.SofmapSiteHandler)
+    assert isinstance(registry.get("gemini"), sites.GeminiSiteHandler)
+    assert registry.get("unknown") is None
+    assert isinstance(registry.get_by_netloc("a.sofmap.com"), sites.SofmapSiteHandler)
+    assert isinstance(
+        registry.get_by_netloc("ec.geo-online.co.jp"), sites.GeoSiteHandler
+    )
+    assert registry.get_by_netloc("example.com") is None
+
+
+def test_find_external_api(registry):
+    # geminiはドメインのみで探す
+    assert registry.find_external_api("downloader", "gemini") is None
+    assert (
+        registry.find_external_api("downloader", "gemini", "example.com")["url"]
+        == "http://dl/example"
+    )
+    assert (
+        registry.find_external_api("downloader", "GEO", "example.com")["url"]
+        == "http://dl/geo"
+    )
+    assert (
+        registry.find_external_api("downloader", "sofmap", "example.com")["url"]
+        == "http://dl/example"
+    )
+    # urlが無い設定は使わない
+    assert registry.find_external_api("downloader", "iosys") is None
+    assert registry.find_external_api("parser", "geo", "example.com") is None
+
+
+def test_sofmap_convert_url(registry):
+    handler = registry.get("sofmap")
+    url = "https://www.sofmap.com/search_result.aspx?keyword=test"
+    converted = handler.convert_url(url, SofmapOptions(convert_to_direct_search=True))
+    assert converted != url
+    assert handler.convert_url(converted, SofmapOptions()) == converted
+    assert handler.convert_url(url, {}) == url
+
+
+@pytest.mark.asyncio
+async def test_build_url(registry):
+    geo_url = await registry.get("geo").build_url(
+        ses=None, searchrequest=SearchRequest(search_keyword="abc", sitename="geo")
+    )
+    assert urlparse(geo_url).netloc == "ec.geo-online.co.jp"
+    assert "abc" in geo_url
+
+    iosys_url = await registry.get("iosys").build_url(
+        ses=None,
+        searchrequest=SearchRequest(
+            search_keyword="abc",
+            sitename="iosys",
+            options={"min_price": "100", "condition": "", "unknown": "x"},
+        ),
+    )
+    query = parse_qs(urlparse(iosys_url).query)
+    assert "100" in str(query)
+    assert "unknown" not in query
@@ -0,0 +1,61 @@
+import asyncio
+import contextlib
+import json
+
+import pytest
+
+from domain.schemas.search import (
+    SearchRequest,
+    SearchResponse,
+    BatchSearchRequest,
+    SearchStreamEnd,
+)
+from app.search_api import batch, stream
+
+
+class SlowSearchClient:
+    def __init__(self, ses, searchrequest, searchcache_repository, **kwargs):
+        self.searchrequest = searchrequest
+
+    async def execute(self):
+        await asyncio.sleep(float(self.searchrequest.search_keyword))
+        return SearchResponse(error_msg=self.searchrequest.search_keyword)
+
+
+@contextlib.asynccontextmanager
+async def fake_sessionmaker():
+    yield None
+
+
+@pytest.mark.asyncio
+async def test_stream_batch_search_yields_in_completion_order(monkeypatch):
+    monkeypatch.setattr(batch, "SearchClient", SlowSearchClient)
+    requests = [
+        SearchRequest(search_keyword="0.2", sitename="sofmap"),
+        SearchRequest(search_keyword="0.01", sitename="geo"),
+        SearchRequest(search_keyword="0.2", sitename="sofmap"),
+    ]
+    client = batch.BatchSearchClient(
+        batchrequest=BatchSearchRequest(requests=requests),
+        sessionmaker=fake_sessionmaker,
+        searchcache_repository_factory=lambda ses: None,
+    )
+    events = [event async for event in stream.stream_batch_search(client=client)]
+    assert [(e.index, e.response.error_msg) for e in events[:-1]] == [
+        (1, "0.01"),
+        (0, "0.2"),
+        (2, "0.2"),
+    ]
+    assert events[-1] == SearchStreamEnd(count=3)
+
+
+def test_encode_event():
+    event = SearchStreamEnd(count=1)
+    ndjson = stream.encode_event(event=event, media_type=stream.NDJSON_MEDIA_TYPE)
+    assert json.loads(ndjson) == event.model_dump()
+    assert ndjson.endswith("\n")
+    sse = stream.encode_event(event=event, media_type=stream.SSE_MEDIA_TYPE)
+    assert sse.startswith("event: end\ndata: ")
+    assert sse.endswith("\n\n")
+    assert stream.select_media_type("text/event-stream") == stream.SSE_MEDIA_TYPE
+    assert stream.select_media_type("application/json") == stream.NDJSON_MEDIA_TYPE
@@ -0,0 +1,37 @@
+from unittest.mock import Mock
+
+from app.gemini_api.parser_registry import ParserRegistry
+
+CODE = "class Parser:\n    pass\n"
+
+
+def test_register_validates_and_compiles_once():
+    registry = ParserRegistry()
+    validator = Mock(return_value=(True, None))
+    entry = registry.register(label="a", code=CODE, validator=validator, log_id=1)
+    assert entry.is_safe
+    assert entry.bytecode
+    assert registry.register(label="a", code=CODE, validator=validator) is entry
+    assert registry.get_by_log(label="a", log_id=1) is entry
+    assert registry.get_by_log(label="b", log_id=1) is None
+    validator.assert_called_once_with(CODE)
+
+
+def test_unsafe_code_is_not_compiled():
+    registry = ParserRegistry()
+    entry = registry.register(
+        label="a", code=CODE, validator=Mock(return_value=(False, "unsafe"))
+    )
+    assert not entry.is_safe
+    assert entry.error_msg == "unsafe"
+    assert entry.bytecode is None
+
+
+def test_invalidate_drops_entries_of_label():
+    registry = ParserRegistry()
+    validator = Mock(return_value=(True, None))
+    registry.register(label="a", code=CODE, validator=validator, log_id=1)
+    registry.register(label="b", code=CODE, validator=validator, log_id=2)
+    registry.invalidate("a")
+    assert registry.get_by_log(label="a", log_id=1) is None
+    assert registry.get_by_log(label="b", log_id=2) is not None
@@ -0,0 +1,63 @@
+import pytest
+from sqlalchemy import inspect
+
+from app.gemini_api.parserlog import UpdateParserLog
+from app.gemini_api.models import AskGeminiErrorInfo
+from databases.sql.ai import repository as ai_repo
+from domain.models.ai import ailog as m_ailog
+
+
+@pytest.mark.asyncio
+async def test_get_log_returns_latest_success_without_query(test_db):
+    label = "parserlog_latest"
+    plog = UpdateParserLog(test_db, ai_repo.ParserGenerationLogRepository(test_db))
+    first = await plog.save_log(
+        label=label,
+        target_url="http://example.com",
+        query="<html>1</html>",
+        response={"candidates": [1]},
+        error_info=None,
+    )
+    first_id = first.id
+    await plog.save_log(
+        label=label,
+        target_url="http://example.com",
+        query="<html>2</html>",
+        response={"candidates": [2]},
+        error_info=AskGeminiErrorInfo(error_type="E", error="error"),
+    )
+    test_db.expunge_all()
+
+    log = await plog.get_log(label=label, is_error=False)
+    assert log.id == first_id
+    assert log.response == {"candidates": [1]}
+    assert "query" in inspect(log).unloaded
+
+    # 同じセッションで読み込んだログを更新できる
+    log = await plog.update_log(
+        log_entry=log, error_info=AskGeminiErrorInfo(error_type="E", error="error")
+    )
+    assert log.error_info["error_type"] == "E"
+    assert await plog.get_log(label=label, is_error=False) is None
+
+
+@pytest.mark.asyncio
+async def test_active_parser_repository(test_db):
+    label = "parserlog_active"
+    repo = ai_repo.ActiveParserRepository(test_db)
+    assert await repo.get(label=label) is None
+
+    await repo.save(
+        m_ailog.ActiveParser(label=label, log_id=1, code="a", code_hash="ha")
+    )
+    await repo.save(
+        m_ailog.ActiveParser(label=label, log_id=2, code="b", code_hash="hb")
+    )
+    active = await repo.get(label=label)
+    assert (active.log_id, active.code, active.code_hash) == (2, "b", "hb")
+
+    # 別のログのパーサーが有効な場合は削除しない
+    await repo.delete(label=label, log_id=1)
+    assert await repo.get(label=label) is not None
+    await repo.delete(label=label, log_id=2)
+    assert await repo.get(label=label) is None
@@ -0,0 +1,116 @@
+import pytest
+
+from common.read_config import SandboxOptions
+from app.gemini_api.sandbox import SandboxPool
+
+PARSER_CODE = """
+class Parser:
+    def __init__(self, html_str):
+        self.html_str = html_str
+
+    def execute(self):
+        soup = bs4.BeautifulSoup(self.html_str, "lxml")
+        return [li.get_text() for li in soup.select("li")]
+"""
+HTML = "<ul><li>a</li><li>b</li></ul>"
+
+
+@pytest.fixture
+def pool():
+    pool = SandboxPool(SandboxOptions(max_workers=1, max_jobs_per_worker=3))
+    yield pool
+    pool.close()
+
+
+def _worker_pid(pool: SandboxPool) -> int:
+    worker = pool.acquire()
+    pool.release(worker)
+    return worker.process.pid
+
+
+def test_worker_is_reused_and_recycled(pool):
+    assert pool.run(PARSER_CODE, HTML, timeout=10) == ["a", "b"]
+    pid = _worker_pid(pool)
+    assert pool.run(PARSER_CODE, HTML, timeout=10) == ["a", "b"]
+    assert _worker_pid(pool) == pid
+    # max_jobs_per_worker回目の実行後は作り直す
+    assert pool.run(PARSER_CODE, HTML, timeout=10) == ["a", "b"]
+    assert _worker_pid(pool) != pid
+
+
+@pytest.mark.parametrize(
+    "patch",
+    [
+        "json.dumps = None",
+        # サブモジュールで定義されたクラスの属性
+        "bs4.BeautifulSoup.select = lambda self, q: []",
+        "bs4.element.Tag.get_text.__defaults__ = ('x',)",
+        # モジュールの状態をその場で書き換える
+        "getattr(re, '_cache2', re._cache)[(str, 'li', 0)] = re.compile('EVIL')",
+    ],
+)
+def test_shared_module_changes_do_not_leak_to_next_job(pool, patch):
+    code = PARSER_CODE + f"        {patch}\n"
+    code = code.replace("return [", "result = [") + "        return result\n"
+    check_code = PARSER_CODE.replace(
+        'return [li.get_text() for li in soup.select("li")]',
+        'return [re.compile("li").pattern, json.dumps(1)]'
+        ' + [li.get_text() for li in soup.select("li")]',
+    )
+    pid = _worker_pid(pool)
+    assert pool.run(code, HTML, timeout=10) == ["a", "b"]
+    assert pool.run(check_code, HTML, timeout=10) == ["li", "1", "a", "b"]
+    # ワーカーを作り直さずに元の状態から実行する
+    assert _worker_pid(pool) == pid
+
+
+def test_timeout_and_crash_are_reported(pool):
+    code = "class Parser:\n    def __init__(self, html_str):\n        pass\n"
+    pid = _worker_pid(pool)
+    with pytest.raises(TimeoutError):
+        pool.run(code + "    def execute(self):\n        while True: pass\n", HTML, 1)
+    # 止めるのは子プロセスのみで、ワーカーは使い続ける
+    assert _worker_pid(pool) == pid
+    with pytest.raises(RuntimeError, match="terminated abnormally"):
+        pool.run(
+            code + "    def execute(self):\n        raise SystemExit(3)\n", HTML, 10
+        )
+    assert pool.run(PARSER_CODE, HTML, timeout=10) == ["a", "b"]
+
+
+def test_error_in_generated_code_is_reported(pool):
+    with pytest.raises(RuntimeError, match=r"\[ValueError\] No parser class"):
+        pool.run("x = 1", HTML, timeout=10)
+
+
+def test_compiled_code_is_cached_by_hash(pool):
+    assert pool.run(PARSER_CODE, HTML, timeout=10, code_hash="hash") == ["a", "b"]
+    # 同じハッシュではコンパイル済みのコードを使う
+    changed = PARSER_CODE.replace('"li"', '"p"')
+    assert pool.run(changed, HTML, timeout=10, code_hash="hash") == ["a", "b"]
+    assert pool.run(changed, HTML, timeout=10) == []
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        # クラス属性に可変な値を持つ
+        "class Parser:\n    items = []\n    def __init__(self, html_str):\n        pass\n"
+        "    def execute(self):\n        self.items.append(1)\n        return self.items\n",
+        # 実行中にクラス属性を書き換える
+        "class Parser:\n    count = 0\n    def __init__(self, html_str):\n        pass\n"
+        "    def execute(self):\n        type(self).count += 1\n        return [type(self).count]\n",
+        # クロージャに状態を持つ
+        "def make():\n    items = []\n    def collect(x):\n        items.append(x)\n        return items\n"
+        "    return collect\ncollect = make()\n"
+        "class Parser:\n    def __init__(self, html_str):\n        pass\n"
+        "    def execute(self):\n        return [len(collect(1))]\n",
+        "def make():\n    count = 0\n    def counter():\n        nonlocal count\n        count += 1\n"
+        "        return count\n    return counter\ncounter = make()\n"
+        "class Parser:\n    def __init__(self, html_str):\n        pass\n"
+        "    def execute(self):\n        return [counter()]\n",
+    ],
+)
+def test_parser_state_is_not_carried_over(pool, code):
+    for _ in range(2):
+        assert pool.run(code, HTML, timeout=10, code_hash="hash") == [1]
@@ -0,0 +1,79 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlmodel import SQLModel
+
+from common import compression
+from common.read_config import SQLParams
+from databases.sql import create_table  # noqa: F401
+from databases.sql.util import create_async_db_engine
+from databases.sql.cache.repository import SearchCacheRepository
+from domain.models.cache import cache as m_cache, command as c_cmd
+
+HTML = "<html><body>" + "<li>商品</li>" * 1000 + "</body></html>"
+
+
+@pytest.mark.parametrize("method", ["zstd", "gzip", "none"])
+def test_compress_roundtrip(method):
+    data = HTML.encode("utf-8")
+    compressed = compression.compress(data, method=method)
+    assert compression.is_compressed(compressed)
+    assert compression.decompress(compressed) == data
+    if method != "none":
+        assert len(compressed) < len(data)
+
+
+def test_uncompressed_data_is_returned_as_is():
+    assert compression.decompress(b'{"url": "a"}') == b'{"url": "a"}'
+    assert compression.Compressor().decompress_text(HTML) == HTML
+
+
+def test_zstd_falls_back_to_gzip(monkeypatch):
+    monkeypatch.setattr(compression, "_zstd", None)
+    # zstdのレベルはgzipでは範囲外のため使わない
+    compressed = compression.compress(b"abc", method="zstd", level=15)
+    assert compressed[: compression.HEADER_SIZE] == (
+        compression.MAGIC + compression.METHOD_IDS["gzip"]
+    )
+    assert compression.decompress(compressed) == b"abc"
+    assert compression.Compressor(method="zstd", level=15).level is None
+
+
+@pytest.mark.asyncio
+async def test_sql_cache_stores_compressed_text(tmp_path):
+    engine = create_async_db_engine(
+        SQLParams(drivername="sqlite+aiosqlite", database=str(tmp_path / "c.db"))
+    )
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+            # 圧縮する前に保存されたキャッシュ
+            await conn.execute(
+                text(
+                    "INSERT INTO searchcache (domain, url, download_type,"
+                    " download_text, error_msg, data_size, created_at, updated_at,"
+                    " is_deleted) VALUES ('d', 'old', 't', :html, '', 0,"
+                    " '2024-01-01', '2024-01-01', 0)"
+                ),
+                {"html": HTML},
+            )
+        async with async_sessionmaker(bind=engine)() as ses:
+            repo = SearchCacheRepository(ses)
+            data = m_cache.SearchCache(
+                domain="d", url="new", download_type="t", download_text=HTML
+            )
+            await repo.save(data)
+            assert data.download_text == HTML
+            assert data.data_size < len(HTML.encode("utf-8"))
+            for url in ["old", "new"]:
+                results = await repo.get(c_cmd.SearchCacheGetCommand(url=url))
+                assert results[0].download_text == HTML
+        async with engine.connect() as conn:
+            stored = (
+                await conn.execute(
+                    text("SELECT download_text FROM searchcache WHERE url = 'new'")
+                )
+            ).scalar()
+        assert compression.is_compressed(stored)
+    finally:
+        await engine.dispose()
@@ -0,0 +1,82 @@
+import pydantic
+import pytest
+
+from common import read_config
+
+
+@pytest.fixture
+def clean_snapshot(monkeypatch):
+    monkeypatch.delenv(read_config.ENV_FILE_ENV, raising=False)
+    read_config._snapshot_values.clear()
+    yield
+    monkeypatch.undo()
+    read_config._snapshot_values.clear()
+
+
+def test_options_are_memoized_and_frozen(clean_snapshot):
+    cacheopts = read_config.get_cache_options()
+    assert read_config.get_cache_options() is cacheopts
+    with pytest.raises(pydantic.ValidationError):
+        cacheopts.expires = 1
+    ext_api_config = read_config.get_external_api_config()
+    with pytest.raises(TypeError):
+        ext_api_config["parser"] = {}
+
+
+def test_env_overrides(clean_snapshot, monkeypatch, tmp_path):
+    env_file = tmp_path / ".env"
+    env_file.write_text(
+        "# comment\n"
+        "EX_SEARCH__CACHE_OPTIONS__EXPIRES=600\n"
+        'export EX_SEARCH__REDIS_OPTIONS__HOST="localhost"\n',
+        encoding="utf-8",
+    )
+    monkeypatch.setenv(read_config.ENV_FILE_ENV, str(env_file))
+    monkeypatch.setenv("EX_SEARCH__CACHE_OPTIONS__BACKEND", "sql")
+    monkeypatch.setenv("EX_SEARCH__SELENIUM_OPTIONS__REMOTE_URL", "http://a:4444")
+    monkeypatch.setenv(
+        "EX_SEARCH__EXTERNAL_API_CONFIG__PARSER__EXAMPLE.COM", '{"url": "http://p"}'
+    )
+
+    assert read_config.get_cache_options().expires == 600
+    assert read_config.get_cache_options().backend == "sql"
+    assert read_config.get_redis_options().host == "localhost"
+    assert read_config.get_selenium_options().remote_url == "http://a:4444"
+    parser_config = read_config.get_external_api_config()["parser"]
+    assert parser_config["example.com"]["url"] == "http://p"
+
+
+def test_reload_settings(clean_snapshot, monkeypatch):
+    called = []
+    monkeypatch.setattr(read_config, "_reload_listeners", [lambda: called.append(1)])
+    before = read_config.get_cache_options()
+
+    monkeypatch.setenv("EX_SEARCH__CACHE_OPTIONS__EXPIRES", "0")
+    with pytest.raises(pydantic.ValidationError):
+        read_config.reload_settings()
+    assert read_config.get_cache_options() is before
+    assert called == []
+
+    monkeypatch.setenv("EX_SEARCH__CACHE_OPTIONS__EXPIRES", "120")
+    read_config.reload_settings()
+    assert read_config.get_cache_options().expires == 120
+    assert called == [1]
+
+
+@pytest.mark.parametrize(
+    "compression, level, valid",
+    [
+        ("gzip", 9, True),
+        ("gzip", 15, False),
+        ("zstd", 15, True),
+        ("zstd", -8, False),
+        ("none", None, True),
+    ],
+)
+def test_compression_level_is_validated_per_method(compression, level, valid):
+    params = {"expires": 300, "compression": compression, "compression_level": level}
+    if valid:
+        assert read_config.CacheOptions(**params).compression_level == level
+    else:
+        with pytest.raises(pydantic.ValidationError):
+            read_config.CacheOptions(**params)
@@ -0,0 +1,136 @@
+import re
+import sqlite3
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlmodel import SQLModel
+
+from common.read_config import SQLParams
+from databases.sql import create_table  # noqa: F401
+from databases.sql.util import create_async_db_engine
+from databases.sql.activitylog.repository import ActivityLogRepository
+from databases.sql.cache.repository import (
+    SearchCacheRepository,
+    SearchCacheDeleteRepository,
+    SearchCacheMaintenanceRepository,
+)
+from databases.sql.ai.repository import (
+    ParserGenerationLogRepository,
+    CodeValidationErrorsRepository,
+)
+from domain.models.activitylog import command as act_cmd
+from domain.models.cache import command as c_cmd
+from domain.models.ai import command as a_cmd
+
+NOW = datetime.now(timezone.utc)
+
+QUERIES = [
+    (
+        lambda ses: SearchCacheRepository(ses).get(
+            c_cmd.SearchCacheGetCommand(url="https://example.com", expires_start=NOW)
+        ),
+        "ix_searchcache_url_expires_created_at",
+    ),
+    (
+        lambda ses: SearchCacheDeleteRepository(ses).delete_all(
+            c_cmd.SearchCacheDeleteCommand(expires_end=NOW)
+        ),
+        "ix_searchcache_expires",
+    ),
+    (
+        lambda ses: SearchCacheDeleteRepository(ses).delete_all(
+            c_cmd.SearchCacheDeleteCommand(domain="example.com", expires_end=NOW)
+        ),
+        "ix_searchcache_domain_expires",
+    ),
+    (
+        lambda ses: SearchCacheMaintenanceRepository(ses).get_least_recently_used(
+            limit=10
+        ),
+        "ix_searchcache_last_accessed_at_data_size",
+    ),
+    (
+        lambda ses: SearchCacheMaintenanceRepository(ses).delete_expired(
+            now=NOW, limit=10
+        ),
+        "ix_searchcache_expires",
+    ),
+    (
+        lambda ses: ActivityLogRepository(ses).get(
+            act_cmd.ActivityLogGetCommand(target_id="target")
+        ),
+        "ix_activitylog_target_id",
+    ),
+    (
+        lambda ses: ActivityLogRepository(ses).get_latest(
+            act_cmd.ActivityLogGetCommand(
+                activity_types=["SearchClient"], current_states=["COMPLETED"]
+            )
+        ),
+        "ix_activitylog_type_state_updated_at",
+    ),
+    (
+        lambda ses: ActivityLogRepository(ses).get(
+            act_cmd.ActivityLogGetCommand(caller_type="api", updated_at_start=NOW)
+        ),
+        "ix_activitylog_caller_type_updated_at",
+    ),
+    (
+        lambda ses: ParserGenerationLogRepository(ses).get_latest(
+            a_cmd.ParserGenerationLogGetCommand(label="label", is_error=False)
+        ),
+        # 統計情報が無い場合はどちらの索引を使うか決まらない
+        ("ix_parsergenerationlog_label_active_id", "ix_parsergenerationlog_label"),
+    ),
+    (
+        lambda ses: ParserGenerationLogRepository(ses).get(
+            a_cmd.ParserGenerationLogGetCommand(target_url="https://example.com")
+        ),
+        "ix_parsergenerationlog_target_url",
+    ),
+    (
+        lambda ses: CodeValidationErrorsRepository(ses).get(
+            a_cmd.CodeValidationErrorsGetCommand(label="label", error_type="E")
+        ),
+        "ix_codevalidationerrors_label_error_type",
+    ),
+]
+
+FULL_SCAN_PATTERN = re.compile(r"^SCAN \w+$")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("query, index_names", QUERIES)
+async def test_repository_query_uses_index(tmp_path, query, index_names):
+    if isinstance(index_names, str):
+        index_names = (index_names,)
+    db_path = tmp_path / "plan.db"
+    engine = create_async_db_engine(
+        SQLParams(drivername="sqlite+aiosqlite", database=str(db_path))
+    )
+    statements = []
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "DELETE")):
+            statements.append((statement, parameters))
+
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+        async with async_sessionmaker(bind=engine)() as ses:
+            await query(ses)
+    finally:
+        await engine.dispose()
+
+    assert statements
+    with sqlite3.connect(db_path) as conn:
+        for statement, parameters in statements:
+            plan = [
+                row[-1]
+                for row in conn.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            ]
+            assert not [p for p in plan if FULL_SCAN_PATTERN.match(p)], plan
+            assert any(name in p for p in plan for name in index_names), plan
@@ -0,0 +1,32 @@
+import pytest
+
+from databases.redis import util as redis_util
+from app.search_api.repository import URLDomainCacheRepository
+
+
+@pytest.mark.asyncio
+async def test_get_async_redis_shares_pool(monkeypatch):
+    monkeypatch.setattr(redis_util, "_connection_pool", None)
+    r1 = redis_util.get_async_redis()
+    r2 = redis_util.get_async_redis()
+    assert r1.connection_pool is r2.connection_pool
+
+    other = redis_util.get_async_redis(port=6380)
+    assert other.connection_pool is not r1.connection_pool
+    assert other.connection_pool.connection_kwargs["port"] == 6380
+
+    await redis_util.close_redis_pool()
+    assert redis_util._connection_pool is None
+
+
+@pytest.mark.asyncio
+async def test_urldomain_cache_delete_all():
+    fakeredis = pytest.importorskip("fakeredis")
+    r = fakeredis.FakeAsyncRedis()
+    for i in range(1200):
+        await r.hset(f"domain:{i}.example.com:data", "status", "completed")
+    await r.set("URL:https://example.com/", "cache")
+
+    await URLDomainCacheRepository(r=r).delete_all()
+    assert await r.keys("domain:*") == []
+    assert await r.get("URL:https://example.com/") == b"cache"
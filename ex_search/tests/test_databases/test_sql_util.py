@@ -0,0 +1,79 @@
+import pytest
+from sqlalchemy import text
+from sqlmodel import SQLModel
+
+from common.read_config import SQLiteOptions, SQLParams
+from databases.sql import create_table  # noqa: F401
+from databases.sql.util import (
+    create_async_db_engine,
+    create_db_engine,
+    ensure_columns,
+)
+
+
+def _params(drivername: str, path) -> SQLParams:
+    return SQLParams(drivername=drivername, database=str(path))
+
+
+def test_pragmas_are_set_on_sync_engine(tmp_path):
+    engine = create_db_engine(_params("sqlite", tmp_path / "sync.db"))
+    try:
+        with engine.connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            # NORMAL
+            assert conn.execute(text("PRAGMA synchronous")).scalar() == 1
+            assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+        assert engine.pool.size() == 5
+    finally:
+        engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_pragmas_are_set_on_async_engine(tmp_path):
+    engine = create_async_db_engine(
+        _params("sqlite+aiosqlite", tmp_path / "async.db"),
+        sqlite_options=SQLiteOptions(synchronous="FULL", busy_timeout=1000),
+    )
+    try:
+        async with engine.connect() as conn:
+            assert (await conn.execute(text("PRAGMA journal_mode"))).scalar() == "wal"
+            assert (await conn.execute(text("PRAGMA synchronous"))).scalar() == 2
+            assert (await conn.execute(text("PRAGMA busy_timeout"))).scalar() == 1000
+    finally:
+        await engine.dispose()
+
+
+def test_pragmas_can_be_disabled(tmp_path):
+    engine = create_db_engine(
+        _params("sqlite", tmp_path / "default.db"),
+        sqlite_options=SQLiteOptions(enabled=False),
+    )
+    try:
+        with engine.connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == "delete"
+    finally:
+        engine.dispose()
+
+
+def test_ensure_columns_adds_missing_columns(tmp_path):
+    engine = create_db_engine(_params("sqlite", tmp_path / "old.db"))
+    try:
+        with engine.begin() as conn:
+            conn.execute(
+                text(
+                    "CREATE TABLE searchcache (id INTEGER PRIMARY KEY, domain VARCHAR,"
+                    " url VARCHAR, download_type VARCHAR, download_text VARCHAR,"
+                    " expires DATETIME, error_msg VARCHAR, created_at DATETIME,"
+                    " updated_at DATETIME, is_deleted BOOLEAN)"
+                )
+            )
+            conn.execute(text("INSERT INTO searchcache (url) VALUES ('a')"))
+        SQLModel.metadata.create_all(engine)
+        ensure_columns(engine)
+        with engine.connect() as conn:
+            row = conn.execute(
+                text("SELECT data_size, last_accessed_at FROM searchcache")
+            ).one()
+        assert tuple(row) == (0, None)
+    finally:
+        engine.dispose()
@@ -0,0 +1,42 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from sofmap.parser import SearchResultParser as SofmapParser, CategoryParser
+from geo.parser import SearchResultParser as GeoParser
+from iosys.parser import SearchResultParser as IosysParser
+
+DATA_DIR = Path(__file__).parent / "data"
+
+
+@pytest.mark.parametrize(
+    "parser_class, name",
+    [
+        (SofmapParser, "sofmap_search_result"),
+        (SofmapParser, "a_sofmap_search_result"),
+        (GeoParser, "geo_search_result"),
+        (IosysParser, "iosys_search_result"),
+    ],
+)
+def test_parse_results_match_golden(parser_class, name):
+    html = (DATA_DIR / f"{name}.html").read_text(encoding="utf-8")
+    golden = json.loads((DATA_DIR / f"{name}.json").read_text(encoding="utf-8"))
+    parser = parser_class(html_str=html, url=golden["url"])
+    parser.execute()
+    assert parser.get_results().model_dump(mode="json") == golden["results"]
+
+
+@pytest.mark.parametrize("parser_class", [SofmapParser, GeoParser, IosysParser])
+def test_parse_empty_html(parser_class):
+    parser = parser_class(html_str="", url="")
+    parser.execute()
+    assert parser.get_results().results == []
+
+
+def test_sofmap_category_matches_golden():
+    html = (DATA_DIR / "sofmap_category.html").read_text(encoding="utf-8")
+    golden = json.loads((DATA_DIR / "sofmap_category.json").read_text(encoding="utf-8"))
+    parser = CategoryParser(html_str=html)
+    parser.execute()
+    assert parser.get_results().model_dump(mode="json") == golden
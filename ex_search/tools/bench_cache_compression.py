@@ -0,0 +1,123 @@
+import time
+import asyncio
+import argparse
+import pathlib
+import tempfile
+
+from sqlmodel import SQLModel
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from common import compression
+from common.read_config import SQLParams
+from databases.sql import util as db_util
+from databases.sql import create_table  # noqa: F401 テーブル定義の読み込み
+from databases.sql.cache import repository as sql_cache_repo
+from domain.models.cache import cache as m_cache, command as c_cmd
+
+DEFAULT_DATA_DIR = pathlib.Path(__file__).parents[1] / "tests" / "test_parser" / "data"
+
+
+def set_argparse():
+    parser = argparse.ArgumentParser(
+        description="キャッシュするHTMLの圧縮方式毎のサイズと、保存、取得の処理時間を計測します"
+    )
+    parser.add_argument("-d", "--data_dir", type=str, default=str(DEFAULT_DATA_DIR))
+    parser.add_argument("-n", "--repeat", type=int, default=20)
+    parser.add_argument("-l", "--level", type=int, default=None)
+    return parser.parse_args()
+
+
+def bench_codec(htmls: list[str], method: str, level: int | None, repeat: int):
+    compressor = compression.Compressor(method=method, level=level)
+    raw_size = sum(len(html.encode("utf-8")) for html in htmls)
+    compressed = [compressor.compress_text(html) for html in htmls]
+    stored_size = sum(len(c) for c in compressed)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for html in htmls:
+            compressor.compress_text(html)
+    compress_ms = (time.perf_counter() - start) * 1000 / (repeat * len(htmls))
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for data in compressed:
+            compressor.decompress_text(data)
+    decompress_ms = (time.perf_counter() - start) * 1000 / (repeat * len(htmls))
+    return raw_size, stored_size, compress_ms, decompress_ms
+
+
+async def bench_sql(htmls: list[str], method: str, level: int | None, repeat: int):
+    compressor = compression.Compressor(method=method, level=level)
+    # CompressedTextとリポジトリの両方で同じ方式を使う
+    compression.get_cache_compressor = lambda: compressor
+    sql_cache_repo.get_cache_compressor = lambda: compressor
+    with tempfile.TemporaryDirectory() as tmpdir:
+        engine = db_util.create_async_db_engine(
+            SQLParams(
+                drivername="sqlite+aiosqlite",
+                database=str(pathlib.Path(tmpdir) / "cache.db"),
+            )
+        )
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(SQLModel.metadata.create_all)
+            sessionmaker = async_sessionmaker(bind=engine)
+            count = repeat * len(htmls)
+            start = time.perf_counter()
+            async with sessionmaker() as ses:
+                repo = sql_cache_repo.SearchCacheRepository(ses)
+                for i in range(repeat):
+                    for j, html in enumerate(htmls):
+                        await repo.save(
+                            m_cache.SearchCache(
+                                domain="bench",
+                                url=f"{i}-{j}",
+                                download_type="bench",
+                                download_text=html,
+                            )
+                        )
+            save_ms = (time.perf_counter() - start) * 1000 / count
+
+            start = time.perf_counter()
+            async with sessionmaker() as ses:
+                repo = sql_cache_repo.SearchCacheRepository(ses)
+                for i in range(repeat):
+                    for j in range(len(htmls)):
+                        await repo.get(c_cmd.SearchCacheGetCommand(url=f"{i}-{j}"))
+            get_ms = (time.perf_counter() - start) * 1000 / count
+        finally:
+            await engine.dispose()
+    return save_ms, get_ms
+
+
+async def main():
+    argp = set_argparse()
+    print(f"params = {argp}")
+    htmls = [
+        p.read_text(encoding="utf-8")
+        for p in sorted(pathlib.Path(argp.data_dir).glob("*.html"))
+    ]
+    if not htmls:
+        print("html is not found")
+        return
+    methods = ["none", "gzip"]
+    if compression.is_zstd_available():
+        methods.append("zstd")
+    else:
+        print("zstd is not available")
+    for method in methods:
+        raw_size, stored_size, compress_ms, decompress_ms = bench_codec(
+            htmls, method, argp.level, argp.repeat
+        )
+        save_ms, get_ms = await bench_sql(htmls, method, argp.level, argp.repeat)
+        print(
+            f"{method:5} : size {raw_size:>9} -> {stored_size:>9}"
+            f" ({stored_size / raw_size:6.1%}),"
+            f" compress {compress_ms:6.2f}ms, decompress {decompress_ms:6.2f}ms,"
+            f" sql save {save_ms:6.2f}ms, sql get {get_ms:6.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
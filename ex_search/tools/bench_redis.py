@@ -0,0 +1,74 @@
+import time
+import asyncio
+import argparse
+
+import redis.asyncio as aredis
+
+from common.read_config import get_redis_options
+from databases.redis import util as redis_util
+from app.search_api.repository import URLDomainCacheRepository
+
+
+def set_argparse():
+    redisopts = get_redis_options()
+    parser = argparse.ArgumentParser(
+        description="起動時のURLDomainCacheRepositoryの一括削除について、"
+        "KEYSを使う従来の方式とSCANを使う方式を比較します"
+    )
+    parser.add_argument("--host", type=str, default=redisopts.host)
+    parser.add_argument("--port", type=int, default=redisopts.port)
+    parser.add_argument("--db", type=int, default=redisopts.db)
+    parser.add_argument("-k", "--keys", type=int, default=20000)
+    return parser.parse_args()
+
+
+class LegacyURLDomainCacheRepository(URLDomainCacheRepository):
+    """変更前の実装。削除にKEYSを使う"""
+
+    async def delete_all(self):
+        async with self.r.client() as client:
+            key = self._create_key("*")
+            domain_keys = await client.keys(key)
+            if domain_keys:
+                await client.delete(*domain_keys)
+
+
+async def run_delete_all(name: str, argp, repo: URLDomainCacheRepository):
+    r = aredis.Redis(host=argp.host, port=argp.port, db=argp.db)
+    try:
+        async with r.pipeline(transaction=False) as pipe:
+            for i in range(argp.keys):
+                pipe.hset(f"domain:bench{i}.example.com:data", "status", "completed")
+            await pipe.execute()
+    finally:
+        await r.aclose()
+    start = time.perf_counter()
+    await repo.delete_all()
+    elapsed = time.perf_counter() - start
+    print(f"{name:8} : delete_all {argp.keys} keys, elapsed={elapsed * 1000:.1f}ms")
+
+
+async def main():
+    argp = set_argparse()
+    print(f"params = {argp}")
+
+    pool = aredis.ConnectionPool(host=argp.host, port=argp.port, db=argp.db)
+    redis_util._connection_pool = pool
+
+    try:
+        legacy_r = aredis.Redis(host=argp.host, port=argp.port, db=argp.db)
+        try:
+            await run_delete_all(
+                "legacy", argp, LegacyURLDomainCacheRepository(r=legacy_r)
+            )
+        finally:
+            await legacy_r.aclose()
+        await run_delete_all(
+            "scan", argp, URLDomainCacheRepository(r=redis_util.get_async_redis())
+        )
+    finally:
+        await redis_util.close_redis_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+import time
+import uuid
+import asyncio
+import argparse
+import tempfile
+import pathlib
+from datetime import datetime, timezone, timedelta
+
+from sqlmodel import SQLModel
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from common.read_config import SQLiteOptions, SQLParams
+from databases.sql import util as db_util
+from databases.sql.cache.repository import SearchCacheRepository
+from databases.sql import create_table  # noqa: F401 テーブル定義の読み込み
+from domain.models.cache import cache as m_cache, command as c_cmd
+from app.activitylog.update import UpdateActivityLog
+
+
+def set_argparse():
+    parser = argparse.ArgumentParser(
+        description="検索時のDBアクセスを模した処理を並列に実行し、SQLiteの設定毎のrequests/secを計測します"
+    )
+    parser.add_argument("-n", "--requests", type=int, default=500)
+    parser.add_argument("-c", "--concurrency", type=int, default=20)
+    return parser.parse_args()
+
+
+async def _search(sessionmaker, url: str):
+    """SearchClientと同じく、ActivityLogの作成、キャッシュの参照と保存、ActivityLogの更新を行う"""
+    async with sessionmaker() as ses:
+        upactlog = UpdateActivityLog(ses=ses)
+        target_id = str(uuid.uuid4())
+        await upactlog.create(
+            target_id=target_id, target_table="bench", activity_type="bench"
+        )
+        repo = SearchCacheRepository(ses)
+        await repo.get(c_cmd.SearchCacheGetCommand(url=url))
+        await repo.save(
+            m_cache.SearchCache(
+                domain="bench",
+                url=url,
+                download_type="bench",
+                download_text="<html></html>" * 100,
+                expires=datetime.now(timezone.utc) + timedelta(minutes=5),
+            )
+        )
+        await upactlog.completed(target_id=target_id)
+
+
+async def run_bench(
+    name: str,
+    db_path: pathlib.Path,
+    options: SQLiteOptions,
+    requests: int,
+    concurrency: int,
+):
+    engine = db_util.create_async_db_engine(
+        SQLParams(drivername="sqlite+aiosqlite", database=str(db_path)),
+        sqlite_options=options,
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    sessionmaker = async_sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    semaphore = asyncio.Semaphore(concurrency)
+    errors: dict[str, int] = {}
+
+    async def _task(i: int):
+        async with semaphore:
+            try:
+                await _search(sessionmaker, url=f"https://example.com/{i % 50}")
+            except Exception as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*[_task(i) for i in range(requests)])
+        elapsed = time.perf_counter() - start
+    finally:
+        await engine.dispose()
+    print(
+        f"{name:8} : {requests / elapsed:8.1f} req/s, "
+        f"elapsed={elapsed:.2f}s, errors={errors}"
+    )
+
+
+async def main():
+    argp = set_argparse()
+    print(f"params = {argp}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        await run_bench(
+            "default",
+            pathlib.Path(tmpdir) / "default.db",
+            SQLiteOptions(enabled=False),
+            argp.requests,
+            argp.concurrency,
+        )
+        await run_bench(
+            "tuned",
+            pathlib.Path(tmpdir) / "tuned.db",
+            SQLiteOptions(),
+            argp.requests,
+            argp.concurrency,
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())